@@ -1,15 +1,144 @@
 # agent_utils.py
+import os
+import re
+import logging
+from functools import lru_cache
 
+from metrics import record_llm_usage
+from llm_scheduler import record_actual_tokens
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Context window per model; prompts never exceed this minus the reserved output
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+PROMPT_OUTPUT_RESERVE = int(os.getenv("PROMPT_OUTPUT_RESERVE", 1024))
+# Input tokens per call, sized for cost and latency rather than the context window:
+# the suggestion prompt (JD, resume and three template previews) and the resume analysis
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+ANALYSIS_PROMPT_TOKEN_BUDGET = int(os.getenv("ANALYSIS_PROMPT_TOKEN_BUDGET", 3000))
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+_SECTION_BREAK = re.compile(r"\n\s*\n")
+_ANALYSIS_FOCUS = "skills experience education employment work history degree university certifications projects"
+
+@lru_cache(maxsize=None)
 def load_agent_prompt(filepath: str = "agent_prompt.txt") -> str:
     with open(filepath, "r") as f:
         return f.read()
 
-def format_agent_prompt(jd: str, resume: str, templates: list[str]) -> str:
-    prompt_template = load_agent_prompt()
-    return prompt_template.format(
-        jd=jd,
-        resume=resume,
-        template_1=templates[0] if len(templates) > 0 else "",
-        template_2=templates[1] if len(templates) > 1 else "",
-        template_3=templates[2] if len(templates) > 2 else "",
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """Cached tiktoken encoder for a model (None if tiktoken can't load one)"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable for {model}, estimating tokens from length: {e}")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    encoder = get_encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4") -> str:
+    if max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return text[:max_tokens * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+
+def prompt_budget(model: str, max_tokens: int = PROMPT_TOKEN_BUDGET) -> int:
+    """Prompt tokens for one call: max_tokens, capped by what the model's context window allows"""
+    window = MODEL_CONTEXT_TOKENS.get(model, 8192) - PROMPT_OUTPUT_RESERVE
+    return min(window, max_tokens) if max_tokens > 0 else window
+
+def _split_sections(text: str, lines_per_block: int = 8) -> list[str]:
+    """Blank-line separated blocks; PDF text without blank lines is grouped by lines"""
+    sections = [s.strip() for s in _SECTION_BREAK.split(text) if s.strip()]
+    if len(sections) >= 4:
+        return sections
+    lines = [line for line in text.splitlines() if line.strip()]
+    return ["\n".join(lines[i:i + lines_per_block]) for i in range(0, len(lines), lines_per_block)]
+
+def fit_to_budget(text: str, max_tokens: int, model: str = "gpt-4", focus: str = "") -> str:
+    """
+    Trim text to max_tokens, keeping the sections most relevant to `focus`.
+
+    Sections (blank-line separated blocks) are ranked by how many focus words
+    they contain, kept greedily in that order, and emitted in their original
+    order. The last section that doesn't fit whole is cut at the token limit.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    sections = _split_sections(text)
+    focus_words = set(_WORD.findall(focus.lower()))
+
+    def relevance(index: int) -> tuple:
+        words = _WORD.findall(sections[index].lower())
+        hits = sum(1 for word in words if word in focus_words)
+        return (-(hits / (len(words) or 1)), index)
+
+    kept, remaining = {}, max_tokens
+    for index in sorted(range(len(sections)), key=relevance):
+        tokens = count_tokens(sections[index], model) + 1
+        if tokens <= remaining:
+            kept[index] = sections[index]
+            remaining -= tokens
+        elif remaining > 32:
+            kept[index] = truncate_tokens(sections[index], remaining - 1, model)
+            remaining = 0
+        if remaining <= 0:
+            break
+    return "\n\n".join(kept[index] for index in sorted(kept))
+
+def format_agent_prompt(jd: str, resume: str, templates: list[str], model: str = "gpt-4",
+                        filepath: str = "agent_prompt.txt", max_tokens: int = PROMPT_TOKEN_BUDGET) -> str:
+    prompt_template = load_agent_prompt(filepath)
+    values = {
+        "template_1": templates[0] if len(templates) > 0 else "",
+        "template_2": templates[1] if len(templates) > 1 else "",
+        "template_3": templates[2] if len(templates) > 2 else "",
+    }
+
+    # Whatever the fixed text and template previews leave is split between JD and resume
+    fixed = prompt_template.format(jd="", resume="", **values)
+    available = max(prompt_budget(model, max_tokens) - count_tokens(fixed, model), 0)
+    jd_tokens = count_tokens(jd, model)
+    jd_budget = min(jd_tokens, max(available * 2 // 5, available - count_tokens(resume, model)))
+    values["jd"] = fit_to_budget(jd, jd_budget, model, focus=resume)
+    values["resume"] = fit_to_budget(resume, available - count_tokens(values["jd"], model), model, focus=jd)
+
+    return prompt_template.format(**values)
+
+def format_analysis_prompt(resume: str, model: str = "gpt-4", max_tokens: int = ANALYSIS_PROMPT_TOKEN_BUDGET) -> str:
+    header = "Analyze this resume and score it on Skills, Experience, and Education:\n\n"
+    footer = "\n\nReturn JSON format."
+    available = prompt_budget(model, max_tokens) - count_tokens(header + footer, model)
+    return header + fit_to_budget(resume, available, model, focus=_ANALYSIS_FOCUS) + footer
+
+def log_token_usage(stage: str, model: str, usage):
+    """Log prompt/completion token counts reported by the API and add them to the metrics"""
+    if usage is None:
+        return
+    record_llm_usage(stage, model, usage.prompt_tokens, usage.completion_tokens)
+    record_actual_tokens(usage.prompt_tokens + usage.completion_tokens)
+    logger.info(
+        f"LLM usage [{stage}] model={model} input_tokens={usage.prompt_tokens} "
+        f"output_tokens={usage.completion_tokens}"
     )
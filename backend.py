@@ -1,23 +1,77 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, Request
+from typing import Optional
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
-from mongo_utils import get_mongodb_connection
-from functions import extract_text_from_pdf, get_gpt_analysis
-from rag_utils import search_similar_template
-from agent_utils import format_agent_prompt
-from openai import OpenAI
+from mongo_utils import ensure_indexes
+from functions import stream_gpt_analysis
+from pipeline import (
+    get_pdf_text, get_resume_analysis, store_resume, find_template_matches,
+    stream_agent_suggestion, parse_inputs, analyze_parsed, analysis_unavailable
+)
+from llm_router import StructuredOutputError
+from cache_utils import content_hash
+from job_queue import (
+    ensure_job_indexes, get_job_input_fs, enqueue_job, get_job, job_response, queue_metrics, validate_callback_url
+)
+from pdf_extraction import PDFExtractionError
+from llm_scheduler import LLMOverloadedError, get_scheduler
+from template_snapshots import watch_snapshots
+from candidate_index import index_candidate, search_candidates, candidate_filter, CANDIDATE_SEARCH_MAX_RESULTS
+from ingest import (
+    IngestedFile, RequestSizeLimitMiddleware, ingest_upload, UPLOAD_MAX_BYTES, REQUEST_OVERHEAD_BYTES
+)
+from download_utils import FileCache, gridfs_download
+from executor_utils import run_io, shutdown_pools
+from metrics import RequestTracingMiddleware, install_request_logging, observe_stage, render_metrics
+import resources
+from resources import (
+    get_mongo_client, get_db, get_fs, get_template_fs, get_content_cache, get_embedder,
+    get_async_openai_client, get_template_index, get_jd_cache, get_candidate_collection
+)
+from contextlib import asynccontextmanager
 from bson import ObjectId
 from dotenv import load_dotenv
 import os
 import io
+import json
+import time
+import asyncio
 import logging
+import zipfile
+import numpy as np
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+install_request_logging()
 
 load_dotenv()
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the shared clients once per worker process, make sure the file and
+    job queue indexes exist, swap in template snapshots as they are published,
+    and close everything on shutdown.
+    """
+    await run_io(
+        resources.warm_up,
+        get_mongo_client, get_content_cache, get_async_openai_client, get_embedder, get_template_index,
+        get_candidate_collection
+    )
+    db = get_db()
+    if db is not None:
+        await run_io(ensure_indexes, db)
+        await run_io(ensure_job_indexes, db)
+    snapshot_watcher = asyncio.create_task(watch_snapshots())
+    yield
+    snapshot_watcher.cancel()
+    await resources.aclose()
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,131 +81,438 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Two files per upload
+app.add_middleware(RequestSizeLimitMiddleware, limits={
+    "/upload/": 2 * UPLOAD_MAX_BYTES + REQUEST_OVERHEAD_BYTES,
+    "/candidates/search": UPLOAD_MAX_BYTES + REQUEST_OVERHEAD_BYTES,
+})
+# Outermost, so request ids and timings cover CORS handling and streamed bodies
+app.add_middleware(RequestTracingMiddleware)
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloadedError):
+    """The LLM queue or rate budget is full: ask the client to come back later"""
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Service busy: {exc}"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+MAX_BATCH_RESUMES = int(os.getenv("MAX_BATCH_RESUMES", 500))
+
+template_file_cache = FileCache()
+
+def format_event(event: str, data: dict, stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+async def upload_event_stream(resume: IngestedFile, resume_text: str, jd_text: str, stream_format: str):
+    """
+    Event stream for /upload/?stream=true.
+
+    Template matches are sent as soon as the vector search returns; the agent
+    suggestion and the analysis follow token by token. If the client
+    disconnects, the generator is cancelled and every stage is cancelled with
+    it, which also closes the OpenAI streams.
+    """
+    queue = asyncio.Queue()
+
+    async def store_stage():
+        resume_fs_id = await run_io(store_resume, resume)
+        await queue.put(("resume", {
+            "resume_fs_id": str(resume_fs_id),
+            "resume_download_url": f"/download_resume/{resume_fs_id}"
+        }))
+        await run_io(index_candidate, resume_fs_id, resume_text, resume.filename, resume.digest)
+
+    async def suggestion_stage():
+        top_template_matches = await find_template_matches(jd_text)
+        await queue.put(("template_matches", {"template_matches": top_template_matches}))
+        result = {}
+        async for delta in stream_agent_suggestion(jd_text, resume_text, top_template_matches, result):
+            await queue.put(("suggestion_delta", {"text": delta}))
+        await queue.put(("final_suggestion", {"final_suggestion": result["suggestion"]}))
+
+    async def analysis_stage():
+        content_cache = get_content_cache()
+        analysis = await run_io(content_cache.get, resume.digest, "analysis")
+        if not isinstance(analysis, dict):
+            result = {}
+            try:
+                async for delta in stream_gpt_analysis(resume_text, result, "upload"):
+                    await queue.put(("analysis_delta", {"text": delta}))
+                analysis = result["analysis"]
+                await run_io(content_cache.set, resume.digest, analysis=analysis)
+            except StructuredOutputError as e:
+                analysis = analysis_unavailable(e)
+        await queue.put(("analysis", {"analysis": analysis}))
+
+    async def run_stage(name, stage):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            await stage()
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Error in upload stage {name}: {e}")
+            await queue.put(("error", {"stage": name, "detail": str(e)}))
+        finally:
+            observe_stage(f"stream_{name}", time.perf_counter() - start, outcome)
+            queue.put_nowait(None)
+
+    stages = [
+        asyncio.create_task(run_stage("store", store_stage)),
+        asyncio.create_task(run_stage("suggestion", suggestion_stage)),
+        asyncio.create_task(run_stage("analysis", analysis_stage)),
+    ]
+    remaining = len(stages)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is None:
+                remaining -= 1
+                continue
+            yield format_event(*item, stream_format)
+        yield format_event("done", {}, stream_format)
+    finally:
+        for task in stages:
+            task.cancel()
+
+async def enqueue_upload(resume: IngestedFile, jd: IngestedFile, callback_url: Optional[str]) -> str:
+    """Persist both PDFs and queue an upload job; returns the job id"""
+    db = get_db()
+
+    def store_jd():
+        with jd.open() as f:
+            return get_job_input_fs(db).put(f, filename=jd.filename)
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-client, db, fs = get_mongodb_connection()
+    resume_fs_id, jd_input_id = await asyncio.gather(run_io(store_resume, resume), run_io(store_jd))
+    job_id = await run_io(
+        enqueue_job, db, resume_fs_id, jd_input_id, resume.filename, resume.content_type, resume.digest, callback_url
+    )
+    logger.info(f"Queued upload job {job_id} for {resume.filename}")
+    return job_id
+
+def close_ingested(files: list[IngestedFile]):
+    for ingested_file in files:
+        ingested_file.close()
 
 @app.post("/upload/")
 async def analyze_resume(
-    background_tasks: BackgroundTasks,
     resume: UploadFile = File(...),
-    jd: UploadFile = File(...)
+    jd: UploadFile = File(...),
+    stream: bool = False,
+    stream_format: str = "ndjson",
+    mode: str = "sync",
+    callback_url: Optional[str] = None
 ):
     """
     Analyze a resume against a job description and suggest matching templates
+
+    With ?stream=true the result is streamed as NDJSON (or Server-Sent Events
+    with stream_format=sse) instead of a single JSON document.
+
+    With ?mode=job the files are stored, a job is queued for the worker pool
+    (job_worker.py) and its id is returned right away. Poll /jobs/{job_id} for
+    the result, or pass callback_url to have it POSTed there when done.
     """
+    ingested = []
     try:
         if not resume.filename.endswith(".pdf") or not jd.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+        if mode != "job":
+            # Fail fast when the LLM queue is already full, before parsing anything
+            get_scheduler().check("upload")
+        elif callback_url:
+            try:
+                await run_io(validate_callback_url, callback_url)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
-        # Read and process files
-        resume_bytes = await resume.read()
-        jd_bytes = await jd.read()
+        # Read both files in chunks: hashed on the way in, spooled to disk when large
+        resume_file = await ingest_upload(resume)
+        ingested.append(resume_file)
+        jd_file = await ingest_upload(jd)
+        ingested.append(jd_file)
+
+        if mode == "job":
+            job_id = await enqueue_upload(resume_file, jd_file, callback_url)
+            return JSONResponse(
+                status_code=202,
+                content={"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+            )
+
+        resume_text, jd_text = await parse_inputs(resume_file, jd_file)
 
-        resume_text = extract_text_from_pdf(resume_bytes)
-        jd_text = extract_text_from_pdf(jd_bytes)
-        
         if not resume_text or not jd_text:
             raise HTTPException(status_code=400, detail="Could not extract text from one or more PDF files")
 
-        # Store resume in GridFS with metadata
-        resume_fs_id = fs.put(
-            resume_bytes,
-            filename=resume.filename,
-            metadata={
-                "source": "user_upload",
-                "original_filename": resume.filename,
-                "content_type": resume.content_type,
-                "file_size": len(resume_bytes)
+        if stream:
+            media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+            # The stream still needs the files; they are removed once it is done
+            files, ingested = ingested, []
+            return StreamingResponse(
+                upload_event_stream(resume_file, resume_text, jd_text, stream_format),
+                media_type=media_type,
+                background=BackgroundTask(close_ingested, files)
+            )
+
+        return JSONResponse(content=await analyze_parsed(resume_file, resume_text, jd_text))
+
+    except (HTTPException, LLMOverloadedError):
+        raise
+    except PDFExtractionError as e:
+        logger.warning(f"Rejected upload: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing upload: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        close_ingested(ingested)
+
+def read_pdf_archive(archive_bytes: bytes) -> list[tuple[str, bytes]]:
+    """Return (filename, bytes) for every PDF in a zip archive"""
+    with zipfile.ZipFile(io.BytesIO(archive_bytes)) as archive:
+        return [
+            (os.path.basename(info.filename), archive.read(info))
+            for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(".pdf")
+        ]
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denom if denom else 0.0
+
+async def score_resume(filename: str, resume_bytes: bytes, jd_vector: list[float],
+                       analyze: bool, semaphore: asyncio.Semaphore) -> dict:
+    """Parse, store and score one resume of a batch against the JD embedding"""
+    async with semaphore:
+        try:
+            resume = IngestedFile.from_bytes(resume_bytes, filename)
+            resume_text = await get_pdf_text(resume.source, resume.digest)
+            if not resume_text:
+                return {"filename": filename, "error": "Could not extract text from PDF"}
+
+            resume_vector, resume_fs_id = await asyncio.gather(
+                run_io(get_embedder().embed_one, resume_text, "batch"),
+                run_io(store_resume, resume)
+            )
+            await run_io(index_candidate, resume_fs_id, resume_text, filename, resume.digest, resume_vector, "batch")
+            result = {
+                "filename": filename,
+                "resume_fs_id": str(resume_fs_id),
+                "resume_download_url": f"/download_resume/{resume_fs_id}",
+                "score": round(cosine_similarity(jd_vector, resume_vector), 4)
             }
-        )
-        logger.info(f"Stored resume in GridFS with ID: {resume_fs_id}")
+            if analyze:
+                result["analysis"] = await get_resume_analysis(resume_text, resume.digest, endpoint="batch")
+            return result
+        except Exception as e:
+            logger.error(f"Error scoring resume {filename}: {e}")
+            return {"filename": filename, "error": str(e)}
 
-        # Get GPT analysis in background
-        background_tasks.add_task(get_gpt_analysis, resume_text)
+def rank_results(results: list[dict]) -> list[dict]:
+    """Sort scored resumes best-first (failures last) and number them"""
+    ranked = sorted(results, key=lambda r: ("score" not in r, -r.get("score", 0.0)))
+    for rank, result in enumerate(ranked, start=1):
+        result["rank"] = rank
+    return ranked
 
-        # Search for similar templates with improved scoring
-        top_template_matches = search_similar_template(
-            jd_text,
-            top_k=3,
-            score_threshold=float(os.getenv("SCORE_THRESHOLD", 0.7))
-        )
-        
-        if not top_template_matches:
-            logger.warning("No template matches found above threshold")
-            top_template_matches = [{
-                "template_number": 1,
-                "template_title": "No Strong Match",
-                "template_preview_text": "No strong match found, but here's the closest resume template we have.",
-                "template_file_id": None,
-                "similarity_score": 0.0,
-                "download_url": None,
-                "metadata": {"category": "General"}
-            }]
-
-        # Use agent prompt to suggest best match
-        prompt = format_agent_prompt(
-            jd_text,
-            resume_text,
-            [match["template_preview_text"] for match in top_template_matches]
-        )
+@app.post("/batch/")
+async def batch_analyze(
+    jd: UploadFile = File(...),
+    resumes: list[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(None),
+    stream: bool = False,
+    analyze: bool = False
+):
+    """
+    Rank many resumes (PDF files and/or a zip archive of PDFs) against one job description.
+
+    The JD is parsed, embedded and matched to templates once. Resumes are
+    processed with bounded parallelism. With ?stream=true the response is
+    NDJSON: one line per resume as it completes, then the final ranking.
+    """
+    try:
+        if not jd.filename.endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
-        agent_response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+        # Read everything up front; uploads are closed once the handler returns
+        jd_bytes = await jd.read()
+        items = [(resume.filename, await resume.read()) for resume in resumes if resume.filename.endswith(".pdf")]
+        if archive is not None:
+            items.extend(await run_io(read_pdf_archive, await archive.read()))
+
+        if not items:
+            raise HTTPException(status_code=400, detail="No PDF resumes provided.")
+        if len(items) > MAX_BATCH_RESUMES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_RESUMES} resumes per batch.")
+
+        jd_text = await get_pdf_text(jd_bytes, content_hash(jd_bytes))
+        if not jd_text:
+            raise HTTPException(status_code=400, detail="Could not extract text from the job description")
+
+        jd_vector, template_matches = await asyncio.gather(
+            run_io(get_embedder().embed_one, jd_text, "batch"),
+            find_template_matches(jd_text, "batch")
         )
-        final_suggestion = agent_response.choices[0].message.content
+    except (HTTPException, LLMOverloadedError):
+        raise
+    except PDFExtractionError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Job description: {e}")
+    except Exception as e:
+        logger.error(f"Error preparing batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Format response with enhanced template information
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(score_resume(filename, data, jd_vector, analyze, semaphore))
+        for filename, data in items
+    ]
+    logger.info(f"Scoring {len(tasks)} resumes against one JD (concurrency {BATCH_CONCURRENCY})")
+
+    if not stream:
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
         return JSONResponse(content={
-            "resume_fs_id": str(resume_fs_id),
-            "resume_download_url": f"/download_resume/{resume_fs_id}",
-            "analysis": get_gpt_analysis(resume_text),
-            "final_suggestion": final_suggestion,
-            "template_matches": top_template_matches
+            "template_matches": template_matches,
+            "total": len(results),
+            "results": rank_results(results)
         })
 
+    async def result_stream():
+        try:
+            yield json.dumps({"type": "jd", "template_matches": template_matches, "total": len(tasks)}) + "\n"
+            results = []
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                results.append(result)
+                yield json.dumps({"type": "result", **result}) + "\n"
+            yield json.dumps({"type": "ranking", "results": rank_results(results)}) + "\n"
+        finally:
+            # Client went away or stream finished: stop any remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+
+@app.post("/candidates/search")
+async def candidates_search(
+    jd: Optional[UploadFile] = File(None),
+    jd_text: Optional[str] = Form(None),
+    limit: int = 10,
+    offset: int = 0,
+    category: Optional[list[str]] = Query(None),
+    uploaded_after: Optional[date] = None,
+    uploaded_before: Optional[date] = None
+):
+    """
+    Find uploaded resumes that match a job description (a PDF or plain text).
+
+    Results are ranked by similarity and paged with limit/offset; follow
+    next_offset until it is null. Filter by template category (repeatable)
+    and by upload date (uploaded_after/uploaded_before, inclusive, UTC).
+    """
+    if jd is None and not jd_text:
+        raise HTTPException(status_code=400, detail="Provide a job description as a PDF (jd) or as text (jd_text).")
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-100 and offset non-negative.")
+    if offset + limit > CANDIDATE_SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"offset + limit may not exceed {CANDIDATE_SEARCH_MAX_RESULTS}.")
+
+    where = candidate_filter(
+        day_start(uploaded_after) if uploaded_after else None,
+        day_start(uploaded_before + timedelta(days=1)) if uploaded_before else None,
+        category
+    )
+    jd_file = None
+    try:
+        if jd is not None:
+            if not jd.filename.endswith(".pdf"):
+                raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+            jd_file = await ingest_upload(jd)
+            jd_text = await get_pdf_text(jd_file.source, jd_file.digest)
+            if not jd_text:
+                raise HTTPException(status_code=400, detail="Could not extract text from the job description")
+        return await run_io(search_candidates, jd_text, limit, offset, where)
+    except (HTTPException, LLMOverloadedError):
+        raise
+    except PDFExtractionError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Job description: {e}")
     except Exception as e:
-        logger.error(f"Error processing upload: {e}")
+        logger.error(f"Error searching candidates: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if jd_file is not None:
+            jd_file.close()
 
 @app.get("/download_resume/{file_id}")
-async def download_resume(file_id: str):
+async def download_resume(file_id: str, request: Request):
     """
-    Download a resume by its GridFS ID
+    Download a resume by its GridFS ID (supports Range and conditional GET)
     """
-    try:
-        file = fs.get(ObjectId(file_id))
-        return StreamingResponse(
-            file,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={file.filename}",
-                "Content-Type": "application/pdf"
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error downloading resume {file_id}: {e}")
-        raise HTTPException(status_code=404, detail=f"Resume not found: {str(e)}")
+    return await gridfs_download(request, get_fs(), file_id)
 
 @app.get("/download_template_by_id/{template_file_id}")
-async def download_template_by_id(template_file_id: str):
+async def download_template_by_id(template_file_id: str, request: Request):
     """
-    Download a template by its GridFS ID
+    Download a template by its GridFS ID (supports Range and conditional GET).
+    Templates are downloaded far more often than they change, so hot ones
+    are served from an in-memory LRU.
     """
-    try:
-        file = fs.get(ObjectId(template_file_id))
-        return StreamingResponse(
-            file,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={file.filename}",
-                "Content-Type": "application/pdf"
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error downloading template {template_file_id}: {e}")
-        raise HTTPException(status_code=404, detail=f"Template not found: {str(e)}")
+    return await gridfs_download(request, get_template_fs(), template_file_id, cache=template_file_cache)
+
+@app.get("/jobs/metrics")
+async def jobs_metrics():
+    """
+    Queue depth, oldest queued job age and per-stage latency of recent jobs
+    """
+    return await run_io(queue_metrics, get_db())
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    Status of a queued upload job, with its result once it has succeeded
+    """
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = await run_io(get_job, get_db(), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: request and per-stage latency histograms, LLM call,
+    token and cost counters
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters for the content-addressed PDF cache, the template file
+    cache and the near-duplicate JD cache
+    """
+    return {
+        **get_content_cache().stats(),
+        "template_files": template_file_cache.stats(),
+        "jd_results": get_jd_cache().stats()
+    }
 
 @app.get("/health")
 async def health_check():
@@ -160,8 +521,13 @@ async def health_check():
     """
     try:
         # Test MongoDB connection
-        client.admin.command('ping')
-        return {"status": "healthy", "mongodb": "connected"}
+        await run_io(get_mongo_client().admin.command, 'ping')
+        return {
+            "status": "healthy",
+            "mongodb": "connected",
+            # None while the legacy in-place index is served
+            "template_index_version": get_template_index().version
+        }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
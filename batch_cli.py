@@ -0,0 +1,76 @@
+import argparse
+import json
+import logging
+import os
+import httpx
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def collect_resumes(paths: list[str]) -> list[str]:
+    """Expand directories into the PDFs they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(".pdf")
+            )
+        else:
+            files.append(path)
+    return files
+
+def run_batch(url: str, jd_path: str, resume_paths: list[str], archive_path: str = None,
+              analyze: bool = False, output: str = None):
+    """Send one JD and many resumes to /batch/ and print results as they stream in"""
+    handles = []
+    try:
+        jd_handle = open(jd_path, "rb")
+        handles.append(jd_handle)
+        files = [("jd", (os.path.basename(jd_path), jd_handle, "application/pdf"))]
+        for path in resume_paths:
+            handle = open(path, "rb")
+            handles.append(handle)
+            files.append(("resumes", (os.path.basename(path), handle, "application/pdf")))
+        if archive_path:
+            handle = open(archive_path, "rb")
+            handles.append(handle)
+            files.append(("archive", (os.path.basename(archive_path), handle, "application/zip")))
+
+        params = {"stream": "true", "analyze": str(analyze).lower()}
+        ranking = []
+        with httpx.stream("POST", url, files=files, params=params, timeout=None) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "result":
+                    if "error" in event:
+                        logger.warning(f"{event['filename']}: {event['error']}")
+                    else:
+                        logger.info(f"{event['filename']}: score {event['score']}")
+                elif event["type"] == "ranking":
+                    ranking = event["results"]
+
+        for result in ranking:
+            print(f"{result['rank']:>4}  {result.get('score', '-')!s:>7}  {result['filename']}")
+        if output:
+            with open(output, "w") as f:
+                json.dump(ranking, f, indent=2)
+        return ranking
+    finally:
+        for handle in handles:
+            handle.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank many resumes against one job description")
+    parser.add_argument("jd", help="Job description PDF")
+    parser.add_argument("resumes", nargs="*", help="Resume PDFs or directories of PDFs")
+    parser.add_argument("--archive", help="Zip archive of resume PDFs")
+    parser.add_argument("--url", default="http://localhost:8000/batch/")
+    parser.add_argument("--analyze", action="store_true", help="Also run the GPT analysis per resume")
+    parser.add_argument("--output", help="Write the final ranking to this JSON file")
+    args = parser.parse_args()
+    run_batch(args.url, args.jd, collect_resumes(args.resumes), args.archive, args.analyze, args.output)
@@ -0,0 +1,55 @@
+import argparse
+import logging
+import os
+import time
+import httpx
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def bench_sequential_uploads(base_url: str, jd_bytes: bytes, resumes: list[tuple[str, bytes]]) -> float:
+    """N sequential /upload/ calls, one per resume"""
+    start = time.perf_counter()
+    with httpx.Client(timeout=None) as client:
+        for filename, data in resumes:
+            client.post(f"{base_url}/upload/", files={
+                "resume": (filename, data, "application/pdf"),
+                "jd": ("jd.pdf", jd_bytes, "application/pdf"),
+            }).raise_for_status()
+    return time.perf_counter() - start
+
+def bench_batch(base_url: str, jd_bytes: bytes, resumes: list[tuple[str, bytes]], analyze: bool) -> float:
+    """A single /batch/ call with every resume"""
+    files = [("jd", ("jd.pdf", jd_bytes, "application/pdf"))]
+    files.extend(("resumes", (filename, data, "application/pdf")) for filename, data in resumes)
+    start = time.perf_counter()
+    with httpx.Client(timeout=None) as client:
+        client.post(f"{base_url}/batch/", files=files, params={"analyze": str(analyze).lower()}).raise_for_status()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare /batch/ throughput with sequential /upload/ calls")
+    parser.add_argument("jd", help="Job description PDF")
+    parser.add_argument("resume_dir", help="Directory of resume PDFs")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--limit", type=int, default=20, help="Number of resumes to use")
+    parser.add_argument("--analyze", action="store_true", help="Include GPT analysis in /batch/ (closer to /upload/ work)")
+    args = parser.parse_args()
+
+    with open(args.jd, "rb") as f:
+        jd_bytes = f.read()
+    names = sorted(n for n in os.listdir(args.resume_dir) if n.lower().endswith(".pdf"))[:args.limit]
+    resumes = []
+    for name in names:
+        with open(os.path.join(args.resume_dir, name), "rb") as f:
+            resumes.append((name, f.read()))
+
+    sequential = bench_sequential_uploads(args.base_url, jd_bytes, resumes)
+    batch = bench_batch(args.base_url, jd_bytes, resumes, args.analyze)
+    logger.info(f"Sequential /upload/: {sequential:.2f}s ({len(resumes) / sequential:.2f} resumes/sec)")
+    logger.info(f"Single /batch/:      {batch:.2f}s ({len(resumes) / batch:.2f} resumes/sec)")
+    logger.info(f"Speedup: {sequential / batch:.1f}x")
+
+if __name__ == "__main__":
+    main()
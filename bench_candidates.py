@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATEGORIES = 8
+
+def synthetic_resumes(count: int, dim: int, clusters: int, seed: int = 0):
+    """Unit vectors around cluster centers (resumes bunch up by role), plus a category per vector"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    assignment = rng.integers(0, clusters, size=count)
+    vectors = centers[assignment] + 0.6 * rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, assignment % CATEGORIES, centers
+
+def synthetic_queries(centers: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = centers[rng.integers(0, len(centers), size=count)]
+    queries = queries + 0.8 * rng.standard_normal(queries.shape, dtype=np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, top_k: int, mask: np.ndarray = None) -> list[set]:
+    """Ground truth by brute force (cosine on unit vectors); timed as the exact baseline"""
+    truth = []
+    for query in queries:
+        scores = vectors @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        truth.append({int(row) for row in top})
+    return truth
+
+def build_collection(path: str, vectors: np.ndarray, categories: np.ndarray, m: int, ef_construction: int):
+    import vector_store
+    collection = vector_store.get_chroma_client(path).get_or_create_collection(
+        name="bench_candidates",
+        embedding_function=None,
+        configuration={"hnsw": {"space": "cosine", "max_neighbors": m, "ef_construction": ef_construction}}
+    )
+    for start in range(0, len(vectors), 5000):
+        stop = min(start + 5000, len(vectors))
+        collection.add(
+            ids=[str(row) for row in range(start, stop)],
+            embeddings=vectors[start:stop],
+            metadatas=[{"category": int(categories[row])} for row in range(start, stop)]
+        )
+    return collection
+
+def measure(collection, queries: np.ndarray, truth: list[set], top_k: int, where: dict = None) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=[], where=where)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {int(doc_id) for doc_id in result["ids"][0]})
+    latencies = np.array(latencies)
+    return {
+        "recall": round(hits / (len(truth) * top_k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+def measure_saved(scratch: str, ef_search: int, top_k: int) -> dict:
+    """Open the saved index in this (fresh) process with ef_search applied before it loads"""
+    import vector_store
+    collection = vector_store.get_chroma_client(scratch).get_collection("bench_candidates")
+    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    queries = np.load(os.path.join(scratch, "queries.npy"))
+    with open(os.path.join(scratch, "truth.json")) as f:
+        truth = json.load(f)
+    return {
+        "plain": measure(collection, queries, [set(rows) for rows in truth["plain"]], top_k),
+        "filtered": measure(collection, queries, [set(rows) for rows in truth["filtered"]], top_k,
+                            where={"category": 0}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of the candidate (uploaded resume) HNSW index")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384, help="Use 1536 to match text-embedding-3-small")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=32, help="HNSW max_neighbors")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", default="16,32,64,96,128,256")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_saved(args.measure, int(args.ef_search), args.top_k)))
+        return
+
+    vectors, categories, centers = synthetic_resumes(args.vectors, args.dim, args.clusters)
+    queries = synthetic_queries(centers, args.queries)
+
+    start = time.perf_counter()
+    truth = exact_neighbors(vectors, queries, args.top_k)
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+    filtered_truth = exact_neighbors(vectors, queries, args.top_k, mask=categories == 0)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        start = time.perf_counter()
+        build_collection(scratch, vectors, categories, args.m, args.ef_construction)
+        logger.info(
+            f"Built HNSW index: {args.vectors} x {args.dim}, M={args.m}, ef_construction={args.ef_construction} "
+            f"in {time.perf_counter() - start:.1f}s; exact NumPy search takes {exact_ms:.2f}ms per query"
+        )
+        np.save(os.path.join(scratch, "queries.npy"), queries)
+        with open(os.path.join(scratch, "truth.json"), "w") as f:
+            json.dump({"plain": [sorted(rows) for rows in truth],
+                       "filtered": [sorted(rows) for rows in filtered_truth]}, f)
+
+        # ef_search is read when a process loads the index, so each setting gets a fresh interpreter
+        for ef_search in [int(x) for x in args.ef_search.split(",") if x]:
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", scratch, "--ef-search", str(ef_search),
+                 "--top-k", str(args.top_k)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            plain, filtered = result["plain"], result["filtered"]
+            logger.info(
+                f"ef_search={ef_search:>4}: recall@{args.top_k}={plain['recall']} "
+                f"p50={plain['p50_ms']}ms p95={plain['p95_ms']}ms | "
+                f"1/{CATEGORIES} category filter: recall={filtered['recall']} "
+                f"p50={filtered['p50_ms']}ms p95={filtered['p95_ms']}ms"
+            )
+
+if __name__ == "__main__":
+    main()
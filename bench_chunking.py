@@ -0,0 +1,123 @@
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROLES = {
+    "backend": "python django flask postgres redis api microservices kafka",
+    "frontend": "react typescript css html redux webpack accessibility figma",
+    "data": "sql spark airflow pandas dbt warehouse etl tableau",
+    "ml": "pytorch tensorflow models training inference features mlops nlp",
+    "devops": "kubernetes terraform aws docker ci/cd monitoring prometheus linux",
+    "mobile": "swift kotlin ios android flutter xcode gradle firebase",
+}
+BOILERPLATE = ("references available on request curriculum vitae contact email phone address "
+               "linkedin hobbies reading travel volunteering languages english").split()
+
+def synthetic_template(role: str, rng: random.Random) -> str:
+    """
+    A template with one short role-specific skills section and long generic
+    sections; the experience section also mentions other roles' tools.
+    """
+    skills = ROLES[role].split()
+    other_tools = [word for other, words in ROLES.items() if other != role for word in words.split()]
+    filler = lambda n: " ".join(rng.choice(BOILERPLATE) for _ in range(n))
+    return "\n".join([
+        "Jane Doe", filler(30),
+        "SUMMARY", filler(120),
+        "SKILLS", " ".join(rng.choice(skills) for _ in range(25)),
+        "EXPERIENCE", filler(400) + " " + " ".join(rng.choice(other_tools) for _ in range(40)),
+        "EDUCATION", filler(80),
+    ])
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def run_mode(mode: str, templates: list[tuple[str, str]], queries: list[tuple[str, str]], scratch: str) -> dict:
+    import resources
+    import rag_utils
+    from embedding_utils import HashingEmbedder
+    from vector_store import NumpyVectorStore
+    from lexical_index import rebuild_lexical_index, LEXICAL_INDEX_PATH
+    from template_chunks import chunk_template
+    from template_snapshots import TemplateIndex
+
+    store = NumpyVectorStore(path=scratch, name=f"bench_{mode}")
+    resources.replace("template_index", TemplateIndex(store, LEXICAL_INDEX_PATH))
+    embedder = HashingEmbedder()
+
+    ids, documents, metadatas = [], [], []
+    for number, (role, text) in enumerate(templates):
+        file_id = f"t{number}"
+        metadata = {"title": f"{role} template {number}", "role": role}
+        if mode == "chunked":
+            chunk_ids, chunk_docs, chunk_metadatas = chunk_template(file_id, text, metadata)
+        else:
+            chunk_ids, chunk_docs, chunk_metadatas = [file_id], [text], [{**metadata, "file_id": file_id}]
+        ids += chunk_ids
+        documents += chunk_docs
+        metadatas += chunk_metadatas
+
+    start = time.perf_counter()
+    store.upsert(ids=ids, embeddings=embedder.embed(documents), documents=documents, metadatas=metadatas)
+    rebuild_lexical_index(store)
+    build_s = time.perf_counter() - start
+
+    # Embed the queries up front so both modes time retrieval, not the embedding batch window
+    resources.get_embedder().embed([query for _, query in queries])
+    latencies, correct = [], 0
+    for role, query in queries:
+        start = time.perf_counter()
+        matches = rag_utils.search_similar_template(query, top_k=3, score_threshold=0.0)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += matches[0]["template_title"].startswith(role)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "vectors": store.count(),
+        "index_kb": round(_dir_bytes(store.directory) / 1024, 1),
+        "build_s": round(build_s, 3),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "top1_accuracy": round(correct / len(queries), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Index size, latency and accuracy: whole-document vs section-chunked templates")
+    parser.add_argument("--templates", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Keep the benchmark's embedding cache and lexical index out of the working tree
+        os.environ["EMBEDDING_BACKEND"] = "local"
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(scratch, "embedding_cache")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(scratch, "lexical_index.npz")
+        logging.getLogger("rag_utils").setLevel(logging.WARNING)
+        logging.getLogger("lexical_index").setLevel(logging.WARNING)
+
+        rng = random.Random(0)
+        roles = list(ROLES)
+        templates = [(roles[i % len(roles)], synthetic_template(roles[i % len(roles)], rng)) for i in range(args.templates)]
+        queries = []
+        for _ in range(args.queries):
+            role = rng.choice(roles)
+            queries.append((role, "We are hiring. " + " ".join(rng.sample(ROLES[role].split(), 4))))
+
+        for mode in ("whole", "chunked"):
+            result = run_mode(mode, templates, queries, scratch)
+            logger.info(
+                f"{result['mode']:>7}: {result['vectors']} vectors, {result['index_kb']}KB, build {result['build_s']}s, "
+                f"query p50 {result['p50_ms']}ms / p95 {result['p95_ms']}ms, top-1 accuracy {result['top1_accuracy']}"
+            )
+
+if __name__ == "__main__":
+    main()
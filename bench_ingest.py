@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+import logging
+
+from starlette.datastructures import UploadFile
+
+from ingest import ingest_upload
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_upload(payload_path: str, filename: str) -> UploadFile:
+    """An UploadFile over a file on disk, like Starlette's spooled uploads past 1MB"""
+    return UploadFile(open(payload_path, "rb"), filename=filename, size=os.path.getsize(payload_path))
+
+async def read_whole(upload: UploadFile) -> int:
+    data = await upload.read()
+    return len(data)
+
+async def read_streaming(upload: UploadFile) -> int:
+    ingested = await ingest_upload(upload, max_bytes=float("inf"))
+    try:
+        return ingested.size
+    finally:
+        ingested.close()
+
+async def run_case(reader, payload_path: str, concurrency: int) -> dict:
+    """Peak Python heap while `concurrency` uploads of the payload are read at once"""
+    uploads = [make_upload(payload_path, f"resume_{i}.pdf") for i in range(concurrency)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(reader(upload) for upload in uploads))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for upload in uploads:
+            await upload.close()
+    return {"seconds": round(elapsed, 4), "peak_mb": round(peak / 1024 / 1024, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of whole-file reads vs streaming ingestion of uploads")
+    parser.add_argument("--sizes-mb", default="1,5,20", help="Comma-separated upload sizes in MB")
+    parser.add_argument("--levels", default="1,8,32", help="Comma-separated concurrency levels")
+    args = parser.parse_args()
+    # One spool line per upload would drown the results
+    logging.getLogger("ingest").setLevel(logging.WARNING)
+
+    for size_mb in [float(x) for x in args.sizes_mb.split(",") if x]:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(os.urandom(int(size_mb * 1024 * 1024)))
+            payload_path = f.name
+        try:
+            for level in [int(x) for x in args.levels.split(",") if x]:
+                whole = asyncio.run(run_case(read_whole, payload_path, level))
+                streaming = asyncio.run(run_case(read_streaming, payload_path, level))
+                logger.info(
+                    f"size={size_mb}MB concurrency={level:>3} "
+                    f"read(): peak={whole['peak_mb']}MB {whole['seconds']}s | "
+                    f"ingest_upload: peak={streaming['peak_mb']}MB {streaming['seconds']}s"
+                )
+        finally:
+            os.remove(payload_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import random
+import time
+
+import pdf_extraction
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "python java aws docker kubernetes led team built designed pipeline customers revenue "
+    "university degree experience skills project managed improved latency deployed services"
+).split()
+
+def synthetic_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """A text PDF of `pages` pages filled with resume-like words"""
+    import fitz  # PyMuPDF
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        for line in range(lines_per_page):
+            page.insert_text((48, 48 + line * 16), " ".join(rng.choice(WORDS) for _ in range(12)), fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def load_corpus(corpus_dir: str, page_counts: list[int]) -> list[bytes]:
+    if corpus_dir:
+        return [open(path, "rb").read() for path in sorted(glob.glob(os.path.join(corpus_dir, "*.pdf")))]
+    return [synthetic_pdf(pages, seed=i) for i, pages in enumerate(page_counts)]
+
+def bench_sequential(engine: str, corpus: list[bytes], max_pages: int) -> tuple[int, float]:
+    pages = 0
+    start = time.perf_counter()
+    for pdf_bytes in corpus:
+        pages += sum(1 for _ in pdf_extraction.iter_pages(pdf_bytes, engine, max_pages=max_pages, max_seconds=0))
+    return pages, time.perf_counter() - start
+
+async def bench_parallel(engine: str, corpus: list[bytes], max_pages: int) -> tuple[int, float]:
+    from executor_utils import run_cpu, shutdown_pools
+    # Start the pool before timing
+    await run_cpu(pdf_extraction.get_engine, engine)
+    pages = 0
+    start = time.perf_counter()
+    for pdf_bytes in corpus:
+        text = await pdf_extraction.extract_text_async(pdf_bytes, engine, max_pages=max_pages, max_seconds=600)
+        pages += min(pdf_extraction.get_engine(engine).page_count(pdf_bytes), max_pages)
+        assert text
+    elapsed = time.perf_counter() - start
+    shutdown_pools()
+    return pages, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages/sec per PDF engine, sequential and parallel")
+    parser.add_argument("--corpus", help="Directory of PDFs (default: synthetic documents)")
+    parser.add_argument("--pages", default="1,2,3,40,120", help="Page counts of the synthetic documents")
+    parser.add_argument("--engines", default="pymupdf,pdfminer")
+    parser.add_argument("--max-pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, [int(p) for p in args.pages.split(",")])
+    logger.info(f"Corpus: {len(corpus)} documents, {sum(len(d) for d in corpus) / 1e6:.1f}MB")
+
+    for engine in args.engines.split(","):
+        pages, elapsed = bench_sequential(engine, corpus, args.max_pages)
+        logger.info(f"{engine:>9} sequential: {pages} pages in {elapsed:.2f}s ({pages / elapsed:.0f} pages/s)")
+        pages, elapsed = asyncio.run(bench_parallel(engine, corpus, args.max_pages))
+        logger.info(f"{engine:>9}   parallel: {pages} pages in {elapsed:.2f}s ({pages / elapsed:.0f} pages/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _rss_mb() -> float:
+    """Current resident set size (Linux), falling back to the peak"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def measure_once() -> dict:
+    """Import the API and run its lifespan startup in this (fresh) interpreter"""
+    baseline_rss = _rss_mb()
+    start = time.perf_counter()
+    import backend
+    import resources
+    import_s = time.perf_counter() - start
+    import_rss = _rss_mb()
+    created_on_import = resources.initialized()
+
+    async def startup():
+        async with backend.app.router.lifespan_context(backend.app):
+            return time.perf_counter()
+
+    start = time.perf_counter()
+    ready = asyncio.run(startup())
+    startup_s = ready - start
+
+    return {
+        "import_s": round(import_s, 3),
+        "startup_s": round(startup_s, 3),
+        "import_rss_mb": round(import_rss - baseline_rss, 1),
+        "worker_rss_mb": round(_rss_mb(), 1),
+        "created_on_import": created_on_import,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import/startup time and per-worker memory")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to measure")
+    parser.add_argument("--once", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.once:
+        print(json.dumps(measure_once()))
+        return
+
+    # Every run is a fresh interpreter, like a newly started uvicorn worker
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, __file__, "--once"], capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for key in ("import_s", "startup_s", "import_rss_mb", "worker_rss_mb"):
+        values = [r[key] for r in results]
+        logger.info(f"{key:>14}: median {statistics.median(values)}, min {min(values)}, max {max(values)}")
+    logger.info(f"Resources created at import time: {results[0]['created_on_import'] or 'none'}")
+
+if __name__ == "__main__":
+    main()
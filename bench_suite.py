@@ -0,0 +1,321 @@
+"""
+End-to-end benchmarks and load tests that need neither MongoDB nor OpenAI.
+
+    python bench_suite.py micro                  # PDF extraction, template search, prompt building, JD cache
+    python bench_suite.py load --levels 1,4,16   # concurrent /upload/ against a local server with stand-ins
+    python bench_suite.py load --url http://host:8000/upload/   # or against a running deployment
+
+Stand-ins: synthetic resume, JD and template PDFs; MemoryGridFS in place of
+MongoDB (so the content cache is memory-only and job mode is unavailable);
+the deterministic hashing embedder; and fake_llm_server.py with
+--llm-latency-ms per completion. Results can be saved with --output, and
+--baseline compares the p95s with a saved run and exits with status 1 when
+any of them regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime, timezone
+
+import httpx
+from bson import ObjectId
+
+from bench_chunking import ROLES, synthetic_template
+from bench_upload import run_level, latency_summary, format_level
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LINES_PER_PAGE = 48
+
+def text_pdf(text: str) -> bytes:
+    """Render text to a PDF, wrapping long lines and starting new pages as needed"""
+    import fitz  # PyMuPDF
+    lines = [wrapped for line in text.splitlines() for wrapped in (textwrap.wrap(line, 95) or [""])]
+    doc = fitz.open()
+    for start in range(0, len(lines), LINES_PER_PAGE):
+        page = doc.new_page()
+        for number, line in enumerate(lines[start:start + LINES_PER_PAGE]):
+            page.insert_text((48, 48 + number * 15), line, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def synthetic_resume(role: str, seed: int) -> bytes:
+    return text_pdf(synthetic_template(role, random.Random(seed)))
+
+def synthetic_jd(role: str, seed: int) -> bytes:
+    rng = random.Random(seed)
+    skills = ROLES[role].split()
+    return text_pdf("\n".join([
+        f"Senior {role} engineer",
+        "We are hiring an engineer to join a growing team.",
+        "Requirements: " + ", ".join(rng.sample(skills, 5)),
+        "Nice to have: " + ", ".join(rng.sample(skills, 2)),
+    ]))
+
+class MemoryGridFS:
+    """The subset of gridfs.GridFS the upload path uses, kept in a dict"""
+
+    def __init__(self):
+        self._files = {}
+
+    def put(self, data, filename: str = None, metadata: dict = None, **kwargs) -> ObjectId:
+        # Like GridFS, accept bytes or a file object (store_resume passes the spooled upload)
+        if hasattr(data, "read"):
+            data = data.read()
+        file_id = ObjectId()
+        self._files[file_id] = (bytes(data), filename, metadata or {}, datetime.now(timezone.utc))
+        return file_id
+
+    def get(self, file_id):
+        data, filename, metadata, uploaded = self._files[ObjectId(file_id)]
+        stored = io.BytesIO(data)
+        stored._id, stored.filename, stored.metadata = ObjectId(file_id), filename, metadata
+        stored.length, stored.upload_date = len(data), uploaded
+        return stored
+
+    def exists(self, file_id) -> bool:
+        return ObjectId(file_id) in self._files
+
+    def delete(self, file_id):
+        self._files.pop(ObjectId(file_id), None)
+
+def configure_environment(scratch: str, openai_base_url: str = None):
+    """Point every on-disk index and cache at scratch; call before importing app modules"""
+    os.environ["EMBEDDING_BACKEND"] = "local"
+    os.environ["VECTOR_BACKEND"] = "numpy"
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(scratch, "vector_index")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(scratch, "embedding_cache")
+    os.environ["LEXICAL_INDEX_PATH"] = os.path.join(scratch, "lexical_index.npz")
+    os.environ["TEMPLATE_SNAPSHOT_ROOT"] = os.path.join(scratch, "template_snapshots")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    if openai_base_url:
+        os.environ["OPENAI_BASE_URL"] = openai_base_url
+
+def install_stand_ins(templates: int = 60) -> int:
+    """Swap MongoDB for MemoryGridFS and index synthetic templates; returns the chunk count"""
+    import resources
+    from lexical_index import rebuild_lexical_index
+    from template_chunks import chunk_template
+
+    resources.replace("mongo", (None, None, MemoryGridFS()))
+    store = resources.get_template_collection()
+    roles = list(ROLES)
+    ids, documents, metadatas = [], [], []
+    for number in range(templates):
+        role = roles[number % len(roles)]
+        file_id = str(ObjectId())
+        metadata = {"title": f"{role} template {number}", "filename": f"{role}_{number}.pdf", "category": role}
+        chunk_ids, chunk_docs, chunk_metadatas = chunk_template(
+            file_id, synthetic_template(role, random.Random(number)), metadata
+        )
+        ids += chunk_ids
+        documents += chunk_docs
+        metadatas += chunk_metadatas
+    store.upsert(ids=ids, embeddings=resources.get_embedder().embed(documents), documents=documents, metadatas=metadatas)
+    rebuild_lexical_index(store)
+    return len(ids)
+
+def time_calls(func, inputs: list, repeat: int) -> dict:
+    """Call func on each input `repeat` times (after one warm-up pass) and summarize the latencies"""
+    for value in inputs:
+        func(value)
+    latencies = []
+    for _ in range(repeat):
+        for value in inputs:
+            start = time.perf_counter()
+            func(value)
+            latencies.append(time.perf_counter() - start)
+    return {"calls": len(latencies), "ops_per_sec": round(len(latencies) / sum(latencies), 1),
+            **latency_summary(latencies)}
+
+def run_micro(args) -> dict:
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(scratch)
+        for name in ("rag_utils", "lexical_index", "resources", "vector_store", "agent_utils"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        from functions import extract_text_from_pdf
+        from rag_utils import search_similar_template
+        from agent_utils import format_agent_prompt
+        import jd_cache
+
+        chunks = install_stand_ins(args.templates)
+        logger.info(f"Indexed {args.templates} synthetic templates ({chunks} chunks)")
+
+        roles = list(ROLES)
+        resumes = [synthetic_resume(roles[i % len(roles)], 1000 + i) for i in range(args.corpus)]
+        resume_texts = [extract_text_from_pdf(pdf) for pdf in resumes]
+        jd_texts = [extract_text_from_pdf(synthetic_jd(roles[i % len(roles)], 2000 + i)) for i in range(args.corpus)]
+        previews = [match["template_preview_text"] for match in search_similar_template(jd_texts[0], top_k=3)]
+        jd_results = jd_cache.JDResultCache(enabled=True)
+        for jd in jd_texts:
+            jd_results.store(jd, [])
+        reposts = [f"{jd}\nPosted {2000 + i}-01-01" for i, jd in enumerate(jd_texts)]
+
+        def lookup_repost(jd: str):
+            # Time the fingerprint too, not just the per-request memo of it
+            jd_cache.fingerprint.cache_clear()
+            assert jd_results.lookup(jd) is not None
+
+        results = {
+            "extract_text_from_pdf": time_calls(extract_text_from_pdf, resumes, args.repeat),
+            "search_similar_template": time_calls(
+                lambda jd: search_similar_template(jd, top_k=3, score_threshold=0.0), jd_texts, args.repeat
+            ),
+            "format_agent_prompt": time_calls(
+                lambda pair: format_agent_prompt(pair[0], pair[1], previews, model="gpt-4o"),
+                list(zip(jd_texts, resume_texts)), args.repeat
+            ),
+            "jd_cache_lookup": time_calls(lookup_repost, reposts, args.repeat),
+        }
+    for name, result in results.items():
+        logger.info(
+            f"{name:>24}: {result['ops_per_sec']} ops/s p50={result['p50_ms']}ms "
+            f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms"
+        )
+    return results
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def run_serve(args):
+    """The API with stand-ins, on one port; started by `load` in a subprocess"""
+    import uvicorn
+    scratch = tempfile.mkdtemp(prefix="bench_suite_")
+    configure_environment(scratch, args.openai_url)
+    install_stand_ins(args.templates)
+    # Per-request INFO lines would interleave with the load test's report
+    logging.getLogger().setLevel(logging.WARNING)
+    import backend
+    uvicorn.run(backend.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def run_load(args) -> list[dict]:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    processes = []
+    url = args.url
+    try:
+        if url is None:
+            llm_port, api_port = _free_port(), _free_port()
+            llm_env = {**os.environ,
+                       "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+                       "FAKE_LLM_TOKEN_LATENCY_MS": str(args.token_latency_ms)}
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "fake_llm_server:app", "--port", str(llm_port), "--log-level", "warning"],
+                env=llm_env
+            ))
+            _wait_until_up(f"http://127.0.0.1:{llm_port}/stats", processes[-1])
+            processes.append(subprocess.Popen([
+                sys.executable, __file__, "serve", "--port", str(api_port),
+                "--openai-url", f"http://127.0.0.1:{llm_port}/v1", "--templates", str(args.templates)
+            ]))
+            _wait_until_up(f"http://127.0.0.1:{api_port}/metrics", processes[-1])
+            url = f"http://127.0.0.1:{api_port}/upload/"
+            logger.info(f"Local API with stand-ins at {url} (LLM latency {args.llm_latency_ms}ms)")
+
+        roles = list(ROLES)
+        jd_bytes = synthetic_jd("backend", 0)
+        results = []
+        for level in [int(x) for x in args.levels.split(",") if x]:
+            # Fresh resumes per level, so the content cache doesn't skip parsing and analysis
+            resumes = [synthetic_resume(roles[i % len(roles)], level * 100000 + i) for i in range(args.requests_per_level)]
+            result = asyncio.run(run_level(url, resumes, jd_bytes, level, args.requests_per_level))
+            logger.info(format_level(result))
+            results.append(result)
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+def find_regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """p95s in current that are more than `tolerance` (a fraction) above baseline"""
+    regressions = []
+    for name, result in current.get("micro", {}).items():
+        before = baseline.get("micro", {}).get(name)
+        if before and before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+    previous_levels = {level["concurrency"]: level for level in baseline.get("load", [])}
+    for level in current.get("load", []):
+        before = previous_levels.get(level["concurrency"])
+        if before and before["p95_ms"] and level["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"/upload/ at concurrency {level['concurrency']}: p95 {before['p95_ms']}ms -> {level['p95_ms']}ms"
+            )
+        if before and level["errors"] > before["errors"]:
+            regressions.append(f"/upload/ at concurrency {level['concurrency']}: {level['errors']} errors")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks and /upload/ load tests with local stand-ins")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    micro = sub.add_parser("micro", help="PDF extraction, template search and prompt building")
+    micro.add_argument("--corpus", type=int, default=24, help="Synthetic resumes and JDs")
+    micro.add_argument("--repeat", type=int, default=5)
+
+    load = sub.add_parser("load", help="Concurrent /upload/ requests")
+    load.add_argument("--url", help="Upload URL of a running server (default: start one with stand-ins)")
+    load.add_argument("--levels", default="1,4,16", help="Comma-separated concurrency levels")
+    load.add_argument("--requests-per-level", type=int, default=48)
+    load.add_argument("--llm-latency-ms", type=float, default=200)
+    load.add_argument("--token-latency-ms", type=float, default=5)
+
+    serve = sub.add_parser("serve", help=argparse.SUPPRESS)
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--openai-url", required=True)
+
+    for command in (micro, load, serve):
+        command.add_argument("--templates", type=int, default=60, help="Synthetic templates to index")
+    for command in (micro, load):
+        command.add_argument("--output", help="Write the results to this JSON file")
+        command.add_argument("--baseline", help="JSON results of an earlier run to compare p95s with")
+        command.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 increase (fraction)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        run_serve(args)
+        return
+
+    results = {"micro": run_micro(args)} if args.command == "micro" else {"load": run_load(args)}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import math
+import time
+import logging
+import httpx
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def _upload(client: httpx.AsyncClient, url: str, resume_bytes: bytes, jd_bytes: bytes) -> bool:
+    files = {
+        "resume": ("resume.pdf", resume_bytes, "application/pdf"),
+        "jd": ("jd.pdf", jd_bytes, "application/pdf"),
+    }
+    try:
+        response = await client.post(url, files=files)
+    except httpx.HTTPError as e:
+        logger.warning(f"Upload failed: {e}")
+        return False
+    return response.status_code == 200
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list (q in 0-100)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def latency_summary(latencies: list[float]) -> dict:
+    """p50/p95/p99/max of latencies in seconds, reported in milliseconds"""
+    ordered = sorted(latencies)
+    return {
+        f"{name}_ms": round(value * 1000, 3)
+        for name, value in (
+            ("p50", percentile(ordered, 50)), ("p95", percentile(ordered, 95)),
+            ("p99", percentile(ordered, 99)), ("max", ordered[-1] if ordered else 0.0)
+        )
+    }
+
+async def run_level(url: str, resumes: list[bytes], jd_bytes: bytes, concurrency: int, total: int) -> dict:
+    """
+    Fire `total` uploads with at most `concurrency` in flight; resumes are
+    used in turn (pass distinct files to keep the content cache out of it).
+    Reports throughput and latency percentiles of successful requests.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=300) as client:
+        async def worker(number: int):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                if await _upload(client, url, resumes[number % len(resumes)], jd_bytes):
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(number) for number in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+
+def format_level(result: dict) -> str:
+    return (
+        f"concurrency={result['concurrency']:>3} ok={result['ok']}/{result['requests']} "
+        f"rps={result['requests_per_sec']} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+        f"p99={result['p99_ms']}ms max={result['max_ms']}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the /upload/ endpoint")
+    parser.add_argument("resume", help="Path to a resume PDF")
+    parser.add_argument("jd", help="Path to a job description PDF")
+    parser.add_argument("--url", default="http://localhost:8000/upload/")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests-per-level", type=int, default=32)
+    args = parser.parse_args()
+
+    with open(args.resume, "rb") as f:
+        resume_bytes = f.read()
+    with open(args.jd, "rb") as f:
+        jd_bytes = f.read()
+
+    for level in [int(x) for x in args.levels.split(",") if x]:
+        result = asyncio.run(run_level(args.url, [resume_bytes], jd_bytes, level, args.requests_per_level))
+        logger.info(format_level(result))
+
+if __name__ == "__main__":
+    main()
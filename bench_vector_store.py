@@ -0,0 +1,92 @@
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def run_backend(backend: str, vectors: int, dim: int, queries: int, top_k: int) -> dict:
+    """Build one backend in a scratch directory and time top-k queries against it"""
+    import vector_store
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((vectors, dim), dtype=np.float32)
+    probes = rng.standard_normal((queries, dim), dtype=np.float32)
+    ids = [f"t{i}" for i in range(vectors)]
+    metadatas = [{"file_id": doc_id} for doc_id in ids]
+    documents = [""] * vectors
+
+    with tempfile.TemporaryDirectory() as scratch:
+        baseline_rss = _peak_rss_mb()
+        if backend == "numpy":
+            store = vector_store.NumpyVectorStore(path=scratch, name="bench_templates")
+        else:
+            store = vector_store.get_chroma_client(scratch).get_or_create_collection(
+                name="bench_templates", embedding_function=None
+            )
+
+        start = time.perf_counter()
+        for i in range(0, vectors, 1000):
+            store.upsert(ids=ids[i:i + 1000], embeddings=data[i:i + 1000].tolist(),
+                         documents=documents[i:i + 1000], metadatas=metadatas[i:i + 1000])
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        for probe in probes:
+            start = time.perf_counter()
+            store.query(query_embeddings=[probe.tolist()], n_results=top_k,
+                        include=["documents", "metadatas", "distances"])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies = np.array(latencies)
+    return {
+        "backend": backend,
+        "vectors": vectors,
+        "build_s": round(build_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "peak_rss_delta_mb": round(_peak_rss_mb() - baseline_rss, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare template query latency and memory: Chroma vs NumPy")
+    parser.add_argument("--vectors", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--backends", default="chroma,numpy")
+    parser.add_argument("--only", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(run_backend(args.only, args.vectors, args.dim, args.queries, args.top_k)))
+        return
+
+    # Each backend runs in a fresh interpreter so peak RSS isn't shared
+    for backend in args.backends.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--only", backend, "--vectors", str(args.vectors),
+             "--dim", str(args.dim), "--queries", str(args.queries), "--top-k", str(args.top_k)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        logger.info(
+            f"{result['backend']:>6}: {result['vectors']} vectors, build {result['build_s']}s, "
+            f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, p99 {result['p99_ms']}ms, "
+            f"peak RSS +{result['peak_rss_delta_mb']}MB"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_FIELDS = ("text", "gridfs_id", "analysis")
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest used as the cache key for uploaded PDFs"""
+    return hashlib.sha256(data).hexdigest()
+
+def _entry_size(entry: dict) -> int:
+    return sum(len(str(value)) for value in entry.values()) + 64
+
+class ContentCache:
+    """
+    Two-tier cache for per-PDF results, keyed by the SHA-256 of the PDF bytes.
+
+    Tier 1 is an in-process LRU bounded by approximate size in bytes.
+    Tier 2 is a MongoDB collection with a TTL index; it is skipped when no
+    database is available.
+    """
+
+    def __init__(self, db=None, max_bytes: int = None, ttl_seconds: int = None,
+                 collection_name: str = "content_cache"):
+        self.max_bytes = max_bytes or int(os.getenv("CONTENT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("CONTENT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+
+        self.collection = None
+        if db is not None:
+            try:
+                self.collection = db[collection_name]
+                self.collection.create_index("updated_at", expireAfterSeconds=self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Could not initialize persistent content cache: {e}")
+                self.collection = None
+
+    def get(self, digest: str, field: str):
+        """Return a cached field for a digest, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and field in entry:
+                self._entries.move_to_end(digest)
+                self._stats["memory_hits"] += 1
+                return entry[field]
+
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one({"_id": digest})
+            except Exception as e:
+                logger.error(f"Content cache lookup failed for {digest}: {e}")
+                doc = None
+            if doc and doc.get(field) is not None:
+                self._remember(digest, {k: doc[k] for k in CACHE_FIELDS if doc.get(k) is not None})
+                with self._lock:
+                    self._stats["persistent_hits"] += 1
+                return doc[field]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, digest: str, **fields):
+        """Store one or more fields (text, gridfs_id, analysis) for a digest"""
+        fields = {k: v for k, v in fields.items() if k in CACHE_FIELDS and v is not None}
+        if not fields:
+            return
+        self._remember(digest, fields)
+
+        if self.collection is not None:
+            try:
+                self.collection.update_one(
+                    {"_id": digest},
+                    {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Content cache write failed for {digest}: {e}")
+
+    def invalidate(self, digest: str, field: str):
+        """Drop a single stale field (e.g. a GridFS id whose file was deleted)"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and field in entry:
+                del entry[field]
+                self._resize(digest)
+        if self.collection is not None:
+            try:
+                self.collection.update_one({"_id": digest}, {"$unset": {field: ""}})
+            except Exception as e:
+                logger.error(f"Content cache invalidation failed for {digest}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["memory_hits"] + self._stats["persistent_hits"] + self._stats["misses"]
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "persistent": self.collection is not None,
+            }
+
+    def _remember(self, digest: str, fields: dict):
+        with self._lock:
+            entry = self._entries.setdefault(digest, {})
+            entry.update(fields)
+            self._entries.move_to_end(digest)
+            self._resize(digest)
+            while self._current_bytes > self.max_bytes and len(self._entries) > 1:
+                old_digest, _ = self._entries.popitem(last=False)
+                self._current_bytes -= self._sizes.pop(old_digest)
+                self._stats["evictions"] += 1
+
+    def _resize(self, digest: str):
+        size = _entry_size(self._entries[digest])
+        self._current_bytes += size - self._sizes.get(digest, 0)
+        self._sizes[digest] = size
@@ -0,0 +1,177 @@
+"""
+Reverse search: a vector index over uploaded resumes.
+
+Every stored upload is embedded from the text extraction already produced
+and upserted into the "candidate_resumes" collection under its GridFS id,
+so re-uploads of the same file overwrite one entry. Each entry carries the
+upload time (epoch seconds, for range filters), the filename and a
+category borrowed from the closest resume template. search_candidates()
+embeds a JD and returns a page of the nearest resumes, optionally filtered
+by upload date and category.
+
+The collection is built for hundreds of thousands of vectors: with Chroma
+the HNSW graph uses CANDIDATE_HNSW_M neighbors per node and
+CANDIDATE_HNSW_EF_CONSTRUCTION at build time, and CANDIDATE_HNSW_EF_SEARCH
+trades recall for latency at query time (bench_candidates.py measures the
+curve). The NumPy store searches exactly and rewrites its files on every
+write (serialized across worker processes by a file lock), so it only
+suits small deployments.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+
+from resources import get_embedder, get_template_collection, get_candidate_collection
+from rag_utils import distance_to_cosine, calibrate_score
+from vector_store import get_space
+from metrics import stage_timer
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CANDIDATE_COLLECTION = "candidate_resumes"
+CANDIDATE_INDEX_ENABLED = os.getenv("CANDIDATE_INDEX_ENABLED", "true").lower() == "true"
+CANDIDATE_VECTOR_BACKEND = os.getenv("CANDIDATE_VECTOR_BACKEND") or None  # defaults to VECTOR_BACKEND
+# HNSW graph degree and build-time beam: higher keeps recall up as the collection grows
+CANDIDATE_HNSW_M = int(os.getenv("CANDIDATE_HNSW_M", 32))
+CANDIDATE_HNSW_EF_CONSTRUCTION = int(os.getenv("CANDIDATE_HNSW_EF_CONSTRUCTION", 200))
+# Query-time beam; raised to offset + limit when a page needs more
+CANDIDATE_HNSW_EF_SEARCH = int(os.getenv("CANDIDATE_HNSW_EF_SEARCH", 96))
+# Deepest result a page may reach (offset + limit)
+CANDIDATE_SEARCH_MAX_RESULTS = int(os.getenv("CANDIDATE_SEARCH_MAX_RESULTS", 500))
+# Resume text kept in the collection for previews
+CANDIDATE_DOCUMENT_CHARS = 2000
+PREVIEW_CHARS = 300
+
+def candidate_hnsw_config() -> dict:
+    return {
+        "max_neighbors": CANDIDATE_HNSW_M,
+        "ef_construction": CANDIDATE_HNSW_EF_CONSTRUCTION,
+        "ef_search": CANDIDATE_HNSW_EF_SEARCH,
+    }
+
+def nearest_template_category(vector: list[float]) -> str:
+    """Category of the closest resume template, "General" without one"""
+    try:
+        result = get_template_collection().query(query_embeddings=[vector], n_results=1, include=["metadatas"])
+        metadatas = result["metadatas"][0]
+    except Exception as e:
+        logger.warning(f"Could not look up a category for a resume: {e}")
+        return "General"
+    return (metadatas[0] or {}).get("category", "General") if metadatas else "General"
+
+def index_candidates(entries: list[dict], vectors: list[list[float]] = None, endpoint: str = "index"):
+    """
+    Upsert uploaded resumes into the candidate collection with one embedding call.
+
+    Each entry has resume_fs_id, text, filename and sha256, plus
+    uploaded_at (a datetime, now if missing). Pass vectors when the resume
+    texts are already embedded.
+    """
+    if not entries:
+        return
+    if vectors is None:
+        with stage_timer("embedding"):
+            vectors = get_embedder().embed([entry["text"] for entry in entries], endpoint)
+    metadatas = []
+    for entry, vector in zip(entries, vectors):
+        uploaded_at = entry.get("uploaded_at") or datetime.now(timezone.utc)
+        if uploaded_at.tzinfo is None:
+            # Mongo returns naive UTC datetimes
+            uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+        metadatas.append({
+            "filename": entry["filename"],
+            "sha256": entry["sha256"],
+            "category": nearest_template_category(vector),
+            "uploaded_at": int(uploaded_at.timestamp()),
+            "upload_date": uploaded_at.date().isoformat(),
+        })
+    get_candidate_collection().upsert(
+        ids=[str(entry["resume_fs_id"]) for entry in entries],
+        embeddings=vectors,
+        documents=[entry["text"][:CANDIDATE_DOCUMENT_CHARS] for entry in entries],
+        metadatas=metadatas
+    )
+
+def index_candidate(resume_fs_id, resume_text: str, filename: str, digest: str, vector: list[float] = None,
+                    endpoint: str = "upload"):
+    """Index one freshly stored upload; failures are logged, never raised"""
+    if not CANDIDATE_INDEX_ENABLED or not resume_text:
+        return
+    try:
+        index_candidates(
+            [{"resume_fs_id": resume_fs_id, "text": resume_text, "filename": filename, "sha256": digest}],
+            [vector] if vector is not None else None,
+            endpoint
+        )
+    except Exception as e:
+        logger.warning(f"Could not add resume {resume_fs_id} to the candidate index: {e}")
+
+def candidate_filter(uploaded_after: datetime = None, uploaded_before: datetime = None,
+                     categories: list[str] = None):
+    """Chroma where clause for the search filters (None when unfiltered)"""
+    clauses = []
+    if uploaded_after is not None:
+        clauses.append({"uploaded_at": {"$gte": int(uploaded_after.timestamp())}})
+    if uploaded_before is not None:
+        clauses.append({"uploaded_at": {"$lt": int(uploaded_before.timestamp())}})
+    if categories:
+        clauses.append({"category": {"$in": list(categories)}})
+    if not clauses:
+        return None
+    # Chroma takes a single condition per clause
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _candidate(rank: int, resume_id: str, doc: str, metadata: dict, distance: float, space: str) -> dict:
+    cosine = distance_to_cosine(distance, space)
+    doc = doc or ""
+    return {
+        "rank": rank,
+        "resume_fs_id": resume_id,
+        "filename": metadata.get("filename"),
+        "category": metadata.get("category", "General"),
+        "upload_date": metadata.get("upload_date"),
+        "similarity_score": round(calibrate_score(cosine), 3),
+        "semantic_score": round(cosine, 3),
+        "preview_text": doc[:PREVIEW_CHARS] + "..." if len(doc) > PREVIEW_CHARS else doc,
+        "resume_download_url": f"/download_resume/{resume_id}",
+    }
+
+def search_candidates(jd_text: str, limit: int = 10, offset: int = 0, where: dict = None,
+                      endpoint: str = "search") -> dict:
+    """
+    One page of uploaded resumes ranked by similarity to a JD.
+
+    The ANN query fetches offset + limit neighbors and the page is sliced
+    from the end, so deep pages cost more; CANDIDATE_SEARCH_MAX_RESULTS
+    caps the depth.
+    """
+    depth = offset + limit
+    if depth > CANDIDATE_SEARCH_MAX_RESULTS:
+        raise ValueError(f"offset + limit may not exceed {CANDIDATE_SEARCH_MAX_RESULTS}")
+
+    with stage_timer("embedding"):
+        query_vector = get_embedder().embed_one(jd_text, endpoint)
+    collection = get_candidate_collection()
+    with stage_timer("candidate_query"):
+        results = collection.query(
+            query_embeddings=[query_vector],
+            n_results=depth,
+            include=["documents", "metadatas", "distances"],
+            where=where
+        )
+
+    space = get_space(collection)
+    rows = list(zip(results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]))
+    page = [
+        _candidate(offset + number, resume_id, doc, metadata or {}, distance, space)
+        for number, (resume_id, doc, metadata, distance) in enumerate(rows[offset:depth], start=1)
+    ]
+    has_more = len(rows) == depth and depth < CANDIDATE_SEARCH_MAX_RESULTS
+    return {
+        "offset": offset,
+        "limit": limit,
+        "results": page,
+        "next_offset": depth if has_more else None,
+    }
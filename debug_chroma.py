@@ -1,7 +1,4 @@
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-import os
+from vector_store import get_vector_store
 import logging
 
 # Setup logging
@@ -10,17 +7,8 @@ logger = logging.getLogger(__name__)
 
 def debug_chroma():
     try:
-        # Initialize ChromaDB with persistent storage
-        chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        
-        # Get the collection
-        collection = chroma_client.get_collection(
-            name="resume_templates",
-            embedding_function=embedding_functions.OpenAIEmbeddingFunction(
-                api_key=os.getenv("OPENAI_API_KEY"),
-                model_name="text-embedding-3-small"
-            )
-        )
+        # Get the collection from the configured vector store backend
+        collection = get_vector_store("resume_templates")
         
         # Get collection info
         count = collection.count()
@@ -5,7 +5,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def debug_mongodb():
-    client, db, fs = get_mongodb_connection()
+    client, db, fs = get_mongodb_connection(verify=True)
     
     if not client:
         logger.error("Cannot connect to MongoDB")
@@ -0,0 +1,222 @@
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+import gridfs
+
+from executor_utils import run_io
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# GridFS stores files in 255KB chunks; reading on chunk boundaries means one chunk fetch per read
+DOWNLOAD_CHUNK_SIZE = 255 * 1024
+TEMPLATE_CACHE_MAX_BYTES = int(os.getenv("TEMPLATE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Larger files are streamed but never cached
+TEMPLATE_CACHE_MAX_FILE_BYTES = int(os.getenv("TEMPLATE_CACHE_MAX_FILE_BYTES", 4 * 1024 * 1024))
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class FileInfo:
+    """What a download response needs to know about a GridFS file"""
+
+    def __init__(self, grid_out):
+        self.file_id = grid_out._id
+        self.filename = grid_out.filename or f"{grid_out._id}.pdf"
+        self.length = grid_out.length
+        self.upload_date = grid_out.upload_date
+        if self.upload_date is not None and self.upload_date.tzinfo is None:
+            self.upload_date = self.upload_date.replace(tzinfo=timezone.utc)
+        # GridFS files are immutable, so the md5 (older drivers) or id identifies the content
+        md5 = getattr(grid_out, "md5", None)
+        self.etag = f'"{md5}"' if md5 else f'"{grid_out._id}-{grid_out.length}"'
+
+class FileCache:
+    """Small LRU of whole files (bytes plus FileInfo), bounded by total size"""
+
+    def __init__(self, max_bytes: int = TEMPLATE_CACHE_MAX_BYTES,
+                 max_file_bytes: int = TEMPLATE_CACHE_MAX_FILE_BYTES):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, file_id: str):
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(file_id)
+            self._stats["hits"] += 1
+            return entry
+
+    def set(self, file_id: str, info: FileInfo, data: bytes):
+        if len(data) > self.max_file_bytes:
+            return
+        with self._lock:
+            if file_id in self._entries:
+                return
+            self._entries[file_id] = (info, data)
+            self._current_bytes += len(data)
+            while self._current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._current_bytes -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, file_id: str):
+        with self._lock:
+            entry = self._entries.pop(file_id, None)
+            if entry is not None:
+                self._current_bytes -= len(entry[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._current_bytes}
+
+def parse_range(header: str, length: int):
+    """
+    Resolve a single-range `Range` header to inclusive (start, end).
+
+    Returns None when the header is absent or not a single byte range (the
+    whole file is served then) and raises 416 when it can't be satisfied.
+    """
+    if not header:
+        return None
+    found = _RANGE.match(header.strip())
+    if not found or found.groups() == ("", ""):
+        return None
+    first, last = found.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(length - int(last), 0)
+        end = length - 1
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, end
+
+def _not_modified(request: Request, info: FileInfo) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or info.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and info.upload_date is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return info.upload_date.replace(microsecond=0) <= since
+    return False
+
+def _range_applies(request: Request, info: FileInfo) -> bool:
+    """If-Range: only honour Range when the client's copy is still current"""
+    if_range = request.headers.get("if-range")
+    return if_range is None or if_range.strip() == info.etag
+
+def _read_block(grid_out, position: int, size: int) -> bytes:
+    grid_out.seek(position)
+    return grid_out.read(size)
+
+async def iter_gridfs(grid_out, start: int, end: int):
+    """Yield bytes start..end (inclusive) in chunk-aligned blocks read off the event loop"""
+    position = start
+    try:
+        while position <= end:
+            # First block runs to the next chunk boundary, the rest are whole chunks
+            size = min(DOWNLOAD_CHUNK_SIZE - position % DOWNLOAD_CHUNK_SIZE, end - position + 1)
+            block = await run_io(_read_block, grid_out, position, size)
+            if not block:
+                break
+            position += len(block)
+            yield block
+    finally:
+        await run_io(grid_out.close)
+
+def _headers(info: FileInfo) -> dict:
+    headers = {
+        "Content-Disposition": f'attachment; filename="{info.filename}"',
+        "Accept-Ranges": "bytes",
+        "ETag": info.etag,
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if info.upload_date is not None:
+        headers["Last-Modified"] = format_datetime(info.upload_date, usegmt=True)
+    return headers
+
+def _read_all(grid_out) -> bytes:
+    try:
+        return grid_out.read()
+    finally:
+        grid_out.close()
+
+async def gridfs_download(request: Request, bucket, file_id: str, cache: FileCache = None,
+                          media_type: str = "application/pdf") -> Response:
+    """
+    Serve a GridFS file with Content-Length, ETag/Last-Modified, conditional
+    GET and single byte ranges. With a cache, whole-file GETs of files up to
+    the cache's max_file_bytes are read into memory and served from there on
+    later requests; larger files and range requests on a miss are streamed.
+    """
+    try:
+        object_id = ObjectId(file_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=404, detail=f"File not found: {file_id}")
+
+    data = None
+    entry = cache.get(file_id) if cache is not None else None
+    try:
+        if entry is not None:
+            info, data = entry
+        else:
+            grid_out = await run_io(bucket.get, object_id)
+            info = FileInfo(grid_out)
+    except gridfs.errors.NoFile:
+        raise HTTPException(status_code=404, detail=f"File not found: {file_id}")
+
+    headers = _headers(info)
+    if _not_modified(request, info):
+        if data is None:
+            await run_io(grid_out.close)
+        return Response(status_code=304, headers=headers)
+
+    # Only buffer what the cache will keep; a range request or a large file must not load the whole file
+    if data is None and cache is not None and info.length <= cache.max_file_bytes and "range" not in request.headers:
+        data = await run_io(_read_all, grid_out)
+        cache.set(file_id, info, data)
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), info.length) if _range_applies(request, info) else None
+    except HTTPException:
+        if data is None:
+            await run_io(grid_out.close)
+        raise
+    start, end = byte_range or (0, info.length - 1)
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.length}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+
+    if data is not None:
+        return Response(content=data[start:end + 1], status_code=status_code,
+                        headers=headers, media_type=media_type)
+    return StreamingResponse(iter_gridfs(grid_out, start, end), status_code=status_code,
+                             headers=headers, media_type=media_type)
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import record_llm_usage
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # "openai" or "local"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache")
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 20))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 256))
+
+_WHITESPACE = re.compile(r"\s+")
+_TOKEN = re.compile(r"[a-z0-9+#.]+")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies share one cache entry"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+def text_key(text: str, model: str) -> str:
+    """Cache key: SHA-256 of the model name and the normalized text"""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class OpenAIEmbedder:
+    """Embeds a batch of texts with a single OpenAI embeddings request"""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, client=None):
+        from openai import OpenAI
+        self.model = model
+        self.client = client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def embed(self, texts: list[str], endpoint: str = "index") -> list[list[float]]:
+        from llm_scheduler import call_sync, estimate_tokens, record_actual_tokens
+
+        def request():
+            response = self.client.embeddings.create(model=self.model, input=texts)
+            if response.usage is not None:
+                record_llm_usage("embedding", self.model, response.usage.prompt_tokens)
+                record_actual_tokens(response.usage.prompt_tokens)
+            return response
+
+        tokens = sum(estimate_tokens(text, completion_tokens=0) for text in texts)
+        response = call_sync(self.model, tokens, request, endpoint)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+class HashingEmbedder:
+    """
+    Deterministic, offline embedder (feature hashing of tokens and bigrams).
+
+    Useful for tests, benchmarks and local development without an API key.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.model = f"local-hashing-{dim}"
+        self.dim = dim
+
+    def embed(self, texts: list[str], endpoint: str = "index") -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+def get_embedder(backend: str = None):
+    """Build the configured embedder ("openai" or "local")"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "local":
+        return HashingEmbedder()
+    if backend == "openai":
+        return OpenAIEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+class EmbeddingStore:
+    """
+    On-disk vector cache: a memory-mapped float32 matrix plus a SQLite key index.
+
+    Rows are appended; the matrix file grows geometrically. A batch's
+    vectors are written and flushed before its keys are committed, so a
+    crash never leaves the index pointing at unwritten rows. API, job and
+    indexer processes share the files: a write transaction (BEGIN
+    IMMEDIATE) serializes row assignment across processes and only inserts
+    the new keys, and lookups read just the requested keys. An index.json
+    left by older versions is imported on first open.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, model: str = EMBEDDING_MODEL):
+        safe_model = re.sub(r"[^A-Za-z0-9._-]", "_", model)
+        self.directory = os.path.join(path, safe_model)
+        self.matrix_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.sqlite")
+        self._lock = threading.Lock()
+        self._dim = None
+        self._capacity = 0
+        self._matrix = None
+        os.makedirs(self.directory, exist_ok=True)
+        # One connection per store, used under self._lock
+        self._db = sqlite3.connect(self.index_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._import_json_index()
+        count = len(self)
+        if count:
+            logger.info(f"Loaded {count} cached embeddings from {self.directory}")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def _meta(self) -> dict:
+        return dict(self._db.execute("SELECT name, value FROM meta"))
+
+    def _import_json_index(self):
+        """Move the keys of a JSON index written by older versions into SQLite"""
+        json_path = os.path.join(self.directory, "index.json")
+        if not os.path.exists(json_path):
+            return
+        with self._lock:
+            try:
+                with open(json_path, "r") as f:
+                    index = json.load(f)
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    if not self._meta():
+                        self._db.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)", index["keys"].items())
+                        self._db.executemany("INSERT INTO meta VALUES (?, ?)", [
+                            ("dim", index["dim"]),
+                            ("rows", len(index["keys"])),
+                            ("capacity", max(index.get("capacity", 0), len(index["keys"]))),
+                        ])
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                os.remove(json_path)
+                logger.info(f"Moved {len(index['keys'])} cached embedding keys from index.json to SQLite")
+            except FileNotFoundError:
+                # Another process imported it first
+                pass
+            except Exception as e:
+                logger.error(f"Could not import the embedding index {json_path}, ignoring it: {e}")
+
+    def _open_matrix(self, capacity: int):
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        required = capacity * self._dim * 4
+        with open(self.matrix_path, "ab") as f:
+            if f.tell() < required:
+                f.truncate(required)
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        self._capacity = capacity
+
+    def _lookup(self, keys: list[str]) -> dict:
+        rows = {}
+        unique = list(dict.fromkeys(keys))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows.update(self._db.execute(
+                f"SELECT key, row FROM keys WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return rows
+
+    def get_many(self, keys: list[str]) -> dict:
+        with self._lock:
+            rows = self._lookup(keys)
+            if not rows:
+                return {}
+            if self._matrix is None or max(rows.values()) >= self._capacity:
+                # Another process grew the matrix since it was mapped here
+                meta = self._meta()
+                self._dim = meta["dim"]
+                self._open_matrix(meta["capacity"])
+            return {key: np.array(self._matrix[row]) for key, row in rows.items()}
+
+    def put_many(self, keys: list[str], vectors: list[list[float]]):
+        if not keys:
+            return
+        with self._lock:
+            # Serializes writers across processes; rows are assigned from the committed index
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._lookup(keys)
+                new = list({k: v for k, v in zip(keys, vectors) if k not in existing}.items())
+                if not new:
+                    self._db.execute("COMMIT")
+                    return
+                meta = self._meta()
+                self._dim = meta.get("dim") or len(new[0][1])
+                rows = meta.get("rows", 0)
+                capacity = meta.get("capacity", 0)
+                needed = rows + len(new)
+                if needed > capacity:
+                    capacity = max(needed, capacity * 2, 1024)
+                if self._matrix is None or capacity != self._capacity:
+                    self._open_matrix(capacity)
+                for offset, (_, vector) in enumerate(new):
+                    self._matrix[rows + offset] = np.asarray(vector, dtype=np.float32)
+                self._matrix.flush()
+                self._db.executemany("INSERT INTO keys VALUES (?, ?)",
+                                     [(key, rows + offset) for offset, (key, _) in enumerate(new)])
+                self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                     [("dim", self._dim), ("rows", needed), ("capacity", capacity)])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+
+class BatchingEmbedder:
+    """
+    Coalesces concurrent embed() calls made within a short window into one
+    batched request to the underlying embedder. A batch is admitted at the
+    priority of its most urgent caller (see llm_scheduler.PRIORITIES).
+    """
+
+    def __init__(self, embedder, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_MAX_BATCH):
+        self.embedder = embedder
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches_sent = 0
+
+    def embed(self, texts: list[str], endpoint: str = "index") -> list[list[float]]:
+        future = Future()
+        with self._cond:
+            self._pending.append((texts, endpoint, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._pending, timeout=30):
+                    self._thread = None
+                    return
+            # Give other callers a moment to join this batch
+            time.sleep(self.window)
+            with self._cond:
+                batch, size = [], 0
+                while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                    batch.append(self._pending.pop(0))
+                    size += len(batch[-1][0])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        from llm_scheduler import PRIORITIES
+        unique = list(dict.fromkeys(text for texts, _, _ in batch for text in texts))
+        endpoint = min((endpoint for _, endpoint, _ in batch), key=lambda e: PRIORITIES.get(e, PRIORITIES["job"]))
+        try:
+            vectors = dict(zip(unique, self.embedder.embed(unique, endpoint))) if unique else {}
+            self.batches_sent += 1
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for texts, _, future in batch:
+            future.set_result([vectors[text] for text in texts])
+
+class CachedEmbedder:
+    """Embedding layer in front of the vector store: disk cache + batched misses"""
+
+    def __init__(self, embedder=None, store: EmbeddingStore = None):
+        self.embedder = embedder or get_embedder()
+        self.model = self.embedder.model
+        self.store = store or EmbeddingStore(model=self.model)
+        self.batcher = BatchingEmbedder(self.embedder)
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts: list[str], endpoint: str = "index") -> list[list[float]]:
+        """Vectors for texts; misses are embedded at the priority of `endpoint` (see llm_scheduler)"""
+        normalized = [normalize_text(text) for text in texts]
+        keys = [text_key(text, self.model) for text in normalized]
+        cached = self.store.get_many(keys)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in cached))
+        self.hits += sum(1 for key in keys if key in cached)
+        self.misses += len(missing)
+        if missing:
+            by_key = dict(zip(keys, normalized))
+            vectors = self.batcher.embed([by_key[key] for key in missing], endpoint)
+            self.store.put_many(missing, vectors)
+            cached.update({key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)})
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_one(self, text: str, endpoint: str = "index") -> list[float]:
+        return self.embed([text], endpoint)[0]
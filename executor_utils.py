@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Concurrency limits (override via environment)
+MAX_IO_WORKERS = int(os.getenv("MAX_IO_WORKERS", 32))
+MAX_CPU_WORKERS = int(os.getenv("MAX_CPU_WORKERS", os.cpu_count() or 2))
+
+_io_pool = None
+_cpu_pool = None
+# One flag per in-flight run_cpu call with a timeout, set by the worker when the call actually starts
+# (the pool hands calls to workers ahead of time, so its futures look "running" while still queued)
+_cpu_started = multiprocessing.RawArray("b", 1024)
+_free_slots = deque(range(len(_cpu_started)))
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Thread pool for blocking I/O (GridFS, MongoDB, ChromaDB)"""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=MAX_IO_WORKERS, thread_name_prefix="io")
+        logger.info(f"Started I/O thread pool with {MAX_IO_WORKERS} workers")
+    return _io_pool
+
+def _init_cpu_worker(started):
+    global _cpu_started
+    _cpu_started = started
+
+def _run_tracked(slot: int, call):
+    _cpu_started[slot] = 1
+    return call()
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound work (PDF parsing)"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPoolExecutor(max_workers=MAX_CPU_WORKERS, initializer=_init_cpu_worker,
+                                        initargs=(_cpu_started,))
+        logger.info(f"Started CPU process pool with {MAX_CPU_WORKERS} workers")
+    return _cpu_pool
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking call in the I/O thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (the request id) into the thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_io_pool(), partial(context.run, func, *args, **kwargs))
+
+def recycle_cpu_pool(pool: ProcessPoolExecutor):
+    """
+    Kill the workers of a process pool and start a fresh one on next use.
+
+    A task that is already running in a worker process can't be cancelled,
+    so this is the only way to take back a worker stuck past its deadline.
+    Other tasks that were on the killed pool are resubmitted by run_cpu.
+    """
+    global _cpu_pool
+    if pool is not _cpu_pool:
+        return  # Already replaced by another caller
+    _cpu_pool = None
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False)
+    logger.warning("Recycled the CPU process pool after a task overran its time limit")
+
+async def run_cpu(func, *args, timeout: float = None, **kwargs):
+    """
+    Run a CPU-bound, picklable call in the process pool.
+
+    With a timeout, asyncio.TimeoutError is raised once it passes; a task
+    still queued is dropped, while one already running has its pool recycled.
+    """
+    call = partial(func, *args, **kwargs)
+    for attempt in range(2):
+        pool = get_cpu_pool()
+        # Without a free slot the call can't be tracked and counts as running
+        slot = _free_slots.popleft() if timeout is not None and _free_slots else None
+        if slot is None:
+            future = pool.submit(call)
+        else:
+            _cpu_started[slot] = 0
+            future = pool.submit(_run_tracked, slot, call)
+            # Only reuse the slot once the worker can no longer write to it
+            future.add_done_callback(lambda _, slot=slot: _free_slots.append(slot))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            if not future.cancel() and (slot is None or _cpu_started[slot]):
+                recycle_cpu_pool(pool)
+            raise
+        except BrokenProcessPool:
+            # Killed by another caller's recycle_cpu_pool: run it again on the fresh pool
+            if attempt or pool is _cpu_pool:
+                raise
+            logger.warning(f"CPU process pool was recycled under {getattr(func, '__name__', func)}; retrying")
+
+def shutdown_pools():
+    """Shut down the worker pools (called on application shutdown)"""
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the OpenAI API (chat completions and embeddings).
+
+Run it with `uvicorn fake_llm_server:app --port 9000` and point the app at it
+with OPENAI_BASE_URL=http://localhost:9000/v1. Replies are deterministic:
+structured-output requests get a JSON document that satisfies the requested
+schema, and embeddings come from the local hashing embedder. Set
+FAKE_LLM_RATE_LIMIT_RPM to answer chat calls past that rate with a 429, like
+the real API. A prompt containing FAKE_REFUSE_MARKER gets a refusal, and one
+containing FAKE_TRUNCATE_MARKER a reply cut off with finish_reason "length",
+for exercising those paths.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import logging
+from fastapi import FastAPI, Request
+from collections import deque
+from fastapi.responses import JSONResponse, StreamingResponse
+from embedding_utils import HashingEmbedder
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", 200))
+FAKE_LLM_TOKEN_LATENCY_MS = float(os.getenv("FAKE_LLM_TOKEN_LATENCY_MS", 5))
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", 20))
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", 1536))
+FAKE_LLM_RATE_LIMIT_RPM = int(os.getenv("FAKE_LLM_RATE_LIMIT_RPM", 0))
+FAKE_REFUSE_MARKER = "[fake:refuse]"
+FAKE_TRUNCATE_MARKER = "[fake:truncate]"
+FAKE_REFUSAL = "I'm sorry, I can't help with that request."
+
+app = FastAPI()
+embedder = HashingEmbedder(dim=FAKE_EMBEDDING_DIM)
+stats = {"chat_completions": 0, "embedding_requests": 0, "embedded_texts": 0, "rate_limited": 0, "by_model": {}}
+_recent_calls = deque()
+
+_SCHEMA_IN_PROMPT = re.compile(r"JSON schema:\s*(\{.*\})\s*$", re.S)
+
+def example_from_schema(schema: dict, defs: dict = None):
+    """Build a value that validates against a (pydantic-generated) JSON schema"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return example_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return example_from_schema(options[0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: example_from_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [example_from_schema(schema.get("items", {"type": "string"}), defs)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 0.5
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    return "Fake response for local testing."
+
+def _reply_for(body: dict) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(example_from_schema(response_format["json_schema"]["schema"]))
+    prompt = body["messages"][-1]["content"] if body.get("messages") else ""
+    found = _SCHEMA_IN_PROMPT.search(prompt if isinstance(prompt, str) else "")
+    if found:
+        return json.dumps(example_from_schema(json.loads(found.group(1))))
+    if response_format.get("type") == "json_object":
+        return json.dumps({"result": "Fake response for local testing."})
+    return "This is a fake completion from the local LLM server."
+
+def _usage(body: dict, reply: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    completion_tokens = max(len(reply) // 4, 1)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "unknown")
+    if FAKE_LLM_RATE_LIMIT_RPM:
+        now = time.monotonic()
+        while _recent_calls and now - _recent_calls[0] > 60:
+            _recent_calls.popleft()
+        if len(_recent_calls) >= FAKE_LLM_RATE_LIMIT_RPM:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"retry-after": str(max(int(60 - (now - _recent_calls[0])), 1))}
+            )
+        _recent_calls.append(now)
+    stats["chat_completions"] += 1
+    stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+
+    prompt = json.dumps(body.get("messages", []))
+    refusal = FAKE_REFUSAL if FAKE_REFUSE_MARKER in prompt else None
+    reply = "" if refusal else _reply_for(body)
+    finish_reason = "stop"
+    if FAKE_TRUNCATE_MARKER in prompt:
+        reply, finish_reason = reply[:len(reply) // 2], "length"
+    usage = _usage(body, reply or refusal)
+    created = int(time.time())
+    await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000)
+
+    if not body.get("stream"):
+        return {
+            "id": f"chatcmpl-fake-{stats['chat_completions']}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": None if refusal else reply, "refusal": refusal},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def chunks():
+        base = {"id": f"chatcmpl-fake-{stats['chat_completions']}", "object": "chat.completion.chunk",
+                "created": created, "model": model}
+        field, text = ("refusal", refusal) if refusal else ("content", reply)
+        for i in range(0, len(text), 4):
+            await asyncio.sleep(FAKE_LLM_TOKEN_LATENCY_MS / 1000)
+            delta = {field: text[i:i + 4]}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}) + "\n\n"
+        final = {"index": 0, "delta": {}, "finish_reason": finish_reason}
+        yield "data: " + json.dumps({**base, "choices": [final]}) + "\n\n"
+        if include_usage:
+            yield "data: " + json.dumps({**base, "choices": [], "usage": usage}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    stats["embedding_requests"] += 1
+    stats["embedded_texts"] += len(texts)
+    await asyncio.sleep(FAKE_EMBEDDING_LATENCY_MS / 1000)
+    vectors = embedder.embed([str(text) for text in texts])
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-3-small"),
+        "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+        "usage": {"prompt_tokens": sum(len(str(t)) for t in texts) // 4, "total_tokens": sum(len(str(t)) for t in texts) // 4},
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Request counters, handy for checking routing and batching"""
+    return stats
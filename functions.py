@@ -1,28 +1,53 @@
-import fitz  # PyMuPDF
 import base64
-import os
-from openai import OpenAI
 from dotenv import load_dotenv
+from llm_scheduler import get_scheduler, call_sync, estimate_tokens
+from pdf_extraction import extract_text
+from resources import get_openai_client, get_async_openai_client
+from agent_utils import format_analysis_prompt
+from llm_router import (
+    ResumeAnalysis, route_analysis_model, structured_completion,
+    structured_completion_sync, stream_structured_completion
+)
 
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    text = "\n".join(page.get_text() for page in doc)
-    doc.close()
-    return text.strip()
+    """Text of a PDF via the configured engine and limits (see pdf_extraction.py)"""
+    return extract_text(pdf_bytes)
 
 def encode_pdf_to_base64(pdf_bytes: bytes) -> str:
     return base64.b64encode(pdf_bytes).decode()
 
-def get_gpt_analysis(text: str) -> str:
-    prompt = f"Analyze this resume and score it on Skills, Experience, and Education:\n\n{text}\n\nReturn JSON format."
+def get_gpt_analysis(text: str, endpoint: str = "") -> dict:
+    model = route_analysis_model(text, endpoint)
+    prompt = format_analysis_prompt(text, model)
+
+    analysis = call_sync(
+        model, estimate_tokens(prompt, model),
+        lambda: structured_completion_sync(get_openai_client(), model, prompt, ResumeAnalysis, "analysis"),
+        endpoint
+    )
+    return analysis.model_dump()
+
+async def get_gpt_analysis_async(text: str, endpoint: str = "") -> dict:
+    model = route_analysis_model(text, endpoint)
+    prompt = format_analysis_prompt(text, model)
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
+    analysis = await get_scheduler().call(
+        model, estimate_tokens(prompt, model), endpoint,
+        lambda: structured_completion(get_async_openai_client(), model, prompt, ResumeAnalysis, "analysis")
     )
-    return response.choices[0].message.content
+    return analysis.model_dump()
+
+async def stream_gpt_analysis(text: str, result: dict, endpoint: str = ""):
+    """Yield the analysis JSON as it is generated; the parsed dict lands in result["analysis"]"""
+    model = route_analysis_model(text, endpoint)
+    prompt = format_analysis_prompt(text, model)
+
+    parsed = {}
+    async for delta in get_scheduler().stream(
+        model, estimate_tokens(prompt, model), endpoint,
+        lambda: stream_structured_completion(get_async_openai_client(), model, prompt, ResumeAnalysis, "analysis", parsed)
+    ):
+        yield delta
+    result["analysis"] = parsed["parsed"].model_dump()
@@ -0,0 +1,85 @@
+from pdf_extraction import extract_text, PDFExtractionError
+from candidate_index import index_candidates
+from resources import get_db, get_fs, get_content_cache, get_candidate_collection, aclose
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 32))
+
+def _resume_text(fs, file_doc: dict) -> str:
+    """Cached extraction for the file's digest, or a fresh one from GridFS"""
+    digest = (file_doc.get("metadata") or {}).get("sha256")
+    text = get_content_cache().get(digest, "text") if digest else None
+    if text is None:
+        text = extract_text(fs.get(file_doc["_id"]).read())
+    return text
+
+def backfill_candidates(batch_size: int = INDEX_BATCH_SIZE, full: bool = False):
+    """
+    Add uploads stored before the candidate index existed (or while it was
+    disabled) to it. Already indexed resumes are skipped unless full is set.
+    """
+    db, fs = get_db(), get_fs()
+    if db is None:
+        logger.error("MongoDB is not available")
+        return
+    indexed = set() if full else set(get_candidate_collection().get(include=[])["ids"])
+    files_cursor = db.fs.files.find(
+        {"metadata.source": "user_upload"},
+        {"filename": 1, "metadata": 1, "uploadDate": 1}
+    ).sort("_id", 1)
+
+    start = time.perf_counter()
+    count = skipped = failed = 0
+    batch = []
+    for file_doc in files_cursor:
+        if str(file_doc["_id"]) in indexed:
+            skipped += 1
+            continue
+        try:
+            text = _resume_text(fs, file_doc)
+        except PDFExtractionError as e:
+            logger.warning(f"Skipping {file_doc['_id']}: {e}")
+            failed += 1
+            continue
+        if not text:
+            failed += 1
+            continue
+        metadata = file_doc.get("metadata") or {}
+        batch.append({
+            "resume_fs_id": file_doc["_id"],
+            "text": text,
+            "filename": metadata.get("original_filename") or file_doc.get("filename"),
+            "sha256": metadata.get("sha256", ""),
+            "uploaded_at": file_doc.get("uploadDate"),
+        })
+        if len(batch) >= batch_size:
+            index_candidates(batch)
+            count += len(batch)
+            batch = []
+            logger.info(f"Indexed {count} resumes ({count / (time.perf_counter() - start):.1f} docs/sec)")
+    if batch:
+        index_candidates(batch)
+        count += len(batch)
+
+    logger.info(
+        f"Finished backfilling the candidate index: {count} indexed, {skipped} already indexed, "
+        f"{failed} without text ({time.perf_counter() - start:.1f}s)"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add stored uploads to the candidate (reverse search) index")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--full", action="store_true", help="Re-index every upload")
+    args = parser.parse_args()
+    try:
+        backfill_candidates(batch_size=args.batch_size, full=args.full)
+    finally:
+        asyncio.run(aclose())
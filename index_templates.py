@@ -1,119 +1,257 @@
-from mongo_utils import get_mongodb_connection
-from functions import extract_text_from_pdf
-from rag_utils import add_template_to_vectorstore
+from mongo_utils import get_mongodb_connection, get_template_fs, ensure_indexes, TEMPLATE_BUCKET
+from pdf_extraction import extract_text
+from template_chunks import chunk_template, CHUNKER_VERSION
+from lexical_index import rebuild_lexical_index
+from template_snapshots import (
+    create_snapshot, resume_snapshot, open_snapshot, current_version, publish, discard, collect_garbage
+)
+import rag_utils
+from resources import get_template_collection, replace
+from concurrent.futures import ProcessPoolExecutor
 from bson import ObjectId
+import argparse
+import gridfs
+import json
 import logging
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
 import os
+import time
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Use persistent ChromaDB client
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 32))
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", os.cpu_count() or 2))
+INDEX_CHECKPOINT_PATH = os.getenv("INDEX_CHECKPOINT_PATH", "./index_checkpoint.json")
 
-# Use OpenAI embeddings
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model_name="text-embedding-3-small"
-)
+def template_category(file_doc: dict) -> str:
+    """The category recorded in the template's GridFS metadata"""
+    return (file_doc.get("metadata") or {}).get("category") or "General"
 
-# Collection name
-collection = chroma_client.get_or_create_collection(
-    name="resume_templates",
-    embedding_function=openai_ef
-)
+def file_fingerprint(file_doc: dict) -> str:
+    """
+    Identify a stored file version (md5 when GridFS recorded one, else
+    length + uploadDate) and its category, so recategorized templates are
+    re-indexed too.
+    """
+    if file_doc.get("md5"):
+        version = f"md5:{file_doc['md5']}"
+    else:
+        upload_date = file_doc.get("uploadDate")
+        version = f"len:{file_doc.get('length', 0)}:{upload_date.isoformat() if upload_date else ''}"
+    return f"{version}:category:{template_category(file_doc)}"
+
+def get_indexed_fingerprints() -> dict:
+    """
+    Map file_id -> fingerprint for everything already in the Chroma collection.
+    Templates chunked by an older chunker version are left out so they get re-indexed.
+    """
+    results = get_template_collection().get(include=["metadatas"])
+    return {
+        metadata.get("file_id", doc_id): metadata.get("fingerprint")
+        for doc_id, metadata in zip(results["ids"], results["metadatas"])
+        if metadata and metadata.get("chunker_version") == CHUNKER_VERSION
+    }
+
+def load_checkpoint(path: str = INDEX_CHECKPOINT_PATH) -> dict:
+    """{"last_id", "snapshot"} of an interrupted run, or None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+
+def save_checkpoint(last_id: str, snapshot: str, path: str = INDEX_CHECKPOINT_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": last_id, "snapshot": snapshot, "saved_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+def _parse_template(job: tuple):
+    """Process-pool worker: (file_id, pdf_bytes) -> (file_id, text, error)"""
+    file_id, pdf_bytes = job
+    try:
+        return file_id, extract_text(pdf_bytes), None
+    except Exception as e:
+        return file_id, None, str(e)
+
+def _index_batch(batch: list, fs, pool: ProcessPoolExecutor) -> int:
+    """Read, parse (in parallel) and upsert one batch of GridFS file documents"""
+    docs_by_id = {}
+    jobs = []
+    for file_doc in batch:
+        file_id = str(file_doc["_id"])
+        filename = file_doc.get("filename", file_id)
+        try:
+            pdf_bytes = fs.get(ObjectId(file_id)).read()
+        except gridfs.NoFile:
+            logger.error(f"File with ID {file_id} not found in GridFS")
+            continue
+        if len(pdf_bytes) == 0:
+            logger.warning(f"File {filename} is empty, skipping...")
+            continue
+        docs_by_id[file_id] = file_doc
+        jobs.append((file_id, pdf_bytes))
+
+    ids, contents, metadatas = [], [], []
+    indexed_ids = []
+    for file_id, text, error in pool.map(_parse_template, jobs):
+        file_doc = docs_by_id[file_id]
+        filename = file_doc.get("filename", file_id)
+        if error:
+            logger.error(f"Error extracting text from {filename}: {error}")
+            continue
+        if not text or len(text.strip()) < 10:
+            logger.warning(f"No meaningful text extracted from {filename}, skipping...")
+            continue
+        upload_date = file_doc.get("uploadDate")
+        chunk_ids, chunk_texts, chunk_metadatas = chunk_template(file_id, text, {
+            "title": (file_doc.get("metadata") or {}).get("title", filename),
+            "filename": filename,
+            # Read by rag_utils and candidate_index (nearest_template_category)
+            "category": template_category(file_doc),
+            "fingerprint": file_fingerprint(file_doc),
+            "upload_date": upload_date.isoformat() if upload_date else ""
+        })
+        indexed_ids.append(file_id)
+        ids.extend(chunk_ids)
+        contents.extend(chunk_texts)
+        metadatas.extend(chunk_metadatas)
+
+    if ids:
+        remove_stale_chunks(indexed_ids, set(ids))
+        rag_utils.add_templates_to_vectorstore(ids, contents, metadatas)
+    return len(indexed_ids)
+
+def remove_stale_chunks(file_ids: list[str], keep: set):
+    """Delete chunks (or old whole-document entries) of re-indexed templates that the new chunking doesn't produce"""
+    collection = get_template_collection()
+    existing = collection.get(where={"file_id": {"$in": file_ids}}, include=["metadatas"])
+    stale = [doc_id for doc_id in existing["ids"] if doc_id not in keep]
+    if stale:
+        collection.delete(ids=stale)
+
+def remove_deleted_templates(files_collection, batch_size: int = 500) -> int:
+    """Delete the chunks of templates no longer in the template bucket; returns how many templates were removed"""
+    template_ids = {str(doc["_id"]) for doc in files_collection.find({}, {"_id": 1})}
+    collection = get_template_collection()
+    results = collection.get(include=["metadatas"])
+    removed, stale = set(), []
+    for doc_id, metadata in zip(results["ids"], results["metadatas"]):
+        file_id = (metadata or {}).get("file_id", doc_id)
+        if file_id not in template_ids:
+            removed.add(file_id)
+            stale.append(doc_id)
+    for i in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[i:i + batch_size])
+    if removed:
+        logger.info(f"Removed {len(removed)} templates deleted from GridFS ({len(stale)} chunks)")
+    return len(removed)
+
+def index_templates(batch_size: int = INDEX_BATCH_SIZE, workers: int = INDEX_WORKERS,
+                    full: bool = False, resume: bool = True, rebuild: bool = False):
+    """
+    Incrementally index the GridFS template bucket into a new template snapshot.
+
+    User uploads live in the default bucket and are never indexed here.
+
+    The served index is never modified: the published snapshot is copied,
+    only files whose fingerprint differs from the indexed copy are parsed
+    and embedded into the copy, and the result is published atomically for
+    running API workers to swap in (see template_snapshots). Progress is
+    checkpointed after every batch so an interrupted run picks up where it
+    stopped, in the same unpublished snapshot. Templates deleted from the
+    bucket are removed from the snapshot before it is published. With rebuild=True the
+    snapshot starts empty (needed once to move an old L2 collection to
+    cosine). Each template is split into sections that are embedded
+    separately and carry the template's file_id. The BM25 lexical index is
+    rebuilt from the snapshot's collection before publishing.
+    """
+    client, db, _ = get_mongodb_connection()
 
-def index_templates():
-    client, db, fs = get_mongodb_connection()
-    
     if not client:
         logger.error("MongoDB connection failed.")
         return
-    
+
+    template_fs = get_template_fs(db)
+    files_collection = db[f"{TEMPLATE_BUCKET}.files"]
+    ensure_indexes(db)
+
     try:
-        logger.info("Indexing templates from GridFS to ChromaDB...")
-        
-        # First, let's check what's actually in GridFS
-        total_files = db.fs.files.count_documents({})
-        logger.info(f"Total files in GridFS: {total_files}")
-        
-        if total_files == 0:
-            logger.warning("No files found in GridFS. Make sure you've uploaded resume templates first.")
+        logger.info("Indexing templates from GridFS into a new template snapshot...")
+
+        total_files = files_collection.count_documents({})
+        logger.info(f"Total templates in GridFS bucket '{TEMPLATE_BUCKET}': {total_files}")
+
+        # With a published snapshot, carry on so the templates deleted from the bucket are removed from it
+        if total_files == 0 and current_version() is None:
+            logger.warning("No templates found. Upload templates to the template bucket or run migrate_templates.py first.")
             return
-        
-        # Let's see what metadata exists
-        sample_files = list(db.fs.files.find({}).limit(5))
-        logger.info("Sample file metadata:")
-        for file_doc in sample_files:
-            logger.info(f"  File ID: {file_doc['_id']}, Filename: {file_doc.get('filename', 'N/A')}, Metadata: {file_doc.get('metadata', {})}")
-        
-        # Query all stored PDFs in GridFS (without the source filter first)
-        files_cursor = db.fs.files.find({})
-        
-        count = 0
-        for file_doc in files_cursor:
-            try:
-                file_id = file_doc["_id"]
-                filename = file_doc.get("filename", f"Template_{count+1}")
-                title = file_doc.get("metadata", {}).get("title", filename)
-                
-                logger.info(f"Processing file: {filename} (ID: {file_id})")
-                
-                # Get the file from GridFS
-                try:
-                    grid_out = fs.get(ObjectId(file_id))
-                    pdf_bytes = grid_out.read()
-                    
-                    if len(pdf_bytes) == 0:
-                        logger.warning(f"File {filename} is empty, skipping...")
-                        continue
-                    
-                    logger.info(f"Successfully read {len(pdf_bytes)} bytes from {filename}")
-                    
-                except gridfs.NoFile:
-                    logger.error(f"File with ID {file_id} not found in GridFS")
-                    continue
-                
-                # Extract text from PDF
-                try:
-                    extracted_text = extract_text_from_pdf(pdf_bytes)
-                    if not extracted_text or len(extracted_text.strip()) < 10:
-                        logger.warning(f"No meaningful text extracted from {filename}, skipping...")
-                        continue
-                    
-                    logger.info(f"Extracted {len(extracted_text)} characters from {filename}")
-                    
-                except Exception as e:
-                    logger.error(f"Error extracting text from {filename}: {e}")
-                    continue
-                
-                # Add to vector store
-                try:
-                    add_template_to_vectorstore(
-                        title=str(file_id),  # Use file_id as unique identifier
-                        content=extracted_text,
-                        metadata={
-                            "file_id": str(file_id),
-                            "title": title,
-                            "filename": filename
-                        }
-                    )
-                    count += 1
-                    logger.info(f"✅ Indexed: {title} ({file_id})")
-                    
-                except Exception as e:
-                    logger.error(f"Error adding {filename} to vector store: {e}")
+
+        checkpoint = load_checkpoint() if resume and not rebuild else None
+        snapshot = resume_snapshot(checkpoint["snapshot"]) if checkpoint and checkpoint.get("snapshot") else None
+        if snapshot is None:
+            base = None if rebuild else current_version()
+            snapshot = create_snapshot(base)
+            full = full or base is None
+        # Everything below reads and writes the snapshot being built
+        replace("template_index", snapshot)
+
+        indexed = {} if full else get_indexed_fingerprints()
+        logger.info(f"Already indexed: {len(indexed)} templates")
+
+        query = {}
+        last_id = checkpoint.get("last_id") if snapshot.version == (checkpoint or {}).get("snapshot") else None
+        if last_id:
+            logger.info(f"Resuming from checkpoint after file {last_id}")
+            query["_id"] = {"$gt": ObjectId(last_id)}
+
+        files_cursor = files_collection.find(
+            query,
+            {"filename": 1, "metadata": 1, "md5": 1, "length": 1, "uploadDate": 1}
+        ).sort("_id", 1)
+
+        start = time.perf_counter()
+        count = skipped = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_doc in files_cursor:
+                file_id = str(file_doc["_id"])
+                if indexed.get(file_id) == file_fingerprint(file_doc):
+                    skipped += 1
                     continue
-                    
-            except Exception as e:
-                logger.error(f"❌ Error processing file {file_doc.get('_id')}: {e}")
-        
-        logger.info(f"✅ Finished indexing {count} templates from GridFS into ChromaDB.")
-        
+                batch.append(file_doc)
+                if len(batch) >= batch_size:
+                    count += _index_batch(batch, template_fs, pool)
+                    save_checkpoint(str(batch[-1]["_id"]), snapshot.version)
+                    batch = []
+                    elapsed = time.perf_counter() - start
+                    logger.info(f"Indexed {count} templates ({count / elapsed:.1f} docs/sec)")
+            if batch:
+                count += _index_batch(batch, template_fs, pool)
+
+        removed = remove_deleted_templates(files_collection)
+        elapsed = time.perf_counter() - start
+        if count == 0 and removed == 0 and not full and not last_id:
+            # Identical to the published snapshot; publishing it would only reset the JD cache
+            discard(snapshot)
+            replace("template_index", open_snapshot())
+            logger.info(f"✅ All {skipped} templates are unchanged, keeping snapshot {current_version()}.")
+            return
+        rebuild_lexical_index(snapshot.collection, snapshot.lexical_path)
+        publish(snapshot, {"indexed": count, "unchanged": skipped, "removed": removed})
+        replace("template_index", open_snapshot())
+        if os.path.exists(INDEX_CHECKPOINT_PATH):
+            os.remove(INDEX_CHECKPOINT_PATH)
+        collect_garbage()
+        logger.info(
+            f"✅ Finished indexing {count} templates from GridFS into snapshot {snapshot.version} "
+            f"({skipped} unchanged, {removed} removed, {elapsed:.1f}s, {count / elapsed if elapsed else 0:.1f} docs/sec)."
+        )
+
     except Exception as e:
         logger.error(f"Error during indexing process: {e}")
     finally:
@@ -121,4 +259,12 @@ def index_templates():
             client.close()
 
 if __name__ == "__main__":
-    index_templates()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index GridFS resume templates into a new template snapshot")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INDEX_WORKERS)
+    parser.add_argument("--full", action="store_true", help="Re-index every file, ignoring fingerprints")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore any saved checkpoint")
+    parser.add_argument("--rebuild", action="store_true", help="Start from an empty snapshot and index everything")
+    args = parser.parse_args()
+    index_templates(batch_size=args.batch_size, workers=args.workers, full=args.full,
+                    resume=not args.no_resume, rebuild=args.rebuild)
@@ -0,0 +1,154 @@
+"""
+Memory-bounded ingestion of uploaded PDFs.
+
+Uploads are read in chunks, hashed as they arrive and cut off with a 413
+as soon as they pass UPLOAD_MAX_BYTES. Small files (the usual resume) stay
+in memory; larger ones are spooled to a named temp file. Parsing then works
+from that path in the process pool instead of pickling the bytes, and
+GridFS reads it chunk by chunk. RequestSizeLimitMiddleware rejects
+oversized requests before the multipart body is parsed at all.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import logging
+
+from fastapi import HTTPException
+
+from cache_utils import content_hash
+from executor_utils import run_io
+from pdf_extraction import PDFTooLargeError, PDF_MAX_BYTES
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", PDF_MAX_BYTES))
+# Chunk size for reading uploads (the GridFS chunk size)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 255 * 1024))
+# Files up to this size are kept in memory; larger ones go to INGEST_SPOOL_DIR
+INGEST_MEMORY_MAX_BYTES = int(os.getenv("INGEST_MEMORY_MAX_BYTES", 1024 * 1024))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR") or None
+# Multipart overhead allowed on top of the files themselves
+REQUEST_OVERHEAD_BYTES = 64 * 1024
+
+class IngestedFile:
+    """An uploaded file held in memory (data) or in a temp file (path), with its SHA-256"""
+
+    def __init__(self, filename: str, content_type: str, digest: str, size: int,
+                 data: bytes = None, path: str = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.digest = digest
+        self.size = size
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def from_bytes(cls, data: bytes, filename: str, content_type: str = "application/pdf") -> "IngestedFile":
+        return cls(filename, content_type, content_hash(data), len(data), data=data)
+
+    @property
+    def source(self):
+        """What pdf_extraction takes: the bytes, or the temp file path"""
+        return self.data if self.data is not None else self.path
+
+    def open(self):
+        """A fresh binary file object over the content (for GridFS puts)"""
+        return io.BytesIO(self.data) if self.data is not None else open(self.path, "rb")
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        """Delete the temp file, if there is one"""
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+async def ingest_upload(upload, max_bytes: int = UPLOAD_MAX_BYTES,
+                        memory_max_bytes: int = INGEST_MEMORY_MAX_BYTES) -> IngestedFile:
+    """
+    Read an UploadFile chunk by chunk into an IngestedFile.
+
+    Raises PDFTooLargeError (413) as soon as more than max_bytes arrived;
+    nothing past the limit is read.
+    """
+    digest = hashlib.sha256()
+    buffer, spool, size = [], None, 0
+    try:
+        while True:
+            chunk = await upload.read(INGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise PDFTooLargeError(f"{upload.filename} is larger than the {max_bytes} byte upload limit")
+            digest.update(chunk)
+            if spool is None and size > memory_max_bytes:
+                spool = await run_io(
+                    tempfile.NamedTemporaryFile, prefix="upload_", suffix=".pdf", dir=INGEST_SPOOL_DIR, delete=False
+                )
+                await run_io(spool.writelines, buffer)
+                buffer = []
+            if spool is not None:
+                await run_io(spool.write, chunk)
+            else:
+                buffer.append(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+    if spool is None:
+        return IngestedFile(upload.filename, upload.content_type, digest.hexdigest(), size, data=b"".join(buffer))
+    spool.close()
+    logger.info(f"Spooled {upload.filename} ({size} bytes) to {spool.name}")
+    return IngestedFile(upload.filename, upload.content_type, digest.hexdigest(), size, path=spool.name)
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware capping request bodies per path: a Content-Length over
+    the limit gets a 413 before anything is read, and bodies without one are
+    cut off once the limit is passed.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await send({"type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"application/json"), (b"connection", b"close")]})
+            await send({"type": "http.response.body",
+                        "body": f'{{"detail": "Request body is larger than {limit} bytes"}}'.encode()})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes the response
+                    raise HTTPException(status_code=413, detail=f"Request body is larger than {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
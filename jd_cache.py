@@ -0,0 +1,198 @@
+"""
+Near-duplicate cache for per-JD results (template matches, agent suggestions).
+
+Reposted requisitions usually differ from the original only in a date, a
+location or a footer, so they miss an exact-hash cache. Here each JD is
+normalized (lowercase, no digits or punctuation, no stopwords), cut into
+word shingles and summarized by a MinHash signature. The signature is
+split into LSH bands, and any entry sharing a band is a candidate. The
+best candidate is a hit when its estimated Jaccard similarity reaches
+JD_CACHE_THRESHOLD. A lookup is a few NumPy operations plus a dict probe
+per band.
+
+Entries belong to one version of the template index: when the version
+reported by version_source changes, the whole cache is dropped. The cache
+is in-process, so each API worker has its own.
+"""
+import hashlib
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from lexical_index import tokenize
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JD_CACHE_ENABLED = os.getenv("JD_CACHE_ENABLED", "true").lower() == "true"
+# Minimum estimated Jaccard similarity of the JDs' shingle sets for a hit
+JD_CACHE_THRESHOLD = float(os.getenv("JD_CACHE_THRESHOLD", 0.85))
+JD_CACHE_MAX_ENTRIES = int(os.getenv("JD_CACHE_MAX_ENTRIES", 5000))
+# Also reuse the agent suggestion when the same resume comes with a near-duplicate JD
+JD_CACHE_SUGGESTIONS = os.getenv("JD_CACHE_SUGGESTIONS", "false").lower() == "true"
+JD_CACHE_SUGGESTIONS_PER_ENTRY = int(os.getenv("JD_CACHE_SUGGESTIONS_PER_ENTRY", 32))
+# How often the template index version is re-read
+JD_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("JD_CACHE_VERSION_CHECK_SECONDS", 5))
+
+SHINGLE_WORDS = 3
+PERMUTATIONS = 64
+BANDS = 16  # 4 rows per band: near-certain candidates at 0.85 similarity, ~12% at 0.3
+_ROWS = PERMUTATIONS // BANDS
+
+_rng = np.random.default_rng(20240601)
+# Multiply-shift hashing: (a * x + b) mod 2^64, keep the high 32 bits
+_A = _rng.integers(1, 2 ** 63, size=PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=PERMUTATIONS, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+_DIGITS = re.compile(r"\d")
+
+def jd_tokens(text: str) -> list[str]:
+    """Normalized words: dates, ids, salaries and other numbers drop out"""
+    return [token for token in tokenize(text) if not _DIGITS.search(token)]
+
+def shingles(tokens: list[str], size: int = SHINGLE_WORDS) -> set[str]:
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def minhash(items: set[str]) -> np.ndarray:
+    # Python's string hash is salted per process, which is fine for an in-process cache
+    hashes = np.fromiter((hash(item) & 0xFFFFFFFFFFFFFFFF for item in items), dtype=np.uint64, count=len(items))
+    # uint64 arithmetic wraps around, which is the mod 2^64 we want
+    permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) >> _SHIFT
+    return permuted.min(axis=0).astype(np.uint32)
+
+@lru_cache(maxsize=256)
+def fingerprint(text: str):
+    """(exact key, MinHash signature, band keys) of a JD; cached for the stages of one request"""
+    tokens = jd_tokens(text)
+    key = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+    signature = minhash(shingles(tokens))
+    bands = tuple((band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes()) for band in range(BANDS))
+    return key, signature, bands
+
+class JDResultCache:
+    """LRU of per-JD results, found by exact key or MinHash LSH (see module docstring)"""
+
+    def __init__(self, version_source=None, threshold: float = JD_CACHE_THRESHOLD,
+                 max_entries: int = JD_CACHE_MAX_ENTRIES, enabled: bool = JD_CACHE_ENABLED):
+        self.version_source = version_source
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled and max_entries > 0
+        self._entries = OrderedDict()  # key -> entry dict
+        self._buckets = {}  # band key -> set of entry keys
+        self._version = None
+        self._version_checked = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_duplicate_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self):
+        """Drop every entry once the template index has changed"""
+        if self.version_source is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked < JD_CACHE_VERSION_CHECK_SECONDS:
+            return
+        self._version_checked = now
+        try:
+            version = self.version_source()
+        except Exception as e:
+            logger.warning(f"Could not read the template index version, clearing the JD cache: {e}")
+            version = None
+        with self._lock:
+            if version != self._version or version is None:
+                if self._entries:
+                    self._stats["invalidations"] += 1
+                    logger.info(f"Template index changed ({self._version} -> {version}); cleared {len(self._entries)} JD cache entries")
+                self._entries.clear()
+                self._buckets.clear()
+                self._version = version
+
+    def _find(self, text: str):
+        key, signature, bands = fingerprint(text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry, "exact_hits"
+        candidates = set()
+        for band in bands:
+            candidates |= self._buckets.get(band, set())
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._entries[candidate]["signature"] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = self._entries[candidate], similarity
+        return best, "near_duplicate_hits"
+
+    def lookup(self, text: str):
+        """The entry of this JD or a near-duplicate of it, or None"""
+        if not self.enabled:
+            return None
+        self._check_version()
+        with self._lock:
+            entry, kind = self._find(text)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats[kind] += 1
+            self._entries.move_to_end(entry["key"])
+            return entry
+
+    def store(self, text: str, template_matches: list[dict]) -> dict:
+        """Remember the template matches of a JD; returns its entry"""
+        self._check_version()
+        key, signature, bands = fingerprint(text)
+        entry = {"key": key, "signature": signature, "bands": bands,
+                 "template_matches": template_matches, "suggestions": OrderedDict()}
+        if not self.enabled:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        for band in entry["bands"]:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def get_suggestion(self, text: str, resume_digest: str):
+        """Agent suggestion stored for this resume with this JD (or a near-duplicate)"""
+        if not JD_CACHE_SUGGESTIONS or not self.enabled:
+            return None
+        self._check_version()
+        with self._lock:
+            entry, _ = self._find(text)
+            return entry["suggestions"].get(resume_digest) if entry is not None else None
+
+    def set_suggestion(self, text: str, resume_digest: str, suggestion: dict):
+        if not JD_CACHE_SUGGESTIONS or not self.enabled:
+            return
+        with self._lock:
+            entry, _ = self._find(text)
+            if entry is None:
+                return
+            entry["suggestions"][resume_digest] = suggestion
+            while len(entry["suggestions"]) > JD_CACHE_SUGGESTIONS_PER_ENTRY:
+                entry["suggestions"].popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "index_version": self._version}
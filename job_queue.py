@@ -0,0 +1,248 @@
+import os
+import random
+import socket
+import ipaddress
+import logging
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from bson import ObjectId
+import gridfs
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = os.getenv("JOBS_COLLECTION", "jobs")
+JOB_INPUT_BUCKET = os.getenv("JOB_INPUT_BUCKET", "job_inputs")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+# Running workers extend their lease this often, so waiting on the LLM queue never looks like a dead worker
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", JOB_LEASE_SECONDS / 3))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 5))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 7 * 24 * 3600))
+# Callback hosts allowed for jobs (comma-separated); empty allows any public host
+JOB_CALLBACK_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+# Allow callbacks to loopback and private addresses (local development only)
+JOB_CALLBACK_ALLOW_PRIVATE = os.getenv("JOB_CALLBACK_ALLOW_PRIVATE", "false").lower() == "true"
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def get_job_input_fs(db):
+    """GridFS bucket for job inputs that aren't kept elsewhere (the JD PDF)"""
+    return gridfs.GridFS(db, collection=JOB_INPUT_BUCKET)
+
+def ensure_job_indexes(db):
+    jobs = db[JOBS_COLLECTION]
+    try:
+        jobs.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="claim_queued")
+        jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="claim_expired")
+        jobs.create_index("finished_at", expireAfterSeconds=JOB_RESULT_TTL_SECONDS, name="finished_ttl")
+    except Exception as e:
+        logger.error(f"Could not create job indexes: {e}")
+
+def validate_callback_url(url: str) -> str:
+    """
+    Reject callback URLs the workers shouldn't POST to: anything but http(s),
+    hosts outside JOB_CALLBACK_ALLOWED_HOSTS, and hosts that resolve to
+    loopback, private, link-local or other internal addresses. Raises ValueError.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an http or https URL with a host")
+    host = parsed.hostname.lower()
+    if JOB_CALLBACK_ALLOWED_HOSTS and host not in JOB_CALLBACK_ALLOWED_HOSTS:
+        raise ValueError(f"callback_url host {host} is not allowed")
+    if JOB_CALLBACK_ALLOW_PRIVATE:
+        return url
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"callback_url host {host} does not resolve")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise ValueError(f"callback_url host {host} resolves to a non-public address")
+    return url
+
+def enqueue_job(db, resume_fs_id, jd_input_id, filename: str, content_type: str,
+                resume_digest: str, callback_url: str = None) -> str:
+    """Persist a queued upload job and return its id"""
+    now = _now()
+    job_id = db[JOBS_COLLECTION].insert_one({
+        "status": "queued",
+        "resume_fs_id": str(resume_fs_id),
+        "jd_input_id": str(jd_input_id),
+        "resume_filename": filename,
+        "content_type": content_type,
+        "resume_sha256": resume_digest,
+        "callback_url": callback_url,
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "created_at": now,
+        "updated_at": now,
+        "next_attempt_at": now,
+    }).inserted_id
+    return str(job_id)
+
+def claim_job(db, worker_id: str):
+    """
+    Atomically take the oldest runnable job: queued and due, or running with
+    an expired lease (its worker died) and attempts left. Every claim counts
+    as an attempt. Returns None when the queue is empty.
+    """
+    now = _now()
+    return db[JOBS_COLLECTION].find_one_and_update(
+        {"$or": [
+            {"status": "queued", "next_attempt_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now},
+             "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "started_at": now,
+                "updated_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+def reap_expired_jobs(db) -> list[dict]:
+    """Fail jobs whose lease expired on their last attempt (their worker kept dying); returns them"""
+    reaped = []
+    while True:
+        now = _now()
+        job = db[JOBS_COLLECTION].find_one_and_update(
+            {"status": "running", "lease_expires_at": {"$lt": now},
+             "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": "failed", "error": "Worker stopped responding on every attempt",
+                      "updated_at": now, "finished_at": now},
+             "$unset": {"lease_expires_at": ""}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return reaped
+        logger.error(f"Job {job['_id']} failed after {job['attempts']} attempts: its lease expired every time")
+        delete_job_input(db, job)
+        reaped.append(job)
+
+def renew_lease(db, job: dict) -> bool:
+    """Extend the lease of a job this worker still owns; False once another worker took it over"""
+    now = _now()
+    renewed = db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "worker_id": job["worker_id"], "status": "running"},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS), "updated_at": now}},
+    )
+    return renewed.matched_count == 1
+
+def delete_job_input(db, job: dict):
+    """Remove the stored JD once the job reached a terminal state"""
+    try:
+        get_job_input_fs(db).delete(ObjectId(job["jd_input_id"]))
+    except Exception as e:
+        logger.warning(f"Could not delete the input of job {job['_id']}: {e}")
+
+def complete_job(db, job: dict, result: dict, timings: dict) -> bool:
+    """Store the result; False if the lease was lost and another worker owns the job now"""
+    now = _now()
+    updated = db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "worker_id": job["worker_id"], "status": "running"},
+        {
+            "$set": {"status": "succeeded", "result": result, "timings": timings,
+                     "updated_at": now, "finished_at": now},
+            "$unset": {"lease_expires_at": "", "error": ""},
+        },
+    )
+    if updated.matched_count == 0:
+        return False
+    delete_job_input(db, job)
+    return True
+
+def fail_job(db, job: dict, error: str, timings: dict, retryable: bool = True) -> str:
+    """
+    Requeue with exponential backoff and jitter, or mark failed after the
+    last attempt. Returns the new status, or "lost" if another worker owns
+    the job now.
+    """
+    now = _now()
+    attempts = job.get("attempts", 1)
+    if retryable and attempts < job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        delay = JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+        update = {"status": "queued", "next_attempt_at": now + timedelta(seconds=delay)}
+    else:
+        update = {"status": "failed", "finished_at": now}
+    updated = db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "worker_id": job["worker_id"], "status": "running"},
+        {"$set": {**update, "error": error, "timings": timings, "updated_at": now},
+         "$unset": {"lease_expires_at": ""}},
+    )
+    if updated.matched_count == 0:
+        return "lost"
+    if update["status"] == "queued":
+        logger.warning(f"Job {job['_id']} attempt {attempts} failed, retrying in {delay:.1f}s: {error}")
+    else:
+        logger.error(f"Job {job['_id']} failed after {attempts} attempts: {error}")
+        delete_job_input(db, job)
+    return update["status"]
+
+def record_callback(db, job_id, status: str):
+    db[JOBS_COLLECTION].update_one({"_id": ObjectId(job_id)}, {"$set": {"callback_status": status}})
+
+def get_job(db, job_id: str):
+    return db[JOBS_COLLECTION].find_one({"_id": ObjectId(job_id)})
+
+def job_response(job: dict) -> dict:
+    """Public view of a job document"""
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat(),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "timings": job.get("timings"),
+        "callback_status": job.get("callback_status"),
+    }
+
+def queue_metrics(db, sample: int = 200) -> dict:
+    """Queue depth by status, age of the oldest waiting job and per-stage latency"""
+    jobs = db[JOBS_COLLECTION]
+    depth = {doc["_id"]: doc["count"] for doc in jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+
+    oldest = jobs.find_one({"status": "queued"}, sort=[("created_at", ASCENDING)], projection={"created_at": 1})
+    oldest_age = None
+    if oldest:
+        created_at = oldest["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        oldest_age = round((_now() - created_at).total_seconds(), 1)
+
+    samples = {}
+    recent = jobs.find({"status": "succeeded"}, {"timings": 1}).sort("finished_at", DESCENDING).limit(sample)
+    for job in recent:
+        for stage, seconds in (job.get("timings") or {}).items():
+            samples.setdefault(stage, []).append(seconds)
+
+    stage_latency = {}
+    for stage, values in samples.items():
+        values.sort()
+        stage_latency[stage] = {
+            "count": len(values),
+            "avg_s": round(sum(values) / len(values), 4),
+            "p95_s": values[min(int(len(values) * 0.95), len(values) - 1)],
+        }
+
+    return {
+        "queued": depth.get("queued", 0),
+        "running": depth.get("running", 0),
+        "succeeded": depth.get("succeeded", 0),
+        "failed": depth.get("failed", 0),
+        "oldest_queued_age_s": oldest_age,
+        "stage_latency": stage_latency,
+    }
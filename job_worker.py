@@ -0,0 +1,204 @@
+"""
+Worker pool for upload jobs queued with /upload/?mode=job.
+
+Each worker process claims jobs from MongoDB atomically, runs the same
+parse/store/analysis/retrieval/suggestion pipeline as the synchronous
+endpoint, and retries failures with exponential backoff. A running job's
+lease is renewed every JOB_HEARTBEAT_SECONDS; jobs whose worker died are
+picked up again once their lease expires (failed once they run out of
+attempts), so workers can be added, removed or restarted at any time:
+
+    python job_worker.py --processes 4 --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import httpx
+from bson import ObjectId
+
+import resources
+from resources import get_db, get_fs
+from pipeline import timed, parse_inputs, analyze_parsed
+from job_queue import (
+    get_job_input_fs, claim_job, complete_job, fail_job, record_callback, renew_lease, reap_expired_jobs,
+    validate_callback_url, JOB_HEARTBEAT_SECONDS
+)
+from executor_utils import run_io, shutdown_pools
+from pdf_extraction import PDFExtractionError
+from template_snapshots import watch_snapshots
+from ingest import IngestedFile
+from metrics import install_request_logging, request_id
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1.0))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+JOB_CALLBACK_TIMEOUT_SECONDS = float(os.getenv("JOB_CALLBACK_TIMEOUT_SECONDS", 10))
+JOB_CALLBACK_ATTEMPTS = int(os.getenv("JOB_CALLBACK_ATTEMPTS", 3))
+
+class PermanentJobError(Exception):
+    """A failure that retrying won't fix (e.g. a PDF without text)"""
+
+async def post_callback(http, url: str, payload: dict) -> str:
+    """POST the job outcome to its callback URL, retrying transient failures"""
+    try:
+        # Checked again here: the host may resolve differently than when the job was queued
+        await run_io(validate_callback_url, url)
+    except ValueError as e:
+        logger.warning(f"Not calling back {url}: {e}")
+        return "rejected"
+    for attempt in range(JOB_CALLBACK_ATTEMPTS):
+        try:
+            response = await http.post(url, json=payload)
+            if response.status_code < 500:
+                return f"http_{response.status_code}"
+        except Exception as e:
+            logger.warning(f"Callback to {url} failed (attempt {attempt + 1}): {e}")
+        await asyncio.sleep(2 ** attempt)
+    return "failed"
+
+async def hold_lease(db, job: dict):
+    """Renew the job's lease until cancelled, so a long wait (e.g. for the LLM) doesn't hand the job to another worker"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            if not await run_io(renew_lease, db, job):
+                logger.warning(f"Lost the lease on job {job['_id']}; its result will be discarded")
+                return
+        except Exception as e:
+            logger.warning(f"Could not renew the lease on job {job['_id']}: {e}")
+
+async def process_job(job: dict, http):
+    db = get_db()
+    # Each slot runs in its own task, so this only tags this job's log lines
+    request_id.set(f"job-{job['_id']}")
+    heartbeat = asyncio.create_task(hold_lease(db, job))
+    try:
+        payload = await run_job(job)
+    finally:
+        heartbeat.cancel()
+
+    if payload is not None and job.get("callback_url"):
+        callback_status = await post_callback(http, job["callback_url"], payload)
+        await run_io(record_callback, db, str(job["_id"]), callback_status)
+
+async def run_job(job: dict):
+    """Run the pipeline and record the outcome; returns the callback payload once the job is final"""
+    db, fs = get_db(), get_fs()
+    job_id = str(job["_id"])
+    timings = {}
+    start = time.perf_counter()
+    try:
+        resume_bytes, jd_bytes = await timed(timings, "load", asyncio.gather(
+            run_io(lambda: fs.get(ObjectId(job["resume_fs_id"])).read()),
+            run_io(lambda: get_job_input_fs(db).get(ObjectId(job["jd_input_id"])).read())
+        ))
+        resume = IngestedFile.from_bytes(resume_bytes, job["resume_filename"], job["content_type"])
+        jd = IngestedFile.from_bytes(jd_bytes, "jd.pdf")
+        resume_text, jd_text = await parse_inputs(resume, jd, timings)
+        if not resume_text or not jd_text:
+            raise PermanentJobError("Could not extract text from one or more PDF files")
+
+        result = await analyze_parsed(resume, resume_text, jd_text, endpoint="job", timings=timings)
+        timings["total"] = round(time.perf_counter() - start, 4)
+        if not await run_io(complete_job, db, job, result, timings):
+            logger.warning(f"Job {job_id} finished after another worker took it over; result discarded")
+            return None
+        logger.info(f"Job {job_id} succeeded in {timings['total']}s")
+        return {"job_id": job_id, "status": "succeeded", "result": result}
+    except Exception as e:
+        timings["total"] = round(time.perf_counter() - start, 4)
+        status = await run_io(
+            fail_job, db, job, str(e), timings, not isinstance(e, (PermanentJobError, PDFExtractionError))
+        )
+        if status != "failed":
+            return None
+        return {"job_id": job_id, "status": "failed", "error": str(e)}
+
+async def fail_abandoned_jobs(db, http):
+    """Fail jobs whose worker died on every attempt, and report them to their callbacks"""
+    for job in await run_io(reap_expired_jobs, db):
+        if job.get("callback_url"):
+            job_id = str(job["_id"])
+            payload = {"job_id": job_id, "status": "failed", "error": job["error"]}
+            callback_status = await post_callback(http, job["callback_url"], payload)
+            await run_io(record_callback, db, job_id, callback_status)
+
+async def worker_slot(worker_id: str, http, stop: asyncio.Event):
+    """Claim and run jobs one at a time until asked to stop"""
+    db = get_db()
+    while not stop.is_set():
+        await fail_abandoned_jobs(db, http)
+        job = await run_io(claim_job, db, worker_id)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        logger.info(f"{worker_id} claimed job {job['_id']} (attempt {job['attempts']})")
+        await process_job(job, http)
+
+async def run_worker(worker_id: str, concurrency: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Pick up template snapshots published while the worker runs
+    snapshot_watcher = asyncio.create_task(watch_snapshots())
+    async with httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT_SECONDS) as http:
+        await asyncio.gather(*(
+            worker_slot(f"{worker_id}/{slot}", http, stop) for slot in range(concurrency)
+        ))
+    snapshot_watcher.cancel()
+    await resources.aclose()
+    shutdown_pools()
+    logger.info(f"{worker_id} stopped")
+
+def worker_main(index: int, concurrency: int):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    install_request_logging()
+    logger.info(f"Starting job worker {worker_id} with {concurrency} slots")
+    asyncio.run(run_worker(worker_id, concurrency))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run upload job workers")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY,
+                        help="Jobs each process runs at once")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        worker_main(0, args.concurrency)
+        return
+
+    # Spawn rather than fork so no process inherits another's Mongo/HTTP connection pools
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=worker_main, args=(i, args.concurrency)) for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Children got the same SIGINT and finish their current jobs
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import os
+import re
+import logging
+import threading
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.npz")
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+
+# Keeps skill tokens such as c++, c#, node.js and ci/cd intact
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#./-]*[a-z0-9+#]|[a-z0-9]")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+you your we our they their he she i me my us not but if so than then there these those who whom which
+""".split())
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+class LexicalIndex:
+    """
+    BM25 index over template text in compact CSR arrays.
+
+    Each document's term ids and frequencies are stored contiguously
+    (indptr/indices/tf) alongside per-term idf and per-document lengths, so
+    scoring a few dozen ANN candidates is a handful of NumPy operations.
+    """
+
+    def __init__(self, ids, vocab, indptr, indices, tf, doc_len, idf):
+        self.ids = list(ids)
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.indices = indices
+        self.tf = tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+    @classmethod
+    def build(cls, ids: list[str], documents: list[str]) -> "LexicalIndex":
+        vocab, indptr, indices, tf, doc_len = {}, [0], [], [], []
+        for document in documents:
+            counts = {}
+            tokens = tokenize(document or "")
+            for token in tokens:
+                term = vocab.setdefault(token, len(vocab))
+                counts[term] = counts.get(term, 0) + 1
+            for term in sorted(counts):
+                indices.append(term)
+                tf.append(counts[term])
+            indptr.append(len(indices))
+            doc_len.append(len(tokens))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        df = np.bincount(indices, minlength=len(vocab)).astype(np.float32)
+        n_docs = len(documents)
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return cls(
+            ids,
+            sorted(vocab, key=vocab.get),
+            np.asarray(indptr, dtype=np.int64),
+            indices,
+            np.asarray(tf, dtype=np.float32),
+            np.asarray(doc_len, dtype=np.float32),
+            idf,
+        )
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        tmp_path = path + ".tmp.npz"
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            tmp_path,
+            ids=np.asarray(self.ids, dtype=str),
+            vocab=np.asarray(vocab, dtype=str),
+            indptr=self.indptr,
+            indices=self.indices,
+            tf=self.tf,
+            doc_len=self.doc_len,
+            idf=self.idf,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["ids"].tolist(), data["vocab"].tolist(), data["indptr"], data["indices"],
+                data["tf"], data["doc_len"], data["idf"]
+            )
+
+    def score(self, query: str, ids: list[str]) -> dict:
+        """BM25 score of the query against each of the given document ids"""
+        query_terms = np.unique([self.vocab[t] for t in tokenize(query) if t in self.vocab]).astype(np.int32)
+        scores = {}
+        for doc_id in ids:
+            row = self.rows.get(doc_id)
+            if row is None or not len(query_terms):
+                scores[doc_id] = 0.0
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            terms, freqs = self.indices[start:end], self.tf[start:end]
+            hit = np.isin(terms, query_terms, assume_unique=True)
+            freqs = freqs[hit]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[row] / (self.avg_len or 1.0))
+            scores[doc_id] = float(np.sum(self.idf[terms[hit]] * freqs * (BM25_K1 + 1) / (freqs + norm)))
+        return scores
+
+# path -> (mtime, index); one entry per served template snapshot
+_cached = {}
+_lock = threading.Lock()
+
+def get_lexical_index(path: str = LEXICAL_INDEX_PATH):
+    """Load the index once and reload it only when the file changes; None if absent"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        cached = _cached.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = _cached[path] = (mtime, LexicalIndex.load(path))
+                logger.info(f"Loaded lexical index with {len(cached[1].ids)} templates from {path}")
+            except Exception as e:
+                logger.error(f"Could not load lexical index {path}: {e}")
+                return None
+        return cached[1]
+
+def forget_lexical_index(path: str):
+    """Drop a cached index that is no longer served"""
+    with _lock:
+        _cached.pop(path, None)
+
+def rebuild_lexical_index(collection, path: str = LEXICAL_INDEX_PATH) -> int:
+    """Rebuild the BM25 index from every document in the template collection"""
+    results = collection.get(include=["documents"])
+    index = LexicalIndex.build(results["ids"], results["documents"])
+    index.save(path)
+    logger.info(f"Built lexical index over {len(index.ids)} templates ({len(index.vocab)} terms)")
+    return len(index.ids)
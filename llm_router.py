@@ -0,0 +1,212 @@
+import json
+import os
+import logging
+from contextlib import contextmanager
+
+import openai
+from pydantic import BaseModel, Field, ValidationError
+
+from agent_utils import count_tokens, log_token_usage
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o")
+# Resumes up to this many tokens count as "simple" for automatic routing
+ROUTE_SIMPLE_MAX_TOKENS = int(os.getenv("ROUTE_SIMPLE_MAX_TOKENS", 1200))
+# A top template this far ahead of the runner-up is an easy pick for the fast model
+ROUTE_CLEAR_WINNER_MARGIN = float(os.getenv("ROUTE_CLEAR_WINNER_MARGIN", 0.15))
+
+# Model families that accept response_format=json_schema (strict structured output)
+STRUCTURED_OUTPUT_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+class CategoryScore(BaseModel):
+    score: int = Field(description="Score from 0 to 10")
+    justification: str
+
+class ResumeAnalysis(BaseModel):
+    skills: CategoryScore
+    experience: CategoryScore
+    education: CategoryScore
+    overall_score: int = Field(description="Overall score from 0 to 10")
+    summary: str
+    strengths: list[str]
+    improvements: list[str]
+
+class TemplateSuggestion(BaseModel):
+    template_number: int = Field(description="Number (1-3) of the chosen template in the list")
+    justification: str
+
+class StructuredOutputError(Exception):
+    """The model refused, was cut off, or returned output that doesn't match the schema"""
+
+def supports_structured_output(model: str) -> bool:
+    return model.startswith(STRUCTURED_OUTPUT_PREFIXES)
+
+def _resolve(choice: str) -> str:
+    return {"fast": LLM_FAST_MODEL, "large": LLM_LARGE_MODEL}.get(choice, choice)
+
+def _configured_route(stage: str, endpoint: str) -> str:
+    """Route setting: LLM_ROUTE_<ENDPOINT>_<STAGE>, then LLM_ROUTE_<STAGE>, then auto"""
+    stage_key = stage.upper()
+    if endpoint:
+        override = os.getenv(f"LLM_ROUTE_{endpoint.upper()}_{stage_key}")
+        if override:
+            return override
+    return os.getenv(f"LLM_ROUTE_{stage_key}", "auto")
+
+def route_analysis_model(resume_text: str, endpoint: str = "") -> str:
+    """Short resumes go to the fast model; long ones to the large model"""
+    route = _configured_route("analysis", endpoint)
+    if route != "auto":
+        return _resolve(route)
+    tokens = count_tokens(resume_text, LLM_FAST_MODEL)
+    model = LLM_FAST_MODEL if tokens <= ROUTE_SIMPLE_MAX_TOKENS else LLM_LARGE_MODEL
+    logger.info(f"Routing analysis ({tokens} tokens) to {model}")
+    return model
+
+def route_suggestion_model(template_matches: list[dict], endpoint: str = "") -> str:
+    """A clear winner among the matches goes to the fast model; close calls to the large one"""
+    route = _configured_route("agent_suggestion", endpoint)
+    if route != "auto":
+        return _resolve(route)
+    scores = sorted((m.get("similarity_score", 0.0) for m in template_matches), reverse=True)
+    clear = len(scores) < 2 or scores[0] - scores[1] >= ROUTE_CLEAR_WINNER_MARGIN
+    model = LLM_FAST_MODEL if clear else LLM_LARGE_MODEL
+    logger.info(f"Routing agent suggestion ({'clear' if clear else 'close'} match) to {model}")
+    return model
+
+def _parsed(completion, stage: str, model: str) -> BaseModel:
+    """The parsed object of a structured completion, or StructuredOutputError"""
+    choice = completion.choices[0]
+    if getattr(choice.message, "refusal", None):
+        raise StructuredOutputError(f"{model} refused the {stage} request: {choice.message.refusal}")
+    if choice.message.parsed is None:
+        raise StructuredOutputError(f"{model} returned no {stage} output (finish_reason={choice.finish_reason})")
+    return choice.message.parsed
+
+@contextmanager
+def _finish_reason_errors(stage: str, model: str):
+    """Turn the SDK's length and content-filter errors into StructuredOutputError, keeping the usage"""
+    try:
+        yield
+    except (openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError) as e:
+        completion = getattr(e, "completion", None)
+        if completion is not None:
+            log_token_usage(stage, model, completion.usage)
+        raise StructuredOutputError(f"{model} stopped before finishing the {stage} output: {e}") from e
+
+def _validate(schema: type[BaseModel], content: str, stage: str, model: str) -> BaseModel:
+    try:
+        return schema.model_validate_json(content or "")
+    except ValidationError as e:
+        raise StructuredOutputError(f"Malformed {stage} output from {model}: {e}") from e
+
+def _json_instructions(schema: type[BaseModel]) -> str:
+    return (
+        "\n\nRespond with only a JSON object matching this JSON schema:\n"
+        + json.dumps(schema.model_json_schema())
+    )
+
+async def structured_completion(client, model: str, prompt: str, schema: type[BaseModel],
+                                stage: str) -> BaseModel:
+    """
+    One chat completion parsed into `schema`.
+
+    Models with structured output get a strict json_schema response format;
+    older models get the schema in the prompt and their reply is validated,
+    with a single retry if it doesn't parse. A refusal, a truncated reply or
+    output that still doesn't parse raises StructuredOutputError.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    if supports_structured_output(model):
+        with _finish_reason_errors(stage, model):
+            response = await client.chat.completions.parse(model=model, messages=messages, response_format=schema)
+        log_token_usage(stage, model, response.usage)
+        return _parsed(response, stage, model)
+
+    messages = [{"role": "user", "content": prompt + _json_instructions(schema)}]
+    for attempt in range(2):
+        response = await client.chat.completions.create(model=model, messages=messages)
+        log_token_usage(stage, model, response.usage)
+        try:
+            return _validate(schema, response.choices[0].message.content, stage, model)
+        except StructuredOutputError as e:
+            logger.warning(f"{e} (attempt {attempt + 1})")
+            if attempt:
+                raise
+
+def structured_completion_sync(client, model: str, prompt: str, schema: type[BaseModel],
+                               stage: str) -> BaseModel:
+    """Blocking variant of structured_completion for scripts and background tasks"""
+    messages = [{"role": "user", "content": prompt}]
+    if supports_structured_output(model):
+        with _finish_reason_errors(stage, model):
+            response = client.chat.completions.parse(model=model, messages=messages, response_format=schema)
+        log_token_usage(stage, model, response.usage)
+        return _parsed(response, stage, model)
+
+    messages = [{"role": "user", "content": prompt + _json_instructions(schema)}]
+    for attempt in range(2):
+        response = client.chat.completions.create(model=model, messages=messages)
+        log_token_usage(stage, model, response.usage)
+        try:
+            return _validate(schema, response.choices[0].message.content, stage, model)
+        except StructuredOutputError as e:
+            logger.warning(f"{e} (attempt {attempt + 1})")
+            if attempt:
+                raise
+
+async def stream_structured_completion(client, model: str, prompt: str, schema: type[BaseModel],
+                                       stage: str, result: dict):
+    """
+    Yield raw JSON text deltas of a structured completion; the parsed object
+    is stored in result["parsed"] once the stream ends. Raises
+    StructuredOutputError like structured_completion.
+    """
+    if not supports_structured_output(model):
+        parts = []
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt + _json_instructions(schema)}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    log_token_usage(stage, model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+        result["parsed"] = _validate(schema, "".join(parts), stage, model)
+        return
+
+    with _finish_reason_errors(stage, model):
+        async with client.chat.completions.stream(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format=schema,
+            stream_options={"include_usage": True},
+        ) as stream:
+            async for event in stream:
+                if event.type == "content.delta":
+                    yield event.delta
+            completion = await stream.get_final_completion()
+    log_token_usage(stage, model, completion.usage)
+    result["parsed"] = _parsed(completion, stage, model)
+
+def suggestion_payload(suggestion: TemplateSuggestion, template_matches: list[dict]) -> dict:
+    """Attach the chosen template's id and title to the model's pick"""
+    index = min(max(suggestion.template_number, 1), len(template_matches)) - 1
+    chosen = template_matches[index] if template_matches else {}
+    return {
+        "template_number": index + 1,
+        "template_file_id": chosen.get("template_file_id"),
+        "template_title": chosen.get("template_title"),
+        "justification": suggestion.justification,
+    }
@@ -0,0 +1,473 @@
+"""
+Admission control for LLM chat and embedding calls.
+
+Every OpenAI call goes through the scheduler, which does three things:
+
+- Budgets: requests/min and tokens/min per model, kept as token buckets in
+  a store all workers share. The store is a locked JSON file for the
+  uvicorn and job workers of one host (LLM_RATE_BACKEND=file), a MongoDB
+  collection for several hosts (mongo) or process memory (local). A call
+  reserves its prompt tokens plus LLM_COMPLETION_TOKEN_ESTIMATE up front,
+  and the difference is settled once the API reports the real usage. A
+  call the API never accepted (429, connection error) is refunded; one
+  that timed out, was cancelled or broke off mid-stream keeps its
+  reservation, since the provider may have counted it.
+- Priorities: each event loop runs at most MAX_CONCURRENT_LLM_CALLS calls
+  at a time. Free slots go to interactive uploads first, then queued jobs,
+  then batch ranking and indexing (see PRIORITIES).
+- Back-pressure: 429s, connection errors and 5xx responses are retried
+  with full-jitter exponential backoff. A 429 also pauses the model's
+  shared bucket for its Retry-After, so all workers back off together. A
+  full queue, or a wait longer than the caller's limit, raises
+  LLMOverloadedError, which the API turns into a 503 with Retry-After.
+
+The OpenAI clients are built without their own retries, so that every
+attempt is counted against the budget.
+"""
+import asyncio
+import contextvars
+import fcntl
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import logging
+import weakref
+from contextlib import asynccontextmanager
+
+import openai
+
+from executor_utils import run_io
+from metrics import LLM_QUEUE_SECONDS, LLM_REJECTIONS, LLM_RETRIES
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_RATE_BACKEND = os.getenv("LLM_RATE_BACKEND", "file")  # "file", "mongo" or "local"
+LLM_RATE_FILE = os.getenv("LLM_RATE_FILE", os.path.join(tempfile.gettempdir(), "resume_analyzer_llm_budget.json"))
+# Per-model budgets; 0 turns a limit off. Override per model with
+# LLM_RATE_LIMITS='{"gpt-4": {"rpm": 500, "tpm": 10000}}'
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# Completion tokens reserved per chat call until the real usage is known
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", 600))
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", 8))
+# Calls waiting for a slot beyond this are turned away at once
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", 64))
+# How long a call may wait for a slot and budget: interactive vs background callers
+LLM_MAX_WAIT_SECONDS = float(os.getenv("LLM_MAX_WAIT_SECONDS", 20))
+LLM_BACKGROUND_MAX_WAIT_SECONDS = float(os.getenv("LLM_BACKGROUND_MAX_WAIT_SECONDS", 300))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 20))
+LLM_RATE_COLLECTION = "llm_rate_limits"
+
+# Lower runs first; endpoints not listed run as "job"
+PRIORITIES = {"upload": 0, "search": 0, "job": 1, "batch": 2, "index": 3}
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class LLMOverloadedError(Exception):
+    """The LLM queue or rate budget can't take the call now; retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def limits_for(model: str) -> tuple[float, float]:
+    """(requests/min, tokens/min) budget of a model"""
+    configured = LLM_RATE_LIMITS.get(model, {})
+    return (float(configured.get("rpm", LLM_REQUESTS_PER_MINUTE)),
+            float(configured.get("tpm", LLM_TOKENS_PER_MINUTE)))
+
+def estimate_tokens(text: str, model: str = None, completion_tokens: int = LLM_COMPLETION_TOKEN_ESTIMATE) -> int:
+    """Tokens to reserve for a call: the prompt plus the expected completion"""
+    if model is None:
+        return len(text) // 4 + completion_tokens
+    from agent_utils import count_tokens
+    return count_tokens(text, model) + completion_tokens
+
+# Token buckets. A bucket state is {"requests", "tokens", "updated", "blocked_until"};
+# both buckets hold at most one minute of budget and refill continuously.
+
+def _refill(state: dict, limits: tuple, now: float):
+    rpm, tpm = limits
+    if "updated" not in state:
+        state.update(requests=rpm, tokens=tpm, updated=now, blocked_until=0.0)
+    elapsed = max(now - state["updated"], 0.0)
+    state["requests"] = min(rpm, state["requests"] + elapsed * rpm / 60)
+    state["tokens"] = min(tpm, state["tokens"] + elapsed * tpm / 60)
+    state["updated"] = now
+
+def _take(state: dict, limits: tuple, tokens: float, now: float) -> float:
+    """Reserve one request and `tokens`; returns 0, or the seconds to wait before trying again"""
+    rpm, tpm = limits
+    _refill(state, limits, now)
+    if state["blocked_until"] > now:
+        return state["blocked_until"] - now
+    # A call larger than the whole bucket would otherwise never fit
+    tokens = min(tokens, tpm)
+    wait = 0.0
+    if rpm and state["requests"] < 1:
+        wait = (1 - state["requests"]) * 60 / rpm
+    if tpm and state["tokens"] < tokens:
+        wait = max(wait, (tokens - state["tokens"]) * 60 / tpm)
+    if wait:
+        return wait
+    state["requests"] -= 1 if rpm else 0
+    state["tokens"] -= tokens if tpm else 0
+    return 0.0
+
+class LocalBudgetStore:
+    """Bucket states in process memory"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, change):
+        with self._lock:
+            return change(self._states.setdefault(key, {}))
+
+class FileBudgetStore:
+    """Bucket states in a JSON file, changed under an exclusive lock (workers of one host)"""
+
+    def __init__(self, path: str = LLM_RATE_FILE):
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    def update(self, key: str, change):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path) as f:
+                        states = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    states = {}
+                result = change(states.setdefault(key, {}))
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(states, f)
+                os.replace(tmp_path, self.path)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+class MongoBudgetStore:
+    """Bucket states in MongoDB, changed with compare-and-set on a version field (any number of hosts)"""
+
+    def __init__(self, db):
+        self.collection = db[LLM_RATE_COLLECTION]
+
+    def update(self, key: str, change):
+        from pymongo.errors import DuplicateKeyError
+        for _ in range(20):
+            doc = self.collection.find_one({"_id": key}) or {"_id": key, "version": 0, "state": {}}
+            state = doc["state"]
+            result = change(state)
+            try:
+                if doc["version"] == 0:
+                    self.collection.insert_one({"_id": key, "version": 1, "state": state})
+                    return result
+                updated = self.collection.update_one(
+                    {"_id": key, "version": doc["version"]},
+                    {"$set": {"state": state}, "$inc": {"version": 1}}
+                )
+                if updated.modified_count:
+                    return result
+            except DuplicateKeyError:
+                pass
+        raise RuntimeError(f"Could not update the LLM budget for {key}: too much contention")
+
+class RateBudget:
+    """Requests/min and tokens/min token buckets per model, on a shared store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def try_acquire(self, model: str, tokens: float) -> float:
+        limits = limits_for(model)
+        if not any(limits):
+            return 0.0
+        return self.store.update(model, lambda state: _take(state, limits, tokens, time.time()))
+
+    def settle(self, model: str, extra_tokens: float):
+        """Charge (or refund, when negative) the difference between reserved and actual tokens"""
+        limits = limits_for(model)
+        if not limits[1] or not extra_tokens:
+            return
+
+        def change(state):
+            _refill(state, limits, time.time())
+            state["tokens"] = min(limits[1], state["tokens"] - extra_tokens)
+
+        self.store.update(model, change)
+
+    def block(self, model: str, seconds: float):
+        """Stop every worker from calling the model for a while (after a 429)"""
+        limits = limits_for(model)
+        if not any(limits):
+            return
+
+        def change(state):
+            now = time.time()
+            _refill(state, limits, now)
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+
+        self.store.update(model, change)
+
+def build_budget(backend: str = None) -> RateBudget:
+    backend = backend or LLM_RATE_BACKEND
+    if backend == "mongo":
+        from resources import get_db
+        db = get_db()
+        if db is not None:
+            return RateBudget(MongoBudgetStore(db))
+        logger.warning("MongoDB is unavailable; LLM rate budgets fall back to the local file")
+        backend = "file"
+    if backend == "file":
+        return RateBudget(FileBudgetStore())
+    if backend == "local":
+        return RateBudget(LocalBudgetStore())
+    raise ValueError(f"Unknown LLM rate backend: {backend}")
+
+class _Ticket:
+    """Tokens reserved by an admitted call and the usage the API reported for it"""
+
+    def __init__(self, model: str, reserved: int):
+        self.model = model
+        self.reserved = reserved
+        self.used = 0
+        # Set once a stream passed on its first delta: the API has accepted the call
+        self.started = False
+
+_ticket = contextvars.ContextVar("llm_ticket", default=None)
+
+def _settlement(ticket: _Ticket, error: BaseException = None) -> float:
+    """Tokens to charge (negative: refund) when a ticket is released"""
+    if ticket.used:
+        return ticket.used - ticket.reserved
+    # Rejected before the API accepted it: nothing was spent (a timeout is a connection error sent too late)
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)) and \
+            not isinstance(error, openai.APITimeoutError) and not ticket.started:
+        return -ticket.reserved
+    # Usage unknown (cancelled, timed out, failed mid-stream): keep the reservation as the estimate
+    return 0
+
+def record_actual_tokens(tokens: int):
+    """Report the API's token usage for the call being made (settled when it is released)"""
+    ticket = _ticket.get()
+    if ticket is not None:
+        ticket.used += tokens
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return 0.0
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Full jitter, but never sooner than the server's Retry-After"""
+    return max(random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt)),
+               _retry_after(error))
+
+def _priority(endpoint: str) -> int:
+    return PRIORITIES.get(endpoint, PRIORITIES["job"])
+
+def _max_wait(endpoint: str) -> float:
+    return LLM_MAX_WAIT_SECONDS if _priority(endpoint) == 0 else LLM_BACKGROUND_MAX_WAIT_SECONDS
+
+def _on_retryable(budget: RateBudget, model: str, attempt: int, error: Exception, max_wait: float) -> float:
+    """
+    Record a failed attempt and return the backoff. Raises once retries are
+    exhausted or the backoff is longer than the caller may wait.
+    """
+    delay = _backoff(attempt, error)
+    LLM_RETRIES.inc(1, model, type(error).__name__)
+    if isinstance(error, openai.RateLimitError):
+        budget.block(model, _retry_after(error) or delay)
+    if attempt >= LLM_MAX_RETRIES or delay > max_wait:
+        if isinstance(error, openai.RateLimitError):
+            LLM_REJECTIONS.inc(1, "rate_limited")
+            raise LLMOverloadedError(f"{model} is rate limited", delay) from error
+        raise error
+    logger.warning(f"{type(error).__name__} from {model} (attempt {attempt + 1}), retrying in {delay:.1f}s")
+    return delay
+
+class LLMScheduler:
+    """Priority-ordered LLM call slots for one event loop, in front of the shared budget"""
+
+    def __init__(self, budget: RateBudget, concurrency: int = MAX_CONCURRENT_LLM_CALLS):
+        self.budget = budget
+        self.concurrency = concurrency
+        self._active = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._call_seconds = 2.0  # moving average, for Retry-After estimates
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued call would get a slot"""
+        return (self.queue_depth() + 1) / self.concurrency * self._call_seconds
+
+    def check(self, endpoint: str = "upload"):
+        """Turn a call away right now if the queue is full (before doing any work for it)"""
+        if self.queue_depth() >= LLM_QUEUE_MAX:
+            LLM_REJECTIONS.inc(1, "queue_full")
+            raise LLMOverloadedError(f"Too many LLM calls queued ({LLM_QUEUE_MAX})", self.retry_after())
+
+    async def _acquire_slot(self, priority: int, deadline: float):
+        if self._active < self.concurrency and not self.queue_depth():
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await asyncio.wait_for(future, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            LLM_REJECTIONS.inc(1, "queue_timeout")
+            raise LLMOverloadedError("Timed out waiting for an LLM slot", self.retry_after()) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller went away
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        self._active -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._active += 1
+                future.set_result(None)
+                return
+
+    async def _acquire_budget(self, model: str, tokens: int, deadline: float):
+        while True:
+            wait = await run_io(self.budget.try_acquire, model, tokens)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                LLM_REJECTIONS.inc(1, "budget")
+                raise LLMOverloadedError(f"The {model} rate budget is exhausted", wait)
+            # Jitter keeps the waiting workers from retrying in lockstep
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+    @asynccontextmanager
+    async def admit(self, model: str, tokens: int, endpoint: str = "upload"):
+        """Hold a slot and `tokens` of the model's budget for the duration of one call"""
+        self.check(endpoint)
+        start = time.monotonic()
+        deadline = start + _max_wait(endpoint)
+        await self._acquire_slot(_priority(endpoint), deadline)
+        try:
+            await self._acquire_budget(model, tokens, deadline)
+            LLM_QUEUE_SECONDS.observe(time.monotonic() - start, endpoint)
+            ticket = _Ticket(model, tokens)
+            previous = _ticket.get()
+            _ticket.set(ticket)
+            call_start = time.monotonic()
+            error = None
+            try:
+                yield ticket
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _ticket.set(previous)
+                self._call_seconds = 0.8 * self._call_seconds + 0.2 * (time.monotonic() - call_start)
+                extra_tokens = _settlement(ticket, error)
+                if extra_tokens:
+                    await run_io(self.budget.settle, model, extra_tokens)
+        finally:
+            self._release_slot()
+
+    async def call(self, model: str, tokens: int, endpoint: str, make_call):
+        """Await make_call() under admission control, retrying transient API errors"""
+        for attempt in itertools.count():
+            try:
+                async with self.admit(model, tokens, endpoint):
+                    return await make_call()
+            except RETRYABLE_ERRORS as e:
+                delay = await run_io(_on_retryable, self.budget, model, attempt, e, _max_wait(endpoint))
+            await asyncio.sleep(delay)
+
+    async def stream(self, model: str, tokens: int, endpoint: str, make_stream):
+        """
+        Yield from make_stream() under admission control. Transient errors are
+        retried only until the first delta has been passed on.
+        """
+        for attempt in itertools.count():
+            started = False
+            try:
+                async with self.admit(model, tokens, endpoint) as ticket:
+                    async for delta in make_stream():
+                        started = ticket.started = True
+                        yield delta
+                    return
+            except RETRYABLE_ERRORS as e:
+                if started:
+                    raise
+                delay = await run_io(_on_retryable, self.budget, model, attempt, e, _max_wait(endpoint))
+            await asyncio.sleep(delay)
+
+_schedulers = weakref.WeakKeyDictionary()
+
+def get_scheduler() -> LLMScheduler:
+    """The scheduler of the running event loop (slots are per loop, the budget is shared)"""
+    from resources import get_llm_budget
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = LLMScheduler(get_llm_budget())
+    return scheduler
+
+def call_sync(model: str, tokens: int, make_call, endpoint: str = "index"):
+    """
+    Blocking admission for calls made from threads and scripts (embeddings,
+    the synchronous analysis): waits for the shared budget and retries
+    transient errors, without the per-loop slots.
+    """
+    from resources import get_llm_budget
+    budget = get_llm_budget()
+    max_wait = _max_wait(endpoint)
+    for attempt in itertools.count():
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = budget.try_acquire(model, tokens)
+            if not wait:
+                break
+            if time.monotonic() + wait > deadline:
+                LLM_REJECTIONS.inc(1, "budget")
+                raise LLMOverloadedError(f"The {model} rate budget is exhausted", wait)
+            time.sleep(wait + random.uniform(0, 0.05))
+        ticket = _Ticket(model, tokens)
+        previous = _ticket.get()
+        _ticket.set(ticket)
+        error = None
+        try:
+            return make_call()
+        except BaseException as e:
+            error = e
+            if not isinstance(e, RETRYABLE_ERRORS):
+                raise
+            delay = _on_retryable(budget, model, attempt, e, max_wait)
+        finally:
+            _ticket.set(previous)
+            budget.settle(model, _settlement(ticket, error))
+        time.sleep(delay)
@@ -0,0 +1,266 @@
+"""
+Request tracing and Prometheus metrics for the API and the job workers.
+
+- stage_timer()/observe_stage() record per-stage latency histograms
+  (parse, store, embedding, vector_query, analysis, suggestion, ...)
+- record_llm_usage() counts tokens and estimated cost per model and stage
+- request_id is a context variable that is added to every log line and
+  carried into run_io() threads and asyncio tasks
+- RequestTracingMiddleware assigns request ids, times requests and runs the
+  opt-in sampling profiler
+
+render_metrics() returns the Prometheus text format served on /metrics.
+Metrics live in process memory, so each uvicorn worker reports its own.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "resume_analyzer")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# USD per 1M tokens (input, output); extend or override with LLM_PRICES='{"model": [in, out]}'
+LLM_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    **{model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()},
+}
+# Sampling profiler: off unless PROFILE_REQUESTS=true; then requests sent with
+# "X-Profile: 1", plus a random PROFILE_SAMPLE_RATE share of all requests
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+request_id = contextvars.ContextVar("request_id", default="-")
+_SAFE_ID = re.compile(r"[^A-Za-z0-9._:-]")
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = _labels(self.labelnames, labels, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labelnames, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+REQUEST_SECONDS = Histogram(
+    f"{METRICS_PREFIX}_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    f"{METRICS_PREFIX}_stage_duration_seconds", "Latency of each pipeline stage", ("stage", "outcome")
+)
+LLM_CALLS = Counter(f"{METRICS_PREFIX}_llm_calls_total", "LLM API calls", ("model", "stage"))
+LLM_TOKENS = Counter(f"{METRICS_PREFIX}_llm_tokens_total", "LLM tokens", ("model", "stage", "kind"))
+LLM_COST = Counter(f"{METRICS_PREFIX}_llm_cost_usd_total", "Estimated LLM cost in USD", ("model", "stage"))
+LLM_QUEUE_SECONDS = Histogram(
+    f"{METRICS_PREFIX}_llm_queue_seconds", "Wait for an LLM slot and rate budget", ("endpoint",)
+)
+LLM_REJECTIONS = Counter(f"{METRICS_PREFIX}_llm_rejections_total", "LLM calls turned away", ("reason",))
+LLM_RETRIES = Counter(f"{METRICS_PREFIX}_llm_retries_total", "Retried LLM API errors", ("model", "error"))
+REGISTRY = [
+    REQUEST_SECONDS, STAGE_SECONDS, LLM_CALLS, LLM_TOKENS, LLM_COST,
+    LLM_QUEUE_SECONDS, LLM_REJECTIONS, LLM_RETRIES
+]
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+def observe_stage(stage: str, seconds: float, outcome: str = "ok"):
+    STAGE_SECONDS.observe(seconds, stage, outcome)
+
+@contextmanager
+def stage_timer(stage: str, timings: dict = None):
+    """Time a block as a pipeline stage (and record it in timings, if given)"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        observe_stage(stage, elapsed, outcome)
+        if timings is not None:
+            timings[stage] = round(elapsed, 4)
+
+def _price(model: str):
+    # Dated snapshots ("gpt-4o-2024-08-06") are priced as their family; longest prefix wins
+    for name in sorted(LLM_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return LLM_PRICES[name]
+    return None
+
+def record_llm_usage(stage: str, model: str, input_tokens: int, output_tokens: int = 0):
+    """Count one LLM call's tokens and estimated cost"""
+    LLM_CALLS.inc(1, model, stage)
+    LLM_TOKENS.inc(input_tokens, model, stage, "input")
+    LLM_TOKENS.inc(output_tokens, model, stage, "output")
+    price = _price(model)
+    if price is not None:
+        LLM_COST.inc((input_tokens * price[0] + output_tokens * price[1]) / 1e6, model, stage)
+
+def install_request_logging():
+    """Add the current request id to every log record and to the root handlers' format"""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "adds_request_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = request_id.get()
+        return record
+
+    record_factory.adds_request_id = True
+    logging.setLogRecordFactory(record_factory)
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:[%(request_id)s] %(message)s"))
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (the event loop) every interval and
+    writes the counts in collapsed-stack format, ready for flamegraph.pl or
+    speedscope. Concurrent requests share the loop, so their frames show up too.
+    """
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, path: str) -> str:
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def _wants_profile(headers: dict) -> bool:
+    if not PROFILE_REQUESTS:
+        return False
+    return headers.get(b"x-profile") == b"1" or random.random() < PROFILE_SAMPLE_RATE
+
+class RequestTracingMiddleware:
+    """
+    ASGI middleware: take X-Request-ID from the client (or make one up),
+    echo it on the response, time the request by route template and
+    optionally profile it. Streaming responses are timed until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        # Client-supplied ids end up in log lines, so only keep safe characters
+        rid = _SAFE_ID.sub("", headers.get(b"x-request-id", b"").decode("latin-1"))[:64] or uuid.uuid4().hex[:16]
+        token = request_id.set(rid)
+        status = {"code": 500}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        profiler = SamplingProfiler(threading.get_ident()).start() if _wants_profile(headers) else None
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, scope["method"],
+                getattr(route, "path", "unmatched"), status["code"]
+            )
+            if profiler is not None:
+                path = profiler.stop(os.path.join(PROFILE_DIR, f"{rid}.collapsed"))
+                logger.info(f"Wrote request profile to {path}")
+            request_id.reset(token)
@@ -0,0 +1,84 @@
+from mongo_utils import get_mongodb_connection, get_template_fs, ensure_indexes, TEMPLATE_BUCKET
+from lexical_index import rebuild_lexical_index
+from resources import get_template_index, replace
+from template_snapshots import create_snapshot, open_snapshot, publish
+import argparse
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_UPLOAD_SOURCE = "user_upload"
+
+def move_templates(db, fs, template_fs, dry_run: bool = False) -> int:
+    """
+    Move every non-user-upload file from the default GridFS bucket into the
+    template bucket, keeping its _id so existing download URLs keep working.
+    """
+    moved = 0
+    cursor = db.fs.files.find({"metadata.source": {"$ne": USER_UPLOAD_SOURCE}})
+    for file_doc in cursor:
+        file_id = file_doc["_id"]
+        filename = file_doc.get("filename", str(file_id))
+        if dry_run:
+            logger.info(f"[dry-run] Would move {filename} ({file_id}) to '{TEMPLATE_BUCKET}'")
+            moved += 1
+            continue
+        try:
+            if not template_fs.exists(file_id):
+                metadata = dict(file_doc.get("metadata") or {})
+                metadata["source"] = "template"
+                if file_doc.get("uploadDate"):
+                    metadata["original_upload_date"] = file_doc["uploadDate"]
+                template_fs.put(fs.get(file_id).read(), _id=file_id, filename=filename, metadata=metadata)
+            fs.delete(file_id)
+            moved += 1
+            logger.info(f"Moved {filename} ({file_id}) to '{TEMPLATE_BUCKET}'")
+        except Exception as e:
+            logger.error(f"Error moving {filename} ({file_id}): {e}")
+    return moved
+
+def prune_vectors(db, dry_run: bool = False, batch_size: int = 500) -> int:
+    """Delete template vectors whose file_id is not a template in the template bucket"""
+    template_ids = {str(doc["_id"]) for doc in db[f"{TEMPLATE_BUCKET}.files"].find({}, {"_id": 1})}
+    served = get_template_index()
+    results = served.collection.get(include=["metadatas"])
+    stale = [
+        doc_id for doc_id, metadata in zip(results["ids"], results["metadatas"])
+        if (metadata or {}).get("file_id", doc_id) not in template_ids
+    ]
+    logger.info(f"{len(stale)} of {len(results['ids'])} vectors are not templates")
+    if not dry_run and stale:
+        # Published snapshots are never modified: prune a copy and publish that
+        index = create_snapshot(served.version) if served.version else served
+        for i in range(0, len(stale), batch_size):
+            index.collection.delete(ids=stale[i:i + batch_size])
+        rebuild_lexical_index(index.collection, index.lexical_path)
+        if index.version:
+            publish(index, {"pruned": len(stale)})
+            replace("template_index", open_snapshot())
+    return len(stale)
+
+def migrate_templates(dry_run: bool = False):
+    client, db, fs = get_mongodb_connection()
+
+    if not client:
+        logger.error("MongoDB connection failed.")
+        return
+
+    try:
+        ensure_indexes(db)
+        moved = move_templates(db, fs, get_template_fs(db), dry_run=dry_run)
+        pruned = prune_vectors(db, dry_run=dry_run)
+        logger.info(f"✅ Migration finished: {moved} templates moved, {pruned} vectors pruned{' (dry run)' if dry_run else ''}.")
+    except Exception as e:
+        logger.error(f"Error during migration: {e}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move templates out of the user-upload GridFS bucket and prune ChromaDB")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+    migrate_templates(dry_run=args.dry_run)
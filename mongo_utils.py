@@ -1,6 +1,6 @@
 import os
 import logging
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 import gridfs
 from dotenv import load_dotenv
 
@@ -9,7 +9,23 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_mongodb_connection():
+# Resume templates live in their own GridFS bucket, separate from user uploads
+TEMPLATE_BUCKET = os.getenv("TEMPLATE_BUCKET", "templates")
+
+# Connection pool per MongoClient; each process should hold a single client
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
+def get_mongodb_connection(verify: bool = False):
+    """
+    Build a pooled MongoClient for MONGODB_URI.
+
+    MongoClient connects in the background, so this returns immediately and
+    doesn't touch the network unless verify=True (ping plus collection list,
+    for debugging). Long-running code should use the shared client from
+    resources.py instead of calling this again.
+    """
     # Fixed: Use MONGODB_URI instead of MONGO_URI to match your .env file
     uri = os.getenv("MONGODB_URI")
     db_name = os.getenv("MONGODB_DB_NAME", "resume_database")
@@ -19,19 +35,40 @@ def get_mongodb_connection():
         return None, None, None
     
     try:
-        client = MongoClient(uri)
+        client = MongoClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+        )
         db = client[db_name]
         fs = gridfs.GridFS(db)
         
-        # Test the connection
-        client.admin.command('ping')
-        logger.info("Connected to MongoDB Atlas successfully")
-        
-        # Log database and collection info
-        logger.info(f"Database: {db_name}")
-        logger.info(f"Collections: {db.list_collection_names()}")
+        if verify:
+            # Test the connection
+            client.admin.command('ping')
+            logger.info("Connected to MongoDB Atlas successfully")
+            
+            # Log database and collection info
+            logger.info(f"Database: {db_name}")
+            logger.info(f"Collections: {db.list_collection_names()}")
         
         return client, db, fs
     except Exception as e:
         logger.error(f"MongoDB Connection Error: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+def get_template_fs(db):
+    """GridFS bucket holding resume templates (user uploads stay in the default bucket)"""
+    return gridfs.GridFS(db, collection=TEMPLATE_BUCKET)
+
+def ensure_indexes(db):
+    """Create the compound indexes used to filter files by source and upload date"""
+    for bucket in ("fs", TEMPLATE_BUCKET):
+        try:
+            db[f"{bucket}.files"].create_index(
+                [("metadata.source", ASCENDING), ("uploadDate", DESCENDING)],
+                name="source_uploadDate"
+            )
+        except Exception as e:
+            logger.error(f"Could not create indexes on {bucket}.files: {e}")
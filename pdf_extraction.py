@@ -0,0 +1,219 @@
+"""
+PDF text extraction engines with page, size and time limits.
+
+PyMuPDF is the fast default; pdfminer.six is the fallback when PyMuPDF can't
+open a file (or when PDF_ENGINE=pdfminer). Pages come out of iter_pages() one
+at a time, and extract_text_async() splits large documents into page ranges
+that are parsed in parallel on the CPU process pool. Files with no text on
+their first pages are rejected early as image-only (scanned) PDFs.
+
+The time limit is checked between pages, so in the synchronous functions a
+single pathological page can overrun it. extract_text_async() also enforces
+it from outside the worker: a page still running past the deadline gets the
+worker process killed.
+
+Every function takes the PDF as bytes or as a file path (large uploads are
+spooled to disk, and a path is much cheaper to hand to a worker process).
+This module only depends on the PDF libraries so process pool workers stay light.
+"""
+import asyncio
+import io
+import os
+import time
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pymupdf")
+PDF_FALLBACK_ENGINE = os.getenv("PDF_FALLBACK_ENGINE", "pdfminer")
+# Pages beyond this are ignored; larger files are rejected outright
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 30))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", 20 * 1024 * 1024))
+PDF_MAX_SECONDS = float(os.getenv("PDF_MAX_SECONDS", 20))
+# How long extract_text_async() waits past the deadline for a worker to notice it before killing it
+PDF_KILL_GRACE_SECONDS = float(os.getenv("PDF_KILL_GRACE_SECONDS", 1))
+# Documents with at least this many pages are split across the process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 8))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 4))
+# Image-only detection: fewer than this many characters on the first probe pages
+# (raise it to also reject scans with only stray header or page-number text)
+PDF_PROBE_PAGES = int(os.getenv("PDF_PROBE_PAGES", 2))
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", 1))
+
+class PDFExtractionError(Exception):
+    """The PDF can't be turned into text; status_code is the HTTP status to report"""
+    status_code = 400
+
+class PDFTooLargeError(PDFExtractionError):
+    status_code = 413
+
+class PDFTimeoutError(PDFExtractionError):
+    status_code = 422
+
+class ImageOnlyPDFError(PDFExtractionError):
+    status_code = 422
+
+def _open_binary(source):
+    """A binary file object over PDF bytes or a PDF file path"""
+    return open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+
+def source_size(source) -> int:
+    return os.path.getsize(source) if isinstance(source, str) else len(source)
+
+class PyMuPDFEngine:
+    name = "pymupdf"
+
+    def _open(self, source):
+        import fitz  # PyMuPDF
+        return fitz.open(source, filetype="pdf") if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+
+    def page_count(self, pdf_bytes) -> int:
+        with self._open(pdf_bytes) as doc:
+            return doc.page_count
+
+    def iter_pages(self, pdf_bytes, start: int, stop: int):
+        with self._open(pdf_bytes) as doc:
+            for number in range(start, min(stop, doc.page_count)):
+                yield doc.load_page(number).get_text()
+
+class PdfMinerEngine:
+    name = "pdfminer"
+
+    def page_count(self, pdf_bytes) -> int:
+        from pdfminer.pdfpage import PDFPage
+        with _open_binary(pdf_bytes) as f:
+            return sum(1 for _ in PDFPage.get_pages(f))
+
+    def iter_pages(self, pdf_bytes, start: int, stop: int):
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        with _open_binary(pdf_bytes) as f:
+            for layout in extract_pages(f, page_numbers=range(start, stop)):
+                yield "".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+
+ENGINES = {engine.name: engine for engine in (PyMuPDFEngine(), PdfMinerEngine())}
+
+def get_engine(name: str = None):
+    name = name or PDF_ENGINE
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown PDF engine: {name}")
+
+def _check_size(pdf_bytes, max_bytes: int):
+    size = source_size(pdf_bytes)
+    if size > max_bytes:
+        raise PDFTooLargeError(f"PDF is {size} bytes; the limit is {max_bytes}")
+
+def _check_deadline(deadline: float, max_seconds: float):
+    if deadline is not None and time.monotonic() > deadline:
+        raise PDFTimeoutError(f"PDF text extraction took longer than {max_seconds}s")
+
+def _check_probe(pages: list[str], min_chars: int = PDF_MIN_TEXT_CHARS):
+    if pages and sum(len(page.strip()) for page in pages) < min_chars:
+        raise ImageOnlyPDFError("PDF has no extractable text (scanned or image-only)")
+
+def open_document(pdf_bytes: bytes, engine_name: str = None, max_bytes: int = PDF_MAX_BYTES):
+    """Check the size limit and return (engine, page_count), falling back if the engine can't open it"""
+    _check_size(pdf_bytes, max_bytes)
+    engine = get_engine(engine_name)
+    try:
+        return engine, engine.page_count(pdf_bytes)
+    except Exception as e:
+        fallback = ENGINES.get(PDF_FALLBACK_ENGINE)
+        if fallback is None or fallback is engine:
+            raise PDFExtractionError(f"Could not read PDF: {e}")
+        logger.warning(f"{engine.name} could not open PDF, falling back to {fallback.name}: {e}")
+        try:
+            return fallback, fallback.page_count(pdf_bytes)
+        except Exception as fallback_error:
+            raise PDFExtractionError(f"Could not read PDF: {fallback_error}")
+
+def iter_pages(pdf_bytes: bytes, engine_name: str = None, max_pages: int = PDF_MAX_PAGES,
+               max_seconds: float = PDF_MAX_SECONDS, max_bytes: int = PDF_MAX_BYTES):
+    """
+    Yield the text of each page, in order, within the page/byte/time limits.
+
+    The first PDF_PROBE_PAGES pages are checked before anything is yielded,
+    so image-only files fail fast instead of after parsing every page. The
+    time limit is checked between pages, not while one is being parsed.
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    engine, page_count = open_document(pdf_bytes, engine_name, max_bytes)
+    if page_count > max_pages:
+        logger.warning(f"PDF has {page_count} pages; only the first {max_pages} are extracted")
+
+    pages = engine.iter_pages(pdf_bytes, 0, min(page_count, max_pages))
+    probe = []
+    for text in pages:
+        _check_deadline(deadline, max_seconds)
+        probe.append(text)
+        if len(probe) == PDF_PROBE_PAGES:
+            break
+    _check_probe(probe)
+    yield from probe
+    for text in pages:
+        _check_deadline(deadline, max_seconds)
+        yield text
+
+def extract_text(pdf_bytes: bytes, engine_name: str = None, **limits) -> str:
+    return "\n".join(iter_pages(pdf_bytes, engine_name, **limits)).strip()
+
+def extract_page_range(pdf_bytes: bytes, engine_name: str, start: int, stop: int,
+                       deadline: float = None, max_seconds: float = PDF_MAX_SECONDS) -> list[str]:
+    """Text of pages [start, stop); a process pool task of extract_text_async"""
+    pages = []
+    for text in get_engine(engine_name).iter_pages(pdf_bytes, start, stop):
+        _check_deadline(deadline, max_seconds)
+        pages.append(text)
+    return pages
+
+async def _run_until(deadline: float, limit: float, func, *args, **kwargs):
+    """A process pool call that is abandoned, and its worker killed, once the deadline has passed"""
+    from executor_utils import run_cpu
+
+    timeout = max(deadline - time.monotonic(), 0) + PDF_KILL_GRACE_SECONDS if deadline is not None else None
+    try:
+        return await run_cpu(func, *args, timeout=timeout, **kwargs)
+    except asyncio.TimeoutError:
+        raise PDFTimeoutError(f"PDF text extraction took longer than {limit}s")
+
+async def extract_text_async(pdf_bytes: bytes, engine_name: str = None, max_pages: int = PDF_MAX_PAGES,
+                             max_seconds: float = PDF_MAX_SECONDS, max_bytes: int = PDF_MAX_BYTES) -> str:
+    """
+    Extract text off the event loop. Small documents are parsed in one
+    process pool task; large ones are probed for text first and then split
+    into page ranges that are parsed in parallel. The time limit covers the
+    whole call, queueing for a worker included, and holds even inside a page.
+    """
+    from executor_utils import MAX_CPU_WORKERS
+
+    _check_size(pdf_bytes, max_bytes)
+    # time.monotonic() is system-wide on Linux, so workers can share the deadline
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    engine, page_count = await _run_until(deadline, max_seconds, open_document, pdf_bytes, engine_name, max_bytes)
+    pages_to_read = min(page_count, max_pages)
+    # Splitting only pays off with more than one worker process to spread pages over
+    if pages_to_read < PDF_PARALLEL_MIN_PAGES or MAX_CPU_WORKERS < 2:
+        return await _run_until(deadline, max_seconds, extract_text, pdf_bytes, engine.name, max_pages=max_pages,
+                                max_seconds=max_seconds, max_bytes=max_bytes)
+    if page_count > max_pages:
+        logger.warning(f"PDF has {page_count} pages; only the first {max_pages} are extracted")
+
+    probe = await _run_until(deadline, max_seconds, extract_page_range, pdf_bytes, engine.name,
+                             0, PDF_PROBE_PAGES, deadline, max_seconds)
+    _check_probe(probe)
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, pages_to_read))
+              for start in range(PDF_PROBE_PAGES, pages_to_read, PDF_PAGES_PER_TASK)]
+    tasks = [asyncio.ensure_future(_run_until(deadline, max_seconds, extract_page_range, pdf_bytes, engine.name,
+                                              start, stop, deadline, max_seconds))
+             for start, stop in ranges]
+    try:
+        chunks = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return "\n".join(probe + [text for chunk in chunks for text in chunk]).strip()
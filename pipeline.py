@@ -0,0 +1,245 @@
+from functions import get_gpt_analysis_async
+from pdf_extraction import extract_text_async
+from rag_utils import search_similar_template
+from agent_utils import format_agent_prompt
+from llm_router import (
+    TemplateSuggestion, StructuredOutputError, route_suggestion_model, structured_completion,
+    stream_structured_completion, suggestion_payload
+)
+from candidate_index import index_candidate
+from ingest import IngestedFile
+from executor_utils import run_io
+from llm_scheduler import get_scheduler, estimate_tokens
+from resources import get_fs, get_content_cache, get_async_openai_client, get_jd_cache
+from metrics import observe_stage
+from bson import ObjectId
+from dotenv import load_dotenv
+import os
+import time
+import asyncio
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+async def get_pdf_text(pdf_source, digest: str) -> str:
+    """Extract PDF text (from bytes or a spooled file path), reusing the cached result for identical content"""
+    content_cache = get_content_cache()
+    text = await run_io(content_cache.get, digest, "text")
+    if text is None:
+        text = await extract_text_async(pdf_source)
+        if text:
+            await run_io(content_cache.set, digest, text=text)
+    return text
+
+def analysis_unavailable(error: Exception) -> dict:
+    """Stands in for the analysis when the model refused or its output was unusable (never cached)"""
+    logger.warning(f"Resume analysis unavailable: {error}")
+    return {"error": "Analysis unavailable", "detail": str(error)}
+
+def suggestion_unavailable(error: Exception, top_template_matches: list[dict]) -> dict:
+    """Falls back to the best-scoring template when the model's pick was unusable (never cached)"""
+    logger.warning(f"Agent suggestion unavailable, using the top match: {error}")
+    return suggestion_payload(
+        TemplateSuggestion(template_number=1, justification="Suggestion unavailable; this is the closest match."),
+        top_template_matches
+    )
+
+async def get_resume_analysis(resume_text: str, digest: str, endpoint: str = "upload") -> dict:
+    """GPT analysis of a resume, skipped when these exact bytes were analyzed before"""
+    content_cache = get_content_cache()
+    analysis = await run_io(content_cache.get, digest, "analysis")
+    # Entries cached before structured output are free text; recompute those
+    if not isinstance(analysis, dict):
+        try:
+            analysis = await get_gpt_analysis_async(resume_text, endpoint)
+        except StructuredOutputError as e:
+            return analysis_unavailable(e)
+        await run_io(content_cache.set, digest, analysis=analysis)
+    return analysis
+
+def store_resume(resume: IngestedFile):
+    """Store a resume in GridFS unless an identical file is already stored"""
+    fs, content_cache = get_fs(), get_content_cache()
+    cached_id = content_cache.get(resume.digest, "gridfs_id")
+    if cached_id is not None:
+        if fs.exists(ObjectId(cached_id)):
+            return cached_id
+        content_cache.invalidate(resume.digest, "gridfs_id")
+
+    # GridFS reads the file object one chunk at a time
+    with resume.open() as f:
+        resume_fs_id = fs.put(
+            f,
+            filename=resume.filename,
+            metadata={
+                "source": "user_upload",
+                "original_filename": resume.filename,
+                "content_type": resume.content_type,
+                "file_size": resume.size,
+                "sha256": resume.digest
+            }
+        )
+    content_cache.set(resume.digest, gridfs_id=str(resume_fs_id))
+    return resume_fs_id
+
+async def index_stored_resume(store_task, resume: IngestedFile, resume_text: str, endpoint: str = "upload"):
+    """Add a resume to the candidate index once it is stored (best effort)"""
+    resume_fs_id = await store_task
+    await run_io(index_candidate, resume_fs_id, resume_text, resume.filename, resume.digest, endpoint=endpoint)
+
+def match_templates(jd_text: str, endpoint: str = "upload") -> list[dict]:
+    """Template search, reusing the matches of the same or a near-duplicate JD"""
+    jd_cache = get_jd_cache()
+    entry = jd_cache.lookup(jd_text)
+    if entry is not None:
+        return entry["template_matches"]
+    matches = search_similar_template(
+        jd_text, top_k=3, score_threshold=float(os.getenv("SCORE_THRESHOLD", 0.7)), endpoint=endpoint
+    )
+    # Placeholders (search errors, empty index) are not worth remembering
+    if any(match.get("template_file_id") for match in matches):
+        jd_cache.store(jd_text, matches)
+    return matches
+
+async def find_template_matches(jd_text: str, endpoint: str = "upload") -> list[dict]:
+    """Template search for a JD, with a placeholder when nothing matches"""
+    top_template_matches = await run_io(match_templates, jd_text, endpoint)
+    
+    if not top_template_matches:
+        logger.warning("No template matches found above threshold")
+        top_template_matches = [{
+            "template_number": 1,
+            "template_title": "No Strong Match",
+            "template_preview_text": "No strong match found, but here's the closest resume template we have.",
+            "template_file_id": None,
+            "similarity_score": 0.0,
+            "download_url": None,
+            "metadata": {"category": "General"}
+        }]
+    return top_template_matches
+
+def build_agent_prompt(jd_text: str, resume_text: str, top_template_matches: list[dict], endpoint: str):
+    """Pick the model for the agent suggestion and build its prompt within that model's budget"""
+    model = route_suggestion_model(top_template_matches, endpoint)
+    prompt = format_agent_prompt(
+        jd_text,
+        resume_text,
+        [match["template_preview_text"] for match in top_template_matches],
+        model=model
+    )
+    return model, prompt
+
+async def get_agent_suggestion(jd_text: str, resume_text: str, top_template_matches: list[dict],
+                               endpoint: str = "upload", resume_digest: str = None) -> dict:
+    """
+    Structured template pick from the agent prompt. With JD_CACHE_SUGGESTIONS,
+    the pick made for this resume and a near-duplicate JD is reused.
+    """
+    jd_cache = get_jd_cache()
+    if resume_digest is not None:
+        cached = jd_cache.get_suggestion(jd_text, resume_digest)
+        if cached is not None:
+            return cached
+
+    model, prompt = build_agent_prompt(jd_text, resume_text, top_template_matches, endpoint)
+    try:
+        suggestion = await get_scheduler().call(
+            model, estimate_tokens(prompt, model), endpoint,
+            lambda: structured_completion(get_async_openai_client(), model, prompt, TemplateSuggestion, "agent_suggestion")
+        )
+    except StructuredOutputError as e:
+        return suggestion_unavailable(e, top_template_matches)
+    payload = suggestion_payload(suggestion, top_template_matches)
+    if resume_digest is not None:
+        jd_cache.set_suggestion(jd_text, resume_digest, payload)
+    return payload
+
+async def stream_agent_suggestion(jd_text: str, resume_text: str, top_template_matches: list[dict],
+                                  result: dict, endpoint: str = "upload"):
+    """Yield the suggestion JSON as it is generated; the payload lands in result["suggestion"]"""
+    model, prompt = build_agent_prompt(jd_text, resume_text, top_template_matches, endpoint)
+    parsed = {}
+    try:
+        async for delta in get_scheduler().stream(
+            model, estimate_tokens(prompt, model), endpoint,
+            lambda: stream_structured_completion(
+                get_async_openai_client(), model, prompt, TemplateSuggestion, "agent_suggestion", parsed
+            )
+        ):
+            yield delta
+    except StructuredOutputError as e:
+        result["suggestion"] = suggestion_unavailable(e, top_template_matches)
+        return
+    result["suggestion"] = suggestion_payload(parsed["parsed"], top_template_matches)
+
+async def timed(timings: dict, stage: str, awaitable):
+    """Await a stage, record its wall time (seconds) under timings[stage] and in the stage histogram"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await awaitable
+        outcome = "ok"
+        return result
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe_stage(stage, elapsed, outcome)
+        if timings is not None:
+            timings[stage] = round(elapsed, 4)
+
+async def parse_inputs(resume: IngestedFile, jd: IngestedFile, timings: dict = None):
+    """Parse both PDFs; returns (resume_text, jd_text)"""
+    # Parse PDFs in the process pool so the event loop stays free
+    return await timed(timings, "parse", asyncio.gather(
+        get_pdf_text(resume.source, resume.digest),
+        get_pdf_text(jd.source, jd.digest)
+    ))
+
+async def analyze_parsed(resume: IngestedFile, resume_text: str, jd_text: str, endpoint: str = "upload",
+                         timings: dict = None) -> dict:
+    """
+    Store, analyze and match a parsed resume/JD pair.
+
+    GridFS store, resume analysis and template search start together; the
+    agent suggestion only waits on the template search. The stored resume
+    is added to the candidate index while the suggestion runs.
+    """
+    store_task = asyncio.create_task(timed(timings, "store", run_io(store_resume, resume)))
+    analysis_task = asyncio.create_task(timed(timings, "analysis", get_resume_analysis(resume_text, resume.digest, endpoint)))
+    search_task = asyncio.create_task(timed(timings, "retrieval", find_template_matches(jd_text, endpoint)))
+    index_task = asyncio.create_task(timed(
+        timings, "candidate_index", index_stored_resume(store_task, resume, resume_text, endpoint)
+    ))
+    pending = [store_task, analysis_task, search_task, index_task]
+
+    try:
+        # The agent prompt only depends on the template search
+        top_template_matches = await search_task
+
+        # Use agent prompt to suggest best match
+        final_suggestion = await timed(
+            timings, "suggestion",
+            get_agent_suggestion(jd_text, resume_text, top_template_matches, endpoint, resume.digest)
+        )
+
+        resume_fs_id, analysis, _ = await asyncio.gather(store_task, analysis_task, index_task)
+        logger.info(f"Stored resume in GridFS with ID: {resume_fs_id}")
+    finally:
+        # Don't leave stages running (and spending tokens) after a failure
+        for task in pending:
+            if not task.done():
+                task.cancel()
+
+    return {
+        "resume_fs_id": str(resume_fs_id),
+        "resume_download_url": f"/download_resume/{resume_fs_id}",
+        "analysis": analysis,
+        "final_suggestion": final_suggestion,
+        "template_matches": top_template_matches
+    }
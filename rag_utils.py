@@ -1,6 +1,8 @@
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
+from resources import get_embedder, get_template_collection, get_template_index
+from vector_store import get_space
+from lexical_index import get_lexical_index
+from metrics import stage_timer
+from llm_scheduler import LLMOverloadedError
 import os
 import logging
 
@@ -8,122 +10,194 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ChromaDB with persistent storage
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
+# Raw cosine similarities from text-embedding-3-small rarely leave [0.2, 0.6];
+# they are stretched linearly onto [0, 1] so SCORE_THRESHOLD is meaningful
+SCORE_CALIBRATION_LOW = float(os.getenv("SCORE_CALIBRATION_LOW", 0.2))
+SCORE_CALIBRATION_HIGH = float(os.getenv("SCORE_CALIBRATION_HIGH", 0.6))
+# Hybrid reranking: fetch top_k * multiplier ANN candidates and blend in BM25
+RERANK_CANDIDATE_MULTIPLIER = int(os.getenv("RERANK_CANDIDATE_MULTIPLIER", 5))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 0.3))
+# Templates are indexed as section chunks; fetch enough chunks to cover the candidates
+CHUNKS_PER_TEMPLATE = int(os.getenv("CHUNKS_PER_TEMPLATE", 4))
+# Per-template score from its chunk hits: "max", "mean" or "max_mean" (max plus a share of the mean)
+TEMPLATE_SCORE_AGGREGATION = os.getenv("TEMPLATE_SCORE_AGGREGATION", "max_mean")
+CHUNK_MEAN_WEIGHT = float(os.getenv("CHUNK_MEAN_WEIGHT", 0.25))
+PREVIEW_CHARS = 500
 
-# Use OpenAI embeddings
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model_name="text-embedding-3-small"
-)
+# Embeddings are computed by the shared embedder (disk-cached and batched) and
+# passed to the template collection explicitly; both are built on first use
 
-# Collection name
-collection = chroma_client.get_or_create_collection(
-    name="resume_templates",
-    embedding_function=openai_ef
-)
+def template_index_version() -> str:
+    """
+    Changes whenever the served template index does: the snapshot version,
+    or for the legacy in-place index the lexical index mtime (every indexing
+    run ends by rebuilding it) and the vector count (direct edits)
+    """
+    index = get_template_index()
+    if index.version:
+        return index.version
+    try:
+        mtime = os.path.getmtime(index.lexical_path)
+    except OSError:
+        mtime = 0.0
+    return f"{index.collection.count()}:{mtime}"
 
-def add_template_to_vectorstore(title: str, content: str, metadata: dict):
-    """Add a single resume template to ChromaDB"""
+def distance_to_cosine(distance: float, space: str) -> float:
+    """Convert a store distance back to cosine similarity (embeddings are unit length)"""
+    if space == "l2":
+        # Chroma's l2 is squared Euclidean: ||a - b||^2 = 2 - 2cos
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+def calibrate_score(cosine: float) -> float:
+    """Map raw cosine similarity onto a 0-1 match score"""
+    span = SCORE_CALIBRATION_HIGH - SCORE_CALIBRATION_LOW
+    return min(max((cosine - SCORE_CALIBRATION_LOW) / span, 0.0), 1.0)
+
+def add_templates_to_vectorstore(ids: list[str], contents: list[str], metadatas: list[dict]):
+    """Add a batch of resume templates to ChromaDB with one embedding call"""
     try:
-        collection.add(
-            documents=[content],
-            ids=[title],
-            metadatas=[metadata]
+        get_template_collection().upsert(
+            ids=ids,
+            documents=contents,
+            embeddings=get_embedder().embed(contents),
+            metadatas=metadatas
         )
-        logger.info(f"Successfully added template {title} to ChromaDB")
+        logger.info(f"Successfully added {len(ids)} templates to ChromaDB")
     except Exception as e:
-        logger.error(f"Error adding template {title} to ChromaDB: {e}")
+        logger.error(f"Error adding {len(ids)} templates to ChromaDB: {e}")
         raise
 
-def search_similar_template(text: str, top_k=3, score_threshold=0.5):
+def add_template_to_vectorstore(title: str, content: str, metadata: dict):
+    """Add a single resume template to ChromaDB"""
+    add_templates_to_vectorstore([title], [content], [metadata])
+
+def aggregate_scores(scores: list[float], method: str = TEMPLATE_SCORE_AGGREGATION) -> float:
+    """Combine the scores of a template's chunk hits into one template score"""
+    best, mean = max(scores), sum(scores) / len(scores)
+    if method == "max":
+        return best
+    if method == "mean":
+        return mean
+    return (1 - CHUNK_MEAN_WEIGHT) * best + CHUNK_MEAN_WEIGHT * mean
+
+def _template_match(number: int, doc: str, metadata: dict, score: float, semantic: float, lexical: float) -> dict:
+    file_id = metadata.get("file_id")
+    return {
+        "template_number": number,
+        "template_title": metadata.get("title", f"Template {number}"),
+        "template_filename": metadata.get("filename", "unknown.pdf"),
+        # The best-matching section of the template, truncated with ellipsis
+        "template_preview_text": doc[:PREVIEW_CHARS] + "..." if len(doc) > PREVIEW_CHARS else doc,
+        "matched_section": metadata.get("section"),
+        "template_file_id": file_id,
+        "similarity_score": round(score, 3),
+        "semantic_score": round(semantic, 3),
+        "lexical_score": round(lexical, 3),
+        "download_url": f"/download_template_by_id/{file_id}" if file_id else None,
+        "metadata": {
+            "category": metadata.get("category", "General"),
+            "upload_date": metadata.get("upload_date", None),
+            "file_type": metadata.get("file_type", "application/pdf")
+        }
+    }
+
+def search_similar_template(text: str, top_k=3, score_threshold=0.5, endpoint: str = "upload"):
     """
-    Semantic search for similar resume templates with enhanced metadata and scoring
+    Hybrid search for similar resume templates.
+
+    A larger set of ANN candidates is fetched by cosine similarity, then
+    reranked in-process by blending the calibrated semantic score with a
+    normalized BM25 score from the lexical index. Candidates are template
+    section chunks; they are grouped by template, scored with
+    aggregate_scores(), and the best chunk becomes the preview.
     
     Args:
         text (str): The text to search against (usually job description)
         top_k (int): Number of results to return
-        score_threshold (float): Minimum similarity score (0-1)
+        score_threshold (float): Minimum hybrid score (0-1)
+        endpoint (str): Caller, for the priority of the query embedding
     
     Returns:
         list: List of template matches with metadata and scores
     """
     try:
-        logger.info(f"Searching for templates with text length: {len(text)}")
-        logger.info(f"Using score threshold: {score_threshold}")
-        
-        # Query with distances to get similarity scores
-        results = collection.query(
-            query_texts=[text],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )
+        logger.debug(f"Searching for templates with text length: {len(text)}, threshold: {score_threshold}")
+
+        # One handle for the whole search, so a snapshot swap can't mix two versions
+        index = get_template_index()
+        collection = index.collection
+        n_candidates = max(top_k * RERANK_CANDIDATE_MULTIPLIER * CHUNKS_PER_TEMPLATE, top_k)
+        with stage_timer("embedding"):
+            query_embedding = get_embedder().embed_one(text, endpoint)
+        with stage_timer("vector_query"):
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_candidates,
+                include=["documents", "metadatas", "distances"]
+            )
 
+        ids = results.get("ids", [[]])[0]
         documents = results.get("documents", [[]])[0]
-        metadatas = results.get("metadatas", [[]])[0]
+        metadatas = [metadata or {} for metadata in results.get("metadatas", [[]])[0]]
         distances = results.get("distances", [[]])[0]
 
-        logger.info(f"Found {len(documents)} initial matches")
-        
+        logger.debug(f"Found {len(documents)} candidate matches")
+
+        space = get_space(collection)
+        semantic = [calibrate_score(distance_to_cosine(d, space)) for d in distances]
+
+        lexical_index = get_lexical_index(index.lexical_path)
+        lexical = [0.0] * len(ids)
+        lexical_weight = 0.0
+        if lexical_index is not None and ids:
+            with stage_timer("lexical_rerank"):
+                bm25 = lexical_index.score(text, ids)
+            best = max(bm25.values()) or 1.0
+            lexical = [bm25[doc_id] / best for doc_id in ids]
+            lexical_weight = HYBRID_LEXICAL_WEIGHT
+
+        hybrid = [(1 - lexical_weight) * s + lexical_weight * l for s, l in zip(semantic, lexical)]
+
+        # Group chunk hits by template (whole-document entries group by themselves)
+        chunks_by_template = {}
+        log_candidates = logger.isEnabledFor(logging.DEBUG)
+        for i in range(len(ids)):
+            if log_candidates:
+                logger.debug(
+                    f"Candidate {metadatas[i].get('title', ids[i])} [{metadatas[i].get('section', 'document')}] - "
+                    f"Semantic: {semantic[i]:.3f}, Lexical: {lexical[i]:.3f}, Hybrid: {hybrid[i]:.3f}"
+                )
+            chunks_by_template.setdefault(metadatas[i].get("file_id", ids[i]), []).append(i)
+
+        templates = []
+        for rows in chunks_by_template.values():
+            best = max(rows, key=lambda i: hybrid[i])
+            templates.append((
+                aggregate_scores([hybrid[i] for i in rows]),
+                aggregate_scores([semantic[i] for i in rows]),
+                aggregate_scores([lexical[i] for i in rows]),
+                best
+            ))
+        templates.sort(key=lambda t: t[0], reverse=True)
+
         matches = []
-        for i, (doc, metadata, distance) in enumerate(zip(documents, metadatas, distances)):
-            # Convert distance to similarity score (ChromaDB uses L2 distance)
-            # Lower distance = higher similarity
-            similarity_score = 1.0 - min(distance, 1.0)
-            
-            logger.info(f"Template {i+1} - Distance: {distance:.3f}, Similarity: {similarity_score:.3f}")
-            
-            if similarity_score < score_threshold:
-                logger.info(f"Skipping template {i+1} due to low similarity score: {similarity_score:.3f}")
+        for score, semantic_score, lexical_score, best in templates:
+            if score < score_threshold:
                 continue
-
-            file_id = metadata.get("file_id")
-            title = metadata.get("title", f"Template {i+1}")
-            filename = metadata.get("filename", "unknown.pdf")
-            
-            logger.info(f"Processing match: {title} (ID: {file_id}, Score: {similarity_score:.3f})")
-            
-            match = {
-                "template_number": i + 1,
-                "template_title": title,
-                "template_filename": filename,
-                "template_preview_text": doc[:500] + "...",  # Truncate with ellipsis
-                "template_file_id": file_id,
-                "similarity_score": round(similarity_score, 3),
-                "download_url": f"/download_template_by_id/{file_id}" if file_id else None,
-                "metadata": {
-                    "category": metadata.get("category", "General"),
-                    "upload_date": metadata.get("upload_date", None),
-                    "file_type": metadata.get("file_type", "application/pdf")
-                }
-            }
-            
-            logger.info(f"Added template match: {title} (Score: {similarity_score:.3f})")
-            matches.append(match)
+            matches.append(_template_match(len(matches) + 1, documents[best], metadatas[best],
+                                           score, semantic_score, lexical_score))
+            if len(matches) == top_k:
+                break
 
         if not matches:
             logger.warning("No templates found above similarity threshold")
             # Return the closest match even if below threshold
-            if documents and metadatas and distances:
-                closest_idx = distances.index(min(distances))
-                closest_doc = documents[closest_idx]
-                closest_metadata = metadatas[closest_idx]
-                closest_score = 1.0 - min(distances[closest_idx], 1.0)
-                
-                logger.info(f"Returning closest match with score: {closest_score:.3f}")
-                return [{
-                    "template_number": 1,
-                    "template_title": closest_metadata.get("title", "Closest Match"),
-                    "template_preview_text": closest_doc[:500] + "...",
-                    "template_file_id": closest_metadata.get("file_id"),
-                    "similarity_score": round(closest_score, 3),
-                    "download_url": f"/download_template_by_id/{closest_metadata.get('file_id')}" if closest_metadata.get("file_id") else None,
-                    "metadata": {
-                        "category": closest_metadata.get("category", "General"),
-                        "upload_date": closest_metadata.get("upload_date", None),
-                        "file_type": closest_metadata.get("file_type", "application/pdf")
-                    }
-                }]
+            if templates:
+                score, semantic_score, lexical_score, best = templates[0]
+                logger.info(f"Returning closest match with score: {score:.3f}")
+                return [_template_match(1, documents[best], metadatas[best],
+                                        score, semantic_score, lexical_score)]
             else:
                 return [{
                     "template_number": 1,
@@ -137,6 +211,9 @@ def search_similar_template(text: str, top_k=3, score_threshold=0.5):
 
         return matches
 
+    except LLMOverloadedError:
+        # Not a search failure: the caller answers 503 instead of suggesting from a placeholder
+        raise
     except Exception as e:
         logger.error(f"Error during template search: {e}")
         return [{
@@ -147,4 +224,4 @@ def search_similar_template(text: str, top_k=3, score_threshold=0.5):
             "similarity_score": 0.0,
             "download_url": None,
             "metadata": {"category": "Error"}
-        }]
\ No newline at end of file
+        }]
@@ -0,0 +1,174 @@
+"""
+Process-wide shared clients, created on first use.
+
+Importing a module no longer opens connections: the Mongo client, the OpenAI
+clients, the embedder and the template vector store are built the first time
+something asks for them and then reused by every module in the process. Each
+uvicorn or job worker therefore holds exactly one of each, with explicit pool
+sizes. The FastAPI lifespan warms the ones the API needs and closes them on
+shutdown.
+"""
+import os
+import logging
+import threading
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# HTTP connection pool behind the OpenAI clients (one pool per client)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", 60))
+# Retries are left to llm_scheduler, which counts each attempt against the rate budget
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 0))
+
+_instances = {}
+_lock = threading.RLock()
+
+def _shared(name: str, factory):
+    """Return the instance registered under name, building it once on first use"""
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+            logger.info(f"Initialized shared resource: {name}")
+        return _instances[name]
+
+def _mongo():
+    from mongo_utils import get_mongodb_connection
+    return get_mongodb_connection()
+
+def get_mongo_client():
+    return _shared("mongo", _mongo)[0]
+
+def get_db():
+    return _shared("mongo", _mongo)[1]
+
+def get_fs():
+    """GridFS bucket for user uploads"""
+    return _shared("mongo", _mongo)[2]
+
+def get_template_fs():
+    """GridFS bucket for resume templates"""
+    def build():
+        from mongo_utils import get_template_fs as template_bucket
+        db = get_db()
+        return template_bucket(db) if db is not None else None
+    return _shared("template_fs", build)
+
+def _openai_http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+    )
+
+def get_openai_client():
+    """Blocking OpenAI client (scripts, embeddings from worker threads)"""
+    def build():
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+        return OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT_SECONDS,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultHttpxClient(limits=_openai_http_limits(), timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS))
+        )
+    return _shared("openai", build)
+
+def get_async_openai_client():
+    """Async OpenAI client used by the API and job workers"""
+    def build():
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT_SECONDS,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(limits=_openai_http_limits(), timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS))
+        )
+    return _shared("async_openai", build)
+
+def get_llm_budget():
+    """Requests/min and tokens/min buckets shared by every worker (see llm_scheduler)"""
+    def build():
+        from llm_scheduler import build_budget
+        return build_budget()
+    return _shared("llm_budget", build)
+
+def get_content_cache():
+    def build():
+        from cache_utils import ContentCache
+        return ContentCache(get_db())
+    return _shared("content_cache", build)
+
+def get_jd_cache():
+    """Near-duplicate JD cache for template matches, cleared when the template index changes"""
+    def build():
+        from jd_cache import JDResultCache
+        from rag_utils import template_index_version
+        return JDResultCache(version_source=template_index_version)
+    return _shared("jd_cache", build)
+
+def get_embedder():
+    """Disk-cached, batching embedder in front of the configured embedding backend"""
+    def build():
+        from embedding_utils import CachedEmbedder, get_embedder as backend_embedder, OpenAIEmbedder
+        backend = backend_embedder()
+        if isinstance(backend, OpenAIEmbedder):
+            # Share the pooled client rather than opening another one
+            backend = OpenAIEmbedder(model=backend.model, client=get_openai_client())
+        return CachedEmbedder(embedder=backend)
+    return _shared("embedder", build)
+
+def get_template_index():
+    """Served template snapshot: collection plus lexical index (see template_snapshots)"""
+    def build():
+        from template_snapshots import open_snapshot
+        return open_snapshot()
+    return _shared("template_index", build)
+
+def get_template_collection():
+    """Template vector store (ChromaDB or the NumPy index, see VECTOR_BACKEND)"""
+    return get_template_index().collection
+
+def get_candidate_collection():
+    """Vector store of uploaded resumes for reverse search (see candidate_index)"""
+    def build():
+        from vector_store import get_vector_store
+        from candidate_index import CANDIDATE_COLLECTION, CANDIDATE_VECTOR_BACKEND, candidate_hnsw_config
+        return get_vector_store(CANDIDATE_COLLECTION, CANDIDATE_VECTOR_BACKEND, candidate_hnsw_config())
+    return _shared("candidate_collection", build)
+
+def replace(name: str, instance):
+    """Swap a shared instance (e.g. when a new template snapshot is published)"""
+    with _lock:
+        _instances[name] = instance
+
+def initialized() -> list[str]:
+    """Names of the resources built so far in this process"""
+    return sorted(_instances)
+
+def warm_up(*getters):
+    """Build resources eagerly, e.g. at startup so the first request doesn't pay for it"""
+    for getter in getters:
+        getter()
+
+async def aclose():
+    """Close pooled clients; they are rebuilt lazily if used again"""
+    with _lock:
+        instances = dict(_instances)
+        _instances.clear()
+
+    if "async_openai" in instances:
+        await instances["async_openai"].close()
+    if "openai" in instances:
+        instances["openai"].close()
+    mongo = instances.get("mongo")
+    if mongo and mongo[0] is not None:
+        mongo[0].close()
+    logger.info(f"Closed shared resources: {', '.join(sorted(instances)) or 'none'}")
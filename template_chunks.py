@@ -0,0 +1,81 @@
+"""
+Split template text into sections (summary, skills, experience, education, ...)
+so each one is embedded on its own and stored with its parent template id.
+"""
+import os
+import re
+
+# Bump when chunking changes so the indexer re-embeds existing templates
+CHUNKER_VERSION = 1
+CHUNK_MAX_WORDS = int(os.getenv("CHUNK_MAX_WORDS", 250))
+CHUNK_MIN_WORDS = int(os.getenv("CHUNK_MIN_WORDS", 5))
+
+SECTION_HEADINGS = {
+    "summary": ("summary", "professional summary", "profile", "objective", "career objective", "about me", "about"),
+    "skills": ("skills", "technical skills", "core competencies", "competencies", "technologies", "tools",
+               "key skills", "expertise"),
+    "experience": ("experience", "work experience", "professional experience", "employment",
+                   "employment history", "work history", "career history"),
+    "education": ("education", "academic background", "qualifications", "academics"),
+    "projects": ("projects", "personal projects", "key projects"),
+    "certifications": ("certifications", "certificates", "licenses", "awards", "achievements"),
+}
+_HEADING_TO_SECTION = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+_HEADING_CLEANUP = re.compile(r"[^a-z ]+")
+
+def _heading_section(line: str):
+    """Section name if the line is a heading such as 'WORK EXPERIENCE' or 'Skills:'"""
+    words = line.strip().split()
+    if not words or len(words) > 4:
+        return None
+    return _HEADING_TO_SECTION.get(" ".join(_HEADING_CLEANUP.sub(" ", line.lower()).split()))
+
+def _windows(words: list[str], size: int) -> list[str]:
+    return [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+def split_sections(text: str, max_words: int = CHUNK_MAX_WORDS, min_words: int = CHUNK_MIN_WORDS) -> list[tuple[str, str]]:
+    """
+    Return (section, text) chunks in document order.
+
+    Text before the first heading is "header" (name, contact details). Long
+    sections are cut into windows of max_words; text without any recognized
+    heading falls back to plain windows labelled "body".
+    """
+    sections, current, lines = [], "header", []
+    for line in text.splitlines():
+        section = _heading_section(line)
+        if section:
+            sections.append((current, lines))
+            current, lines = section, []
+        elif line.strip():
+            lines.append(line.strip())
+    sections.append((current, lines))
+
+    if all(name == "header" for name, _ in sections):
+        sections = [("body", [line.strip() for line in text.splitlines() if line.strip()])]
+
+    chunks = []
+    for name, section_lines in sections:
+        words = " ".join(section_lines).split()
+        if len(words) < min_words:
+            continue
+        chunks.extend((name, window) for window in _windows(words, max_words))
+    if not chunks and text.split():
+        # Only tiny sections: keep the template as a single chunk
+        chunks = [("body", window) for window in _windows(text.split(), max_words)]
+    return chunks
+
+def chunk_template(file_id: str, text: str, metadata: dict):
+    """Chunk ids, documents and metadatas for one template (metadata is copied onto every chunk)"""
+    ids, documents, metadatas = [], [], []
+    for index, (section, chunk) in enumerate(split_sections(text)):
+        ids.append(f"{file_id}#{index}")
+        documents.append(chunk)
+        metadatas.append({
+            **metadata,
+            "file_id": file_id,
+            "section": section,
+            "chunk_index": index,
+            "chunker_version": CHUNKER_VERSION,
+        })
+    return ids, documents, metadatas
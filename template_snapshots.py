@@ -0,0 +1,260 @@
+"""
+Versioned, immutable snapshots of the template index.
+
+index_templates.py never writes into the index the API is serving. Each
+run builds a new snapshot next to the published ones:
+
+    template_snapshots/
+        CURRENT                     name of the published snapshot
+        20261017T101500.123456-3f9a2c/
+            vectors/                template collection (Chroma or NumPy, see VECTOR_BACKEND)
+            lexical_index.npz       BM25 index over the same chunks
+            manifest.json           written when the build is complete
+
+A build starts from a copy of the published snapshot, so indexing stays
+incremental, and is published by atomically replacing CURRENT. API and job
+workers poll CURRENT (watch_snapshots), open and warm a new snapshot off
+the event loop and then swap it in with resources.replace(); requests that
+are already running finish on the handle they hold. A replaced snapshot is
+closed and, later, deleted only after TEMPLATE_SNAPSHOT_GRACE_SECONDS.
+
+Until the first snapshot is published the legacy in-place collection
+(CHROMA_PATH or NUMPY_INDEX_PATH, plus LEXICAL_INDEX_PATH) is served, so
+existing deployments keep working; their first build indexes everything
+(the embeddings come from the embedding cache).
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import shutil
+import time
+import logging
+
+import resources
+from lexical_index import LEXICAL_INDEX_PATH, get_lexical_index, forget_lexical_index
+from vector_store import VECTOR_BACKEND, get_vector_store, close_chroma_client
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SNAPSHOT_ROOT = os.getenv("TEMPLATE_SNAPSHOT_ROOT", "./template_snapshots")
+# Published snapshots kept besides the current one, for rollback
+TEMPLATE_SNAPSHOTS_KEEP = int(os.getenv("TEMPLATE_SNAPSHOTS_KEEP", 2))
+# How long a replaced snapshot stays open and on disk, so running requests can finish with it
+TEMPLATE_SNAPSHOT_GRACE_SECONDS = float(os.getenv("TEMPLATE_SNAPSHOT_GRACE_SECONDS", 300))
+TEMPLATE_SNAPSHOT_POLL_SECONDS = float(os.getenv("TEMPLATE_SNAPSHOT_POLL_SECONDS", 5))
+# Unpublished builds older than this were abandoned (resumable builds are younger)
+ABANDONED_BUILD_SECONDS = 24 * 3600
+TEMPLATE_COLLECTION = "resume_templates"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+class TemplateIndex:
+    """A template collection and the lexical index built from it, served together"""
+
+    def __init__(self, collection, lexical_path: str, version: str = None, directory: str = None):
+        self.collection = collection
+        self.lexical_path = lexical_path
+        # None for the legacy in-place index
+        self.version = version
+        self.directory = directory
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors")
+
+    def close(self):
+        """Release the snapshot's Chroma client and cached lexical index"""
+        forget_lexical_index(self.lexical_path)
+        if self.directory and VECTOR_BACKEND == "chroma":
+            close_chroma_client(self.vectors_path)
+
+def snapshot_dir(version: str, root: str = TEMPLATE_SNAPSHOT_ROOT) -> str:
+    return os.path.join(root, version)
+
+def current_version(root: str = TEMPLATE_SNAPSHOT_ROOT):
+    """Name of the published snapshot, None before the first one"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def read_manifest(version: str, root: str = TEMPLATE_SNAPSHOT_ROOT):
+    """The snapshot's manifest, None while it is still being built"""
+    try:
+        with open(os.path.join(snapshot_dir(version, root), MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _open(version: str, root: str) -> TemplateIndex:
+    directory = snapshot_dir(version, root)
+    index = TemplateIndex(None, os.path.join(directory, "lexical_index.npz"), version, directory)
+    index.collection = get_vector_store(TEMPLATE_COLLECTION, path=index.vectors_path)
+    return index
+
+def open_snapshot(version: str = None, root: str = TEMPLATE_SNAPSHOT_ROOT) -> TemplateIndex:
+    """Open a published snapshot (the current one by default), or the legacy index if none exists"""
+    version = version or current_version(root)
+    if version is None:
+        return TemplateIndex(get_vector_store(TEMPLATE_COLLECTION), LEXICAL_INDEX_PATH)
+    if read_manifest(version, root) is None:
+        raise FileNotFoundError(f"Template snapshot {version} is missing or was never completed")
+    return _open(version, root)
+
+def create_snapshot(base: str = None, root: str = TEMPLATE_SNAPSHOT_ROOT) -> TemplateIndex:
+    """Start a new snapshot, as a copy of the published snapshot `base` or empty"""
+    now = time.time()
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now % 1 * 1e6):06d}-{secrets.token_hex(3)}"
+    directory = snapshot_dir(version, root)
+    if base:
+        # Published snapshots are never written to, so copying one is safe while it is served
+        shutil.copytree(snapshot_dir(base, root), directory, ignore=shutil.ignore_patterns(MANIFEST_FILE))
+    else:
+        os.makedirs(directory)
+    logger.info(f"Building template snapshot {version}" + (f" from {base}" if base else ""))
+    return _open(version, root)
+
+def resume_snapshot(version: str, root: str = TEMPLATE_SNAPSHOT_ROOT):
+    """Reopen an interrupted, unpublished build; None if it is gone or already published"""
+    if not os.path.isdir(snapshot_dir(version, root)) or read_manifest(version, root) is not None:
+        return None
+    logger.info(f"Resuming template snapshot {version}")
+    return _open(version, root)
+
+def _write_atomic(path: str, data: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def publish(index: TemplateIndex, details: dict = None, root: str = TEMPLATE_SNAPSHOT_ROOT):
+    """Seal a finished build and make it the served snapshot in one atomic rename"""
+    count = index.collection.count()
+    # Flush Chroma's files before other processes open the snapshot
+    index.close()
+    _write_atomic(os.path.join(index.directory, MANIFEST_FILE), json.dumps({
+        "version": index.version,
+        "backend": VECTOR_BACKEND,
+        "vectors": count,
+        "published_at": time.time(),
+        **(details or {}),
+    }))
+    _write_atomic(os.path.join(root, CURRENT_FILE), index.version + "\n")
+    logger.info(f"Published template snapshot {index.version} ({count} vectors)")
+
+def discard(index: TemplateIndex):
+    """Throw away an unpublished build"""
+    index.close()
+    shutil.rmtree(index.directory, ignore_errors=True)
+    logger.info(f"Discarded template snapshot {index.version}")
+
+def list_snapshots(root: str = TEMPLATE_SNAPSHOT_ROOT) -> list[str]:
+    """Snapshot names, oldest build first"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+def collect_garbage(keep: int = TEMPLATE_SNAPSHOTS_KEEP, grace_seconds: float = TEMPLATE_SNAPSHOT_GRACE_SECONDS,
+                    root: str = TEMPLATE_SNAPSHOT_ROOT) -> list[str]:
+    """
+    Delete old snapshots and abandoned builds; returns the deleted names.
+
+    The current snapshot and the `keep` newest published before it survive,
+    and so does any snapshot replaced less than grace_seconds ago, since a
+    worker may not have swapped it out yet.
+    """
+    current = current_version(root)
+    now = time.time()
+    published, deleted = [], []
+    for version in list_snapshots(root):
+        manifest = read_manifest(version, root)
+        if manifest is not None:
+            published.append((version, manifest.get("published_at", 0)))
+        elif version != current and now - os.path.getmtime(snapshot_dir(version, root)) > ABANDONED_BUILD_SECONDS:
+            deleted.append(version)
+
+    published.sort(key=lambda item: item[1])
+    names = [version for version, _ in published]
+    # Snapshots published after the current one (it was rolled back to) are left alone
+    older = names[:names.index(current)] if current in names else []
+    protected = set(older[-keep:]) if keep > 0 else set()
+    for position, version in enumerate(older):
+        # Replaced when the next snapshot was published
+        if version not in protected and now - published[position + 1][1] > grace_seconds:
+            deleted.append(version)
+
+    for version in deleted:
+        shutil.rmtree(snapshot_dir(version, root), ignore_errors=True)
+        logger.info(f"Deleted template snapshot {version}")
+    return deleted
+
+def warm(index: TemplateIndex):
+    """Load the vectors and lexical index into memory so the first request after a swap doesn't pay for it"""
+    vector = resources.get_embedder().embed_one("software engineer resume")
+    index.collection.query(query_embeddings=[vector], n_results=10, include=["metadatas", "distances"])
+    get_lexical_index(index.lexical_path)
+
+def refresh(root: str = TEMPLATE_SNAPSHOT_ROOT):
+    """
+    Swap in the published snapshot if it is newer than the one served here.
+
+    Returns the replaced TemplateIndex (to close once running requests are
+    done with it), or None when nothing changed.
+    """
+    version = current_version(root)
+    served = resources.get_template_index()
+    if version is None or version == served.version:
+        return None
+    start = time.perf_counter()
+    index = open_snapshot(version, root)
+    warm(index)
+    resources.replace("template_index", index)
+    logger.info(
+        f"Now serving template snapshot {version} (was {served.version or 'the legacy index'}; "
+        f"opened and warmed in {time.perf_counter() - start:.2f}s)"
+    )
+    return served
+
+async def watch_snapshots(poll_seconds: float = TEMPLATE_SNAPSHOT_POLL_SECONDS,
+                          grace_seconds: float = TEMPLATE_SNAPSHOT_GRACE_SECONDS):
+    """Background task for API and job workers: pick up newly published snapshots"""
+    from executor_utils import run_io
+    retired = []
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            replaced = await run_io(refresh)
+        except Exception as e:
+            logger.error(f"Could not switch to the published template snapshot, still serving the old one: {e}")
+            replaced = None
+        if replaced is not None:
+            retired.append((time.monotonic(), replaced))
+        while retired and time.monotonic() - retired[0][0] > grace_seconds:
+            _, index = retired.pop(0)
+            await run_io(index.close)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List, roll back and clean up template index snapshots")
+    parser.add_argument("--publish", metavar="VERSION", help="Serve an existing snapshot again (rollback)")
+    parser.add_argument("--gc", action="store_true", help="Delete old snapshots and abandoned builds")
+    args = parser.parse_args()
+    if args.publish:
+        if read_manifest(args.publish) is None:
+            parser.error(f"{args.publish} is not a completed snapshot")
+        _write_atomic(os.path.join(TEMPLATE_SNAPSHOT_ROOT, CURRENT_FILE), args.publish + "\n")
+        logger.info(f"Published template snapshot {args.publish}")
+    if args.gc:
+        collect_garbage()
+    current = current_version()
+    for version in list_snapshots():
+        manifest = read_manifest(version)
+        state = "current" if version == current else "published" if manifest else "incomplete"
+        vectors = manifest.get("vectors", "?") if manifest else "?"
+        print(f"{version}  {state:<10}  {vectors} vectors")
@@ -0,0 +1,93 @@
+"""
+Model routing and structured output against fake_llm_server.py, in-process:
+
+    python -m pytest -q test_llm_router.py
+"""
+import asyncio
+import os
+
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "0")
+os.environ.setdefault("FAKE_LLM_TOKEN_LATENCY_MS", "0")
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+import fake_llm_server
+import llm_router
+from fake_llm_server import FAKE_REFUSE_MARKER, FAKE_TRUNCATE_MARKER
+from llm_router import (
+    ResumeAnalysis, TemplateSuggestion, StructuredOutputError, route_analysis_model, route_suggestion_model,
+    structured_completion, structured_completion_sync, stream_structured_completion, suggestion_payload
+)
+
+BASE_URL = "http://fake-llm/v1"
+PROMPT = "Analyze this resume: Python developer, 5 years of Django."
+# One model with strict structured output, one that gets the schema in the prompt
+MODELS = ["gpt-4o-mini", "gpt-4"]
+
+def async_client():
+    transport = httpx.ASGITransport(app=fake_llm_server.app)
+    return openai.AsyncOpenAI(api_key="test", base_url=BASE_URL, max_retries=0,
+                              http_client=httpx.AsyncClient(transport=transport))
+
+def complete(model: str, prompt: str, schema=ResumeAnalysis):
+    return asyncio.run(structured_completion(async_client(), model, prompt, schema, "analysis"))
+
+def stream(model: str, prompt: str, schema=ResumeAnalysis):
+    async def run():
+        result, deltas = {}, []
+        async for delta in stream_structured_completion(async_client(), model, prompt, schema, "analysis", result):
+            deltas.append(delta)
+        return deltas, result["parsed"]
+    return asyncio.run(run())
+
+def test_route_analysis_by_length(monkeypatch):
+    monkeypatch.setattr(llm_router, "ROUTE_SIMPLE_MAX_TOKENS", 50)
+    assert route_analysis_model("python " * 10) == llm_router.LLM_FAST_MODEL
+    assert route_analysis_model("python " * 500) == llm_router.LLM_LARGE_MODEL
+
+def test_route_overrides(monkeypatch):
+    monkeypatch.setenv("LLM_ROUTE_ANALYSIS", "large")
+    monkeypatch.setenv("LLM_ROUTE_BATCH_ANALYSIS", "gpt-4")
+    assert route_analysis_model("short") == llm_router.LLM_LARGE_MODEL
+    assert route_analysis_model("short", "batch") == "gpt-4"
+
+def test_route_suggestion_by_margin():
+    clear = [{"similarity_score": 0.9}, {"similarity_score": 0.5}]
+    close = [{"similarity_score": 0.9}, {"similarity_score": 0.85}]
+    assert route_suggestion_model(clear) == llm_router.LLM_FAST_MODEL
+    assert route_suggestion_model(close) == llm_router.LLM_LARGE_MODEL
+
+@pytest.mark.parametrize("model", MODELS)
+def test_structured_completion(model):
+    analysis = complete(model, PROMPT)
+    assert isinstance(analysis, ResumeAnalysis)
+    assert analysis.skills.score == 1
+
+def test_structured_completion_sync():
+    with TestClient(fake_llm_server.app, base_url="http://fake-llm") as http:
+        client = openai.OpenAI(api_key="test", base_url=BASE_URL, max_retries=0, http_client=http)
+        suggestion = structured_completion_sync(client, "gpt-4o-mini", PROMPT, TemplateSuggestion, "agent_suggestion")
+    assert suggestion.template_number == 1
+
+@pytest.mark.parametrize("model", MODELS)
+def test_stream_structured_completion(model):
+    deltas, analysis = stream(model, PROMPT)
+    assert len(deltas) > 1
+    assert ResumeAnalysis.model_validate_json("".join(deltas)) == analysis
+
+@pytest.mark.parametrize("model", MODELS)
+@pytest.mark.parametrize("marker", [FAKE_REFUSE_MARKER, FAKE_TRUNCATE_MARKER])
+def test_unusable_output_raises(model, marker):
+    with pytest.raises(StructuredOutputError):
+        complete(model, f"{PROMPT} {marker}")
+    with pytest.raises(StructuredOutputError):
+        stream(model, f"{PROMPT} {marker}")
+
+def test_suggestion_payload_clamps_the_pick():
+    matches = [{"template_file_id": "a", "template_title": "A"}, {"template_file_id": "b", "template_title": "B"}]
+    payload = suggestion_payload(TemplateSuggestion(template_number=7, justification="x"), matches)
+    assert payload["template_number"] == 2
+    assert payload["template_file_id"] == "b"
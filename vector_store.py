@@ -0,0 +1,304 @@
+import fcntl
+import json
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Protocol
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "./vector_index")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" or "numpy"
+
+class VectorStore(Protocol):
+    """
+    The subset of the Chroma collection API the app relies on.
+
+    A Chroma collection satisfies it as-is; NumpyVectorStore implements it
+    in-process. Embeddings are always passed explicitly.
+    """
+
+    def upsert(self, ids: list[str], embeddings: list, documents: list[str], metadatas: list[dict]): ...
+
+    def query(self, query_embeddings: list, n_results: int = 10, include: list[str] = None,
+              where: dict = None) -> dict: ...
+
+    def get(self, ids: list[str] = None, include: list[str] = None, where: dict = None) -> dict: ...
+
+    def delete(self, ids: list[str]): ...
+
+    def count(self) -> int: ...
+
+_chroma_clients = {}
+_chroma_lock = threading.Lock()
+
+def get_chroma_client(path: str = CHROMA_PATH):
+    """One PersistentClient per path for the whole process"""
+    with _chroma_lock:
+        if path not in _chroma_clients:
+            import chromadb
+            _chroma_clients[path] = chromadb.PersistentClient(path=path)
+        return _chroma_clients[path]
+
+def close_chroma_client(path: str):
+    """Release the client of a path that is no longer served (e.g. a retired template snapshot)"""
+    with _chroma_lock:
+        client = _chroma_clients.pop(path, None)
+    if client is not None:
+        client.close()
+
+_COMPARISONS = {
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+}
+
+def _matches(metadata: dict, where: dict) -> bool:
+    """
+    Chroma-style metadata filter: {"key": value}, {"key": {"$in": [values]}},
+    {"key": {"$gte": bound}} (also $gt, $lt, $lte) and {"$and": [filters]}
+    """
+    for key, condition in (where or {}).items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if metadata.get(key) not in condition["$in"]:
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, bound in condition.items():
+                if value is None or not _COMPARISONS[operator](value, bound):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class NumpyVectorStore:
+    """
+    Exact cosine search over a small collection held in one contiguous matrix.
+
+    Vectors are L2-normalized once at write time and saved as a float32 .npy
+    file that is memory-mapped on load, so a query is a single matrix-vector
+    product followed by argpartition. Distances are cosine distances
+    (1 - cosine similarity). Ids, documents and metadata live in a JSON file
+    next to the matrix. Writes rewrite both files atomically under an
+    exclusive file lock, starting from what is on disk, so several API and
+    job worker processes can share a store; readers reload when another
+    process saved.
+    """
+
+    def __init__(self, path: str = NUMPY_INDEX_PATH, name: str = "resume_templates"):
+        self.directory = os.path.join(path, name)
+        self.matrix_path = os.path.join(self.directory, "vectors.npy")
+        self.records_path = os.path.join(self.directory, "records.json")
+        self.lock_path = os.path.join(self.directory, "write.lock")
+        self._write_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._refresh(force=True)
+
+    def _files_version(self):
+        """Changes whenever a save replaces the records file"""
+        try:
+            stat = os.stat(self.records_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        """Read both files; callers hold the file lock so they belong to the same save"""
+        version = self._files_version()
+        if os.path.exists(self.matrix_path) and version is not None:
+            with open(self.records_path, "r") as f:
+                records = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        else:
+            records = {"ids": [], "documents": [], "metadatas": []}
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        # Swap the whole snapshot in one assignment so readers never see a mix
+        self._state = (matrix, records, {doc_id: row for row, doc_id in enumerate(records["ids"])})
+        self._version = version
+
+    def _refresh(self, force: bool = False):
+        """Reload if another process saved since this one last read the files"""
+        version = self._files_version()
+        # Files removed underneath (a retired snapshot): keep serving what is loaded
+        if not force and version in (None, self._version):
+            return
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            self._load()
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive across threads and processes, starting from the latest saved state"""
+        with self._write_lock, open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._files_version() != self._version:
+                self._load()
+            yield
+
+    def _save(self, matrix: np.ndarray, records: dict):
+        tmp_matrix = os.path.join(self.directory, "vectors.tmp.npy")
+        tmp_records = self.records_path + ".tmp"
+        np.save(tmp_matrix, matrix.astype(np.float32, copy=False))
+        with open(tmp_records, "w") as f:
+            json.dump(records, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_records, self.records_path)
+        self._load()
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self._state[1]["ids"])
+
+    def upsert(self, ids: list[str], embeddings: list, documents: list[str] = None, metadatas: list[dict] = None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._writing():
+            # Work on copies: readers keep using the current snapshot until _save swaps in the new one
+            matrix, records, rows = self._state
+            matrix = np.array(matrix) if matrix.size else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            records = {key: list(values) for key, values in records.items()}
+            rows = dict(rows)
+            new_rows = []
+            for doc_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+                row = rows.get(doc_id)
+                if row is None:
+                    new_rows.append(vector)
+                    rows[doc_id] = len(records["ids"])
+                    records["ids"].append(doc_id)
+                    records["documents"].append(document)
+                    records["metadatas"].append(metadata)
+                else:
+                    matrix[row] = vector
+                    records["documents"][row] = document
+                    records["metadatas"][row] = metadata
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self._save(matrix, records)
+
+    add = upsert
+
+    def delete(self, ids: list[str]):
+        with self._writing():
+            matrix, records, rows = self._state
+            drop = {rows[doc_id] for doc_id in ids if doc_id in rows}
+            if not drop:
+                return
+            keep = [row for row in range(len(records["ids"])) if row not in drop]
+            self._save(
+                np.array(matrix[keep]) if keep else np.zeros((0, matrix.shape[1]), dtype=np.float32),
+                {key: [values[row] for row in keep] for key, values in records.items()}
+            )
+
+    def get(self, ids: list[str] = None, include: list[str] = None, where: dict = None) -> dict:
+        self._refresh()
+        _, records, rows = self._state
+        selected = [rows[doc_id] for doc_id in ids if doc_id in rows] if ids else range(len(records["ids"]))
+        selected = [row for row in selected if _matches(records["metadatas"][row], where)]
+        return {
+            "ids": [records["ids"][row] for row in selected],
+            "documents": [records["documents"][row] for row in selected],
+            "metadatas": [records["metadatas"][row] for row in selected],
+        }
+
+    def query(self, query_embeddings: list, n_results: int = 10, include: list[str] = None,
+              where: dict = None) -> dict:
+        self._refresh()
+        matrix, records, _ = self._state
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            if not len(records["ids"]):
+                for key in results:
+                    results[key].append([])
+                continue
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = matrix @ query
+            if where:
+                mask = np.array([_matches(metadata, where) for metadata in records["metadatas"]])
+                scores = np.where(mask, scores, -np.inf)
+            k = min(n_results, int(np.isfinite(scores).sum()))
+            top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            top = top[np.argsort(-scores[top])]
+            results["ids"].append([records["ids"][row] for row in top])
+            results["documents"].append([records["documents"][row] for row in top])
+            results["metadatas"].append([records["metadatas"][row] for row in top])
+            results["distances"].append([float(1.0 - scores[row]) for row in top])
+        return results
+
+def get_vector_store(name: str = "resume_templates", backend: str = None, hnsw: dict = None,
+                     path: str = None) -> VectorStore:
+    """
+    Open the configured vector store backend for a collection (cosine space).
+
+    path overrides the backend's directory (CHROMA_PATH or NUMPY_INDEX_PATH),
+    e.g. for a template snapshot.
+
+    hnsw holds Chroma HNSW settings (max_neighbors, ef_construction,
+    ef_search). The graph settings only apply when the collection is
+    created; ef_search is updated on existing collections too, and takes
+    effect when the process first loads the index. The NumPy store searches
+    exactly and ignores them.
+    """
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        store = NumpyVectorStore(path=path or NUMPY_INDEX_PATH, name=name)
+        logger.info(f"Using in-process NumPy vector store '{name}' ({store.count()} vectors)")
+        return store
+    if backend == "chroma":
+        hnsw = hnsw or {}
+        collection = get_chroma_client(path or CHROMA_PATH).get_or_create_collection(
+            name=name,
+            embedding_function=None,
+            configuration={"hnsw": {"space": "cosine", **hnsw}}
+        )
+        if get_space(collection) != "cosine":
+            logger.warning(
+                f"Collection '{name}' was created with the '{get_space(collection)}' distance; "
+                "run `python index_templates.py --rebuild` to recreate it with cosine distance"
+            )
+        current = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+        if "ef_search" in hnsw and current.get("ef_search") != hnsw["ef_search"]:
+            collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+        for setting in ("max_neighbors", "ef_construction"):
+            if setting in hnsw and current.get(setting) not in (None, hnsw[setting]):
+                logger.warning(
+                    f"Collection '{name}' was built with {setting}={current[setting]}; "
+                    f"{hnsw[setting]} only applies once it is recreated"
+                )
+        return collection
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+def get_space(store) -> str:
+    """Distance function of a store: cosine, l2 (squared L2) or ip"""
+    if isinstance(store, NumpyVectorStore):
+        return "cosine"
+    configuration = getattr(store, "configuration", None) or {}
+    return (configuration.get("hnsw") or {}).get("space", "l2")
+
+def reset_vector_store(name: str = "resume_templates", backend: str = None, hnsw: dict = None) -> VectorStore:
+    """Drop a collection and recreate it empty with the current settings"""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        store = NumpyVectorStore(name=name)
+        store.delete(store.get()["ids"])
+        return store
+    try:
+        get_chroma_client().delete_collection(name=name)
+    except Exception as e:
+        logger.warning(f"Could not delete collection '{name}': {e}")
+    return get_vector_store(name, backend, hnsw)